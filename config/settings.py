@@ -120,6 +120,12 @@ else:
         }
     }
 
+# Кэш Django. По умолчанию — память процесса; при нескольких процессах сервера нужен общий кэш
+# (CACHE_URL=rediscache://127.0.0.1:6379/1, pymemcache://127.0.0.1:11211 или dbcache://django_cache):
+# с кэшем процесса итоги /table/ не кэшируются, а справочники живут не дольше LOCAL_TTL (event/caching.py,
+# без DEBUG — предупреждение event.W001)
+CACHES = {'default': env.cache('CACHE_URL', default='locmemcache://')}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -180,3 +186,19 @@ DATA_UPLOAD_MAX_NUMBER_FIELDS = 10000
 
 # Табличный интерфейс /table/ (ZenTable-подобный UI)
 ATTENDLY_TABLE_ENABLED = env.bool('ATTENDLY_TABLE_ENABLED', default=True)
+# Итоги строк в /table/: exact — кэшированный count(), estimate — оценка PostgreSQL для запросов без фильтра
+TABLE_TOTALS_MODE = env('TABLE_TOTALS_MODE', default='exact')
+# Фоновые выгрузки в /table/ (нужен запущенный manage.py run_export_worker)
+EXPORT_JOBS_ENABLED = env.bool('EXPORT_JOBS_ENABLED', default=False)
+# Файлы фоновых выгрузок: вне MEDIA_ROOT, чтобы их не отдавал веб-сервер — только export_job_download
+EXPORT_JOBS_ROOT = env('EXPORT_JOBS_ROOT', default=os.path.join(BASE_DIR, 'private', 'exports'))
+# Справочники людей и продюсеров (event/references.py, event/producers.py) в общем кэше Django, если он настроен
+REFERENCE_CACHE_SHARED = env.bool('REFERENCE_CACHE_SHARED', default=True)
+# Роли и доступные мероприятия пользователя (event/access.py) в общем кэше Django, секунд; 0 — только в рамках запроса.
+# Действует только с общим кэшем (CACHE_URL)
+ACCESS_CACHE_TIMEOUT = env.int('ACCESS_CACHE_TIMEOUT', default=0)
+# Живой канал мероприятия (event/live.py): пусто — выключен, 'postgres' — NOTIFY/LISTEN между процессами,
+# 'local' — в памяти процесса, только с DEBUG. Поток держит рабочий поток сервера: нужен gevent/gthread или ASGI
+LIVE_EVENTS_BACKEND = env('LIVE_EVENTS_BACKEND', default='')
+# Открытых потоков на процесс сервера, сверх — 503
+LIVE_MAX_CONNECTIONS = env.int('LIVE_MAX_CONNECTIONS', default=20)
@@ -12,8 +12,11 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('event/', include('event.urls')),
     path('events-list/', views.get_user_events, name='events-list'),
+    path('events/<int:event_id>/live/', views.event_live, name='event_live'),
     path('admin-info/', views.get_admin_info, name='admin-info'),
     path('actions/', views.ActionView.as_view(), name='actions'),
+    path('actions/checkin/', views.CheckinView.as_view(), name='actions_checkin'),
+    path('actions/checkin/batch/', views.CheckinBatchView.as_view(), name='actions_checkin_batch'),
     path('available-contacts/', views.AvailableContactsView.as_view(), name='available_contacts'),
     path('api/contacts/', views.ContactCreateView.as_view(), name='contact_create'),
     path('api/companies/', views.CompaniesView.as_view(), name='companies'),
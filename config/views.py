@@ -1,12 +1,12 @@
 import json
 
 from django.contrib.auth.decorators import login_required
-from django.db import models
 from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth import login, authenticate
-from django.db.models import Q
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth import logout
 from django.utils.decorators import method_decorator
 from django.views import View
@@ -14,6 +14,11 @@ from django.core.paginator import Paginator
 
 from event.models import ModuleInstance, Action, Contact, SocialNetwork, InfoContact, CompanyContact, CategoryContact, \
     TypeGuestContact
+from event.streaming import StreamingJsonResponse, iterate_queryset
+from event.contact_search import search_contacts
+from event.access import can_access_event, is_events_admin
+from event.checkin import CheckinError, apply_checkin_batch, compact_checkin, transition_action
+from event.live import live_response
 
 
 def home(request):
@@ -40,33 +45,46 @@ def get_user_events(request):
     user = request.user
 
     # Получаем события в зависимости от роли пользователя
-    if user.is_superuser or user.groups.filter(name='Администратор').exists():
+    if is_events_admin(user):
         # Суперпользователь или Администратор видят все события
-        events = ModuleInstance.objects.filter(is_visible=True).all()
+        events = ModuleInstance.objects.filter(is_visible=True)
     else:
-        # Остальные пользователи видят только свои события
+        # Остальные пользователи видят только свои события (подзапросы вместо JOIN + DISTINCT)
         events = ModuleInstance.objects.filter(
-            Q(managers=user) | Q(checkers=user) | Q(producers=user), is_visible=True).distinct()
-
-    data = []
-    for event in events:
-        # Подсчитываем количество уникальных гостей для события
-        guests_count = Action.objects.filter(
-            event=event,
-            action_type__in=['registered', 'visited']  # Учитываем только действия регистрации и чекина
-        ).values('contact').distinct().count()  # Считаем уникальных гостей
-
-        data.append({
-            "id": event.id,
-            "name": event.name,
-            "address": event.address if event.address else None,
-            "date_start": event.date_start if event.date_start else None,
-            "date_end": event.date_end if event.date_end else None,
-            'guests_count': guests_count
-        })
+            Q(pk__in=user.manager_events.values('pk')) |
+            Q(pk__in=user.checker_events.values('pk')) |
+            Q(pk__in=user.producer_events.values('pk')),
+            is_visible=True
+        )
+
+    # Один запрос: уникальные гости (регистрация и чекин) берутся из счётчиков мероприятия
+    rows = events.values(
+        'id', 'name', 'address', 'date_start', 'date_end',
+        guests_count=Coalesce('status_counter__guests', Value(0)),
+    )
+    data = [
+        {
+            "id": row['id'],
+            "name": row['name'],
+            "address": row['address'] if row['address'] else None,
+            "date_start": row['date_start'] if row['date_start'] else None,
+            "date_end": row['date_end'] if row['date_end'] else None,
+            'guests_count': row['guests_count']
+        }
+        for row in rows
+    ]
     return JsonResponse(data, safe=False)
 
 
+@login_required
+def event_live(request, event_id):
+    """Server-Sent Events мероприятия: счётчики и смены статусов по мере фиксации (event/live.py)"""
+    event = get_object_or_404(ModuleInstance, pk=event_id)
+    if not can_access_event(request.user, event.pk):
+        return JsonResponse({"error": "Нет прав для работы с этим мероприятием"}, status=403)
+    return live_response(event.pk, request.headers.get('Last-Event-ID'))
+
+
 @login_required
 def get_admin_info(request):
     user = request.user.groups.first()
@@ -102,10 +120,7 @@ class ActionView(View):
             'contact__infocontact_set__social_network'
         ).order_by('contact__last_name', 'contact__first_name')
 
-        return JsonResponse(
-            [self._serialize_action(action) for action in actions],
-            safe=False
-        )
+        return StreamingJsonResponse(iterate_queryset(actions), self._serialize_action)
 
     def post(self, request):
         try:
@@ -115,18 +130,22 @@ class ActionView(View):
 
             # Если передан action_id, обновляем существующее действие
             if action_id:
-                action = get_object_or_404(Action, pk=action_id)
-
-                # Проверка доступа к событию
-                if not self._get_user_events(request.user).filter(id=action.event.id).exists():
-                    return JsonResponse(
-                        {"error": "Нет прав для работы с этим мероприятием"},
-                        status=403
-                    )
-
-                action.action_type = action_type
-                action.update_user = request.user
-                action.save()
+                # Доступ к мероприятию проверяется в самом UPDATE (event/checkin.py)
+                try:
+                    transition_action(request.user, action_id, action_type)
+                except CheckinError as e:
+                    return JsonResponse({"error": str(e)}, status=e.status)
+                action = Action.objects.select_related(
+                    'contact',
+                    'contact__category',
+                    'contact__company',
+                    'contact__type_guest',
+                    'contact__producer',
+                    'event',
+                    'update_user'
+                ).prefetch_related(
+                    'contact__infocontact_set__social_network'
+                ).get(pk=action_id)
 
             # Иначе создаем новое действие
             else:
@@ -140,7 +159,7 @@ class ActionView(View):
                     )
 
                 # Проверка доступа к событию
-                if not self._get_user_events(request.user).filter(id=event_id).exists():
+                if not can_access_event(request.user, event_id):
                     return JsonResponse(
                         {"error": "Нет прав для работы с этим мероприятием"},
                         status=403
@@ -169,17 +188,6 @@ class ActionView(View):
                 status=500
             )
 
-    def _get_user_events(self, user):
-        """Возвращает QuerySet доступных мероприятий"""
-        if user.is_superuser or user.groups.filter(name='Администратор').exists():
-            return ModuleInstance.objects.all()
-
-        return ModuleInstance.objects.filter(
-            models.Q(managers=user) |
-            models.Q(checkers=user) |
-            models.Q(producers=user)
-        ).distinct()
-
     def _serialize_action(self, action):
         """Полная сериализация со всеми полями, но с оптимизациями"""
         contact = action.contact
@@ -248,6 +256,49 @@ class ActionView(View):
         } if operator else None
 
 
+@method_decorator(login_required, name='dispatch')
+class CheckinView(View):
+    """Быстрый чекин со сканера: смена статуса и компактный ответ без полной сериализации"""
+
+    def post(self, request):
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({"error": "Некорректный JSON"}, status=400)
+        if not isinstance(data, dict):
+            return JsonResponse({"error": "Ожидается JSON-объект"}, status=400)
+        try:
+            action_id = int(data.get('action_id') or 0)
+        except (TypeError, ValueError):
+            action_id = 0
+        if action_id <= 0:
+            return JsonResponse({"error": "Необходимо указать action_id"}, status=400)
+        try:
+            row, update_date = transition_action(request.user, action_id, data.get('action_type') or 'visited')
+        except CheckinError as e:
+            return JsonResponse({"error": str(e)}, status=e.status)
+        return JsonResponse(compact_checkin(row, update_date))
+
+
+@method_decorator(login_required, name='dispatch')
+class CheckinBatchView(View):
+    """Очередь сканов, накопленная без сети: {"items": [{key, action_id, action_type, client_time}]}"""
+
+    def post(self, request):
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({"error": "Некорректный JSON"}, status=400)
+        items = data.get('items') if isinstance(data, dict) else None
+        if not isinstance(items, list):
+            return JsonResponse({"error": "Необходимо передать список items"}, status=400)
+        try:
+            results = apply_checkin_batch(request.user, items)
+        except CheckinError as e:
+            return JsonResponse({"error": str(e)}, status=e.status)
+        return JsonResponse({"results": results})
+
+
 def custom_logout(request):
     logout(request)
     return redirect('home')
@@ -269,12 +320,8 @@ class AvailableContactsView(View):
         ).values_list('contact_id', flat=True)
 
         qs = Contact.objects.exclude(id__in=existing_guests)
-        if search:
-            qs = qs.filter(
-                Q(last_name__icontains=search) |
-                Q(first_name__icontains=search) |
-                Q(nickname__icontains=search)
-            )
+        if search.strip():
+            qs = search_contacts(search, qs)
 
         paginator = Paginator(qs, page_size)
         page_obj = paginator.get_page(page)
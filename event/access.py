@@ -0,0 +1,141 @@
+"""
+Роли пользователя и доступные ему мероприятия — один раз за запрос.
+
+Админка, приложение чекина и API проверяют роль (группы «Администратор», «Менеджер»,
+«Модератор», «Продюсер») и членство в managers/checkers/producers мероприятий, раньше —
+отдельным запросом на каждую проверку. Теперь группы (один запрос) и id мероприятий
+(один запрос) загружаются при первом обращении и запоминаются на объекте пользователя
+(request.user живёт ровно один запрос).
+
+С ACCESS_CACHE_TIMEOUT > 0 результат дополнительно хранится в общем кэше Django;
+версию кэша сбрасывают изменения managers/producers/checkers, групп пользователя
+и удаление мероприятий. С кэшем процесса (locmem) настройка не действует: сброс версии
+не дошёл бы до других воркеров, и снятые права продолжали бы работать до истечения
+таймаута — об этом предупреждает проверка event.W005.
+"""
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db.models import CharField, Value
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .caching import shared_cache_configured
+from .models import CustomUser, ModuleInstance
+
+ROLE_ADMIN = 'Администратор'
+ROLE_MANAGER = 'Менеджер'
+ROLE_CHECKER = 'Модератор'
+ROLE_PRODUCER = 'Продюсер'
+
+_VERSION_KEY = 'event:access:version'
+_DATA_KEY = 'event:access:{}:{}:{}'
+_EVENT_ROLES = ('managers', 'checkers', 'producers')
+
+
+class EventAccess:
+    def __init__(self, event_ids):
+        """event_ids — {'managers': ids, 'checkers': ids, 'producers': ids}."""
+        self.managed = frozenset(event_ids.get('managers', ()))
+        self.checked = frozenset(event_ids.get('checkers', ()))
+        self.produced = frozenset(event_ids.get('producers', ()))
+
+    @property
+    def event_ids(self):
+        """Мероприятия, где пользователь менеджер, модератор или продюсер."""
+        return self.managed | self.checked | self.produced
+
+
+def _load_group_names(user):
+    return frozenset(user.groups.values_list('name', flat=True))
+
+
+def _load_event_access(user):
+    rows = None
+    for role in _EVENT_ROLES:
+        part = (
+            ModuleInstance.objects.filter(**{role: user}).order_by()
+            .annotate(role=Value(role, output_field=CharField()))
+            .values_list('role', 'pk')
+        )
+        rows = part if rows is None else rows.union(part, all=True)
+    event_ids = {role: set() for role in _EVENT_ROLES}
+    for role, pk in rows:
+        event_ids[role].add(pk)
+    return EventAccess(event_ids)
+
+
+def access_cache_timeout():
+    """ACCESS_CACHE_TIMEOUT, если кэш Django общий для процессов; иначе 0."""
+    timeout = getattr(settings, 'ACCESS_CACHE_TIMEOUT', 0)
+    return timeout if timeout and shared_cache_configured() else 0
+
+
+def _memoized(user, attr, name, loader):
+    """Значение запоминается на объекте user, с ACCESS_CACHE_TIMEOUT — и в общем кэше."""
+    value = getattr(user, attr, None)
+    if value is not None:
+        return value
+    timeout = access_cache_timeout()
+    if timeout:
+        key = _DATA_KEY.format(cache.get(_VERSION_KEY, 0), name, user.pk)
+        value = cache.get(key)
+    if value is None:
+        value = loader(user)
+        if timeout:
+            cache.set(key, value, timeout)
+    setattr(user, attr, value)
+    return value
+
+
+def group_names(user):
+    """Названия групп пользователя — один запрос за request."""
+    if not user.is_authenticated:
+        return frozenset()
+    return _memoized(user, '_group_names_cache', 'groups', _load_group_names)
+
+
+def user_access(user):
+    """EventAccess: id мероприятий, где пользователь менеджер/модератор/продюсер."""
+    return _memoized(user, '_event_access_cache', 'events', _load_event_access)
+
+
+def has_role(user, role):
+    return role in group_names(user)
+
+
+def is_events_admin(user):
+    """Суперпользователь или Администратор — доступ ко всем мероприятиям."""
+    return user.is_superuser or has_role(user, ROLE_ADMIN)
+
+
+def can_access_event(user, event_id):
+    """Может ли пользователь работать с мероприятием (приложение чекина, API действий)."""
+    if is_events_admin(user):
+        return True
+    return int(event_id) in user_access(user).event_ids
+
+
+def invalidate_access():
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:
+        cache.set(_VERSION_KEY, 1, None)
+
+
+def _on_m2m_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_access()
+
+
+def _on_change(sender, **kwargs):
+    invalidate_access()
+
+
+def connect_signals():
+    for role in _EVENT_ROLES:
+        through = getattr(ModuleInstance, role).through
+        m2m_changed.connect(_on_m2m_changed, sender=through, dispatch_uid=f'event_access_{role}')
+    m2m_changed.connect(_on_m2m_changed, sender=CustomUser.groups.through, dispatch_uid='event_access_groups')
+    post_delete.connect(_on_change, sender=ModuleInstance, dispatch_uid='event_access_event_delete')
+    post_save.connect(_on_change, sender=Group, dispatch_uid='event_access_group_save')
+    post_delete.connect(_on_change, sender=Group, dispatch_uid='event_access_group_delete')
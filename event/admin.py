@@ -18,6 +18,8 @@ from .models import (
     ActionLog,
     Community,
     CommunityMember,
+    ExportJob,
+    DuplicateCandidatePair,
 )
 from .forms import (
     CheckinOrCancelForm,
@@ -26,20 +28,31 @@ from .forms import (
     CustomUserChangeForm,
     ContactMergeForm,
 )
-from .contact_merge import format_contact_merge_label, merge_contacts
+from .contact_merge import (
+    PRIMARY_RULES,
+    DEFAULT_PRIMARY_RULE,
+    duplicate_clusters,
+    format_contact_merge_label,
+    merge_contacts,
+    merge_duplicate_clusters,
+)
 from .contact_duplicates import (
     build_duplicate_candidates_q,
     duplicate_candidates_queryset,
-    get_duplicate_match_reasons,
-    get_global_duplicate_reasons,
+    duplicate_match_reasons_map,
+    global_duplicate_reasons_map,
     presumed_duplicates_queryset,
 )
 from django.shortcuts import render
 from django.http import HttpResponseRedirect
 from import_export.admin import ExportActionModelAdmin, ExportActionMixin, ImportExportModelAdmin, ImportExportActionModelAdmin
 from .resources import ContactImport, EventExport
+from .counters import STATUS_FIELDS, rebuild_event_counters
+from .export_jobs import EXPORT_JOB_SOURCES, create_export_job
+from .export_stream import export_response
 from admin_auto_filters.filters import AutocompleteFilter, AutocompleteFilterFactory
-from django.db.models import Count, Q
+from django.db.models import Count, Q, Value
+from django.db.models.functions import Coalesce
 from django.utils.html import format_html, format_html_join
 from django.utils.safestring import mark_safe
 from django.urls import reverse
@@ -58,6 +71,7 @@ from django.contrib.admin.widgets import AutocompleteSelect
 
 # Импорт миксина для интерактивной таблицы гостей
 from .admin_guests_table_mixin import GuestsTableMixin
+from .access import ROLE_CHECKER, ROLE_MANAGER, has_role, user_access
 
 class CustomAdminSite(admin.AdminSite):
 
@@ -442,12 +456,39 @@ class CommunityMemberForContactInline(admin.TabularInline):
         return '—'
     community_members_count.short_description = 'Участников'
 
+# Фоновая выгрузка выбранных записей (файл строит run_export_worker)
+EXPORT_JOB_DATASET_BY_MODEL = {
+    'contact': 'contacts',
+    'action': 'actions',
+}
+
+
+@admin.action(description='Выгрузить выбранные (XLSX)')
+def export_in_background_action(modeladmin, request, queryset):
+    dataset = EXPORT_JOB_DATASET_BY_MODEL[modeladmin.model._meta.model_name]
+    if not settings.EXPORT_JOBS_ENABLED:
+        # Воркер не запущен — задание висело бы в очереди; отдаём файл сразу потоком
+        resource_class, queryset_factory = EXPORT_JOB_SOURCES[dataset]
+        ids = queryset.order_by().values('pk')
+        return export_response(resource_class(), queryset_factory().filter(pk__in=ids), dataset)
+    if request.POST.get('select_across') == '1':
+        # «Выбрать все»: id не перечисляем, воркер повторит фильтры списка
+        job = create_export_job(request.user, dataset, 'xlsx', filters=request.GET.urlencode())
+    else:
+        # Отмеченные галочками — не больше одной страницы списка
+        job = create_export_job(request.user, dataset, 'xlsx', queryset.values_list('pk', flat=True))
+    url = reverse('admin:event_exportjob_change', args=[job.pk])
+    modeladmin.message_user(
+        request,
+        format_html('Выгрузка поставлена в очередь: <a href="{}">{}</a>', url, job),
+    )
+
 # Человек
 @admin.register(Contact)
 class ContactAdmin(BaseAdminPage, ImportExportModelAdmin, ImportExportActionModelAdmin):
     change_list_template = 'admin/event/contact_change_list.html'
     import_export_change_list_template = 'admin/event/contact_change_list_import_export.html'
-    actions = ['merge_duplicates_action', 'delete_selected']
+    actions = ['merge_duplicates_action', 'merge_duplicate_clusters_action', export_in_background_action, 'delete_selected']
     list_display = ('get_fio', 'company', 'category', 'type_guest', 'producer', 'photo_preview')
     list_editable = ('company', 'category', 'type_guest', 'producer')
     list_filter = (
@@ -597,19 +638,43 @@ class ContactAdmin(BaseAdminPage, ImportExportModelAdmin, ImportExportActionMode
             )
         return super().changelist_view(request, extra_context)
 
-    def _duplicate_match_hint_column(self, anchor=None, *, global_mode=False):
-        def column(obj):
+    def _duplicate_match_hint_column(self, request, anchor=None, *, global_mode=False):
+        # get_list_display вызывается за запрос несколько раз — словарь причин общий для запроса
+        reasons_by_pk = request.__dict__.setdefault('_duplicate_reasons', {})
+
+        def prepare(contacts):
             if global_mode:
-                reasons = get_global_duplicate_reasons(obj)
+                reasons_by_pk.update(global_duplicate_reasons_map(contacts))
             elif anchor is not None:
-                reasons = get_duplicate_match_reasons(anchor, obj)
-            else:
+                reasons_by_pk.update(duplicate_match_reasons_map(anchor, contacts))
+
+        # Страницу списка подготавливает ChangeList из get_changelist — без запросов на строку
+        request._duplicate_reasons_prepare = prepare
+
+        def column(obj):
+            if not global_mode and anchor is None:
                 return '—'
+            if obj.pk not in reasons_by_pk:
+                prepare([obj])
+            reasons = reasons_by_pk.get(obj.pk)
             return ', '.join(reasons) if reasons else '—'
 
         column.short_description = 'Совпадение'
         return column
 
+    def get_changelist(self, request, **kwargs):
+        changelist_class = super().get_changelist(request, **kwargs)
+        prepare = getattr(request, '_duplicate_reasons_prepare', None)
+        if prepare is None:
+            return changelist_class
+
+        class DuplicateReasonsChangeList(changelist_class):
+            def get_results(self, request):
+                super().get_results(request)
+                prepare(self.result_list)
+
+        return DuplicateReasonsChangeList
+
     def get_list_display(self, request):
         display = list(super().get_list_display(request))
         duplicate_of = request.GET.get('duplicate_of')
@@ -619,9 +684,9 @@ class ContactAdmin(BaseAdminPage, ImportExportModelAdmin, ImportExportActionMode
             except (Contact.DoesNotExist, ValueError, TypeError):
                 anchor = None
             if anchor is not None:
-                display.insert(1, self._duplicate_match_hint_column(anchor))
+                display.insert(1, self._duplicate_match_hint_column(request, anchor))
         elif request.GET.get('presumed_duplicates') == 'yes':
-            display.insert(1, self._duplicate_match_hint_column(global_mode=True))
+            display.insert(1, self._duplicate_match_hint_column(request, global_mode=True))
         return display
 
     def find_duplicates_button(self, obj):
@@ -762,6 +827,65 @@ class ContactAdmin(BaseAdminPage, ImportExportModelAdmin, ImportExportActionMode
         }
         return render(request, 'event/merge_contacts.html', context)
 
+    # Сколько групп показывается на странице подтверждения пакетного объединения
+    MERGE_CLUSTERS_PREVIEW = 100
+
+    @admin.action(description='Объединить группы дублей автоматически', permissions=['delete'])
+    def merge_duplicate_clusters_action(self, request, queryset):
+        """
+        Пакетное объединение: выбранные люди группируются по общим ключам дублей
+        (фамилия и имя, контакт в соцсетях), в каждой группе основной остаётся карточка
+        с наибольшим числом регистраций. Удобно после неудачного импорта: фильтр
+        «Только возможные дубли» → «Выбрать все» → это действие.
+        Объединение необратимо, поэтому сначала показывается страница со списком групп;
+        при повторной отправке группы пересчитываются только среди подтверждённых карточек.
+        """
+        ids = list(queryset.values_list('pk', flat=True))
+        clusters, skipped = duplicate_clusters(contact_ids=ids)
+        if not clusters:
+            self.message_user(request, 'Среди выбранных людей нет групп дублей для объединения.', messages.WARNING)
+            return
+        if 'apply' not in request.POST:
+            return self._merge_clusters_confirmation(request, clusters, skipped)
+
+        result = merge_duplicate_clusters(clusters)
+        message = (
+            f'Объединено групп: {result["clusters"]}, удалено дубликатов: {result["removed"]}. '
+            f'Основная запись: {PRIMARY_RULES[DEFAULT_PRIMARY_RULE]}.'
+        )
+        if skipped:
+            message += f' Пропущено групп с несовпадающими отчествами: {skipped} — объедините их вручную.'
+        self.message_user(request, message, messages.SUCCESS)
+
+    def _merge_clusters_confirmation(self, request, clusters, skipped):
+        shown = clusters[:self.MERGE_CLUSTERS_PREVIEW]
+        contacts = (
+            Contact.objects.filter(pk__in=[pk for members in shown for pk in members])
+            .select_related('company')
+            .annotate(actions_count=Count('action'))
+            .in_bulk()
+        )
+        context = {
+            'title': 'Объединение групп дублей',
+            'clusters': [
+                [
+                    {'contact': contacts[pk], 'label': format_contact_merge_label(contacts[pk])}
+                    for pk in members if pk in contacts
+                ]
+                for members in shown
+            ],
+            'clusters_total': len(clusters),
+            'clusters_hidden': len(clusters) - len(shown),
+            'contacts_total': sum(len(members) for members in clusters),
+            'contact_ids': [pk for members in clusters for pk in members],
+            'skipped': skipped,
+            'primary_rule': PRIMARY_RULES[DEFAULT_PRIMARY_RULE],
+            'action_name': 'merge_duplicate_clusters_action',
+            'action_checkbox_name': admin.helpers.ACTION_CHECKBOX_NAME,
+            'opts': self.model._meta,
+        }
+        return render(request, 'event/merge_duplicate_clusters.html', context)
+
     def registered_events_list(self, obj):
         """
         Список мероприятий, где contact=obj
@@ -1097,20 +1221,21 @@ class ModuleInstanceAdmin(GuestsTableMixin, BaseAdminPage, ExportActionModelAdmi
 
         # Если пользователь — суперюзер или админ, видит все
         if request.user.is_superuser:
-            return qs
+            return self._with_status_totals(qs)
 
         # Если пользователь в группе "Модератор" — видит только те,
         # где он указан в массиве checkers
-        if request.user.groups.filter(name='Модератор').exists():
-            qs = qs.filter(checkers=request.user)
-
-        return qs.annotate(
-            announced_total=Count('action', filter=Q(action__action_type='announced')),
-            invited_total=Count('action', filter=Q(action__action_type='invited')),
-            registered_total=Count('action', filter=Q(action__action_type='registered')),
-            visited_total=Count('action', filter=Q(action__action_type='visited')),
-            cancelled_total=Count('action', filter=Q(action__action_type='cancelled')),
-        )
+        if has_role(request.user, ROLE_CHECKER):
+            qs = qs.filter(pk__in=user_access(request.user).checked)
+
+        return self._with_status_totals(qs)
+
+    def _with_status_totals(self, qs):
+        # Счётчики берутся из EventStatusCounter одним JOIN вместо COUNT по действиям
+        return qs.select_related('status_counter').annotate(**{
+            f'{status}_total': Coalesce(f'status_counter__{status}', Value(0))
+            for status in STATUS_FIELDS
+        })
 
     def has_change_permission(self, request, obj=None):
         """
@@ -1131,9 +1256,9 @@ class ModuleInstanceAdmin(GuestsTableMixin, BaseAdminPage, ExportActionModelAdmi
             return False
 
         # Проверяем, состоит ли пользователь в группе "Менеджер"
-        if request.user.groups.filter(name='Менеджер').exists():
+        if has_role(request.user, ROLE_MANAGER):
             # Разрешаем редактировать только если user в obj.managers
-            return request.user in obj.managers.all()
+            return obj.pk in user_access(request.user).managed
 
         # Иначе возвращаем стандартную проверку
         return super().has_change_permission(request, obj=obj)
@@ -1236,6 +1361,8 @@ class ModuleInstanceAdmin(GuestsTableMixin, BaseAdminPage, ExportActionModelAdmi
 
             if to_create:
                 Action.objects.bulk_create(to_create, ignore_conflicts=True)
+                # bulk_create не вызывает сигналы — счётчики пересчитываем явно
+                rebuild_event_counters([target.pk])
 
             results[target] = len(to_create)
 
@@ -1375,7 +1502,7 @@ class ActionAdmin(BaseAdminPage, ImportExportModelAdmin, ImportExportActionModel
 
     get_buttons_action.short_description = 'Статус'
 
-    actions = ['invited_actions', 'registered_actions', 'cancelled_actions', 'visited_actions']
+    actions = ['invited_actions', 'registered_actions', 'cancelled_actions', 'visited_actions', export_in_background_action]
 
     @admin.action(description='В статус Приглашён')
     def invited_actions(self, request, queryset):
@@ -1385,8 +1512,7 @@ class ActionAdmin(BaseAdminPage, ImportExportModelAdmin, ImportExportActionModel
             form = CheckinOrCancelForm(request.POST)
             if form.is_valid():
                 action_type = 'invited'
-                service.update_actions(action_type, queryset)
-                count = len(queryset)
+                count = service.update_actions(action_type, queryset, user=request.user)
                 self.message_user(request, "Приглашены на событие. Количество человек: %d." % (count))
                 return HttpResponseRedirect(request.get_full_path())
 
@@ -1403,8 +1529,7 @@ class ActionAdmin(BaseAdminPage, ImportExportModelAdmin, ImportExportActionModel
             form = CheckinOrCancelForm(request.POST)
             if form.is_valid():
                 action_type = 'registered'
-                service.update_actions(action_type, queryset)
-                count = len(queryset)
+                count = service.update_actions(action_type, queryset, user=request.user)
                 self.message_user(request, "Согласовали посещение события. Количество человек: %d." % (count))
                 return HttpResponseRedirect(request.get_full_path())
 
@@ -1421,8 +1546,7 @@ class ActionAdmin(BaseAdminPage, ImportExportModelAdmin, ImportExportActionModel
             form = CheckinOrCancelForm(request.POST)
             if form.is_valid():
                 action_type = 'cancelled'
-                service.update_actions(action_type, queryset)
-                count = len(queryset)
+                count = service.update_actions(action_type, queryset, user=request.user)
                 self.message_user(request, "Отклонили приглашение на событие. Количество человек: %d." % (count))
                 return HttpResponseRedirect(request.get_full_path())
 
@@ -1439,8 +1563,7 @@ class ActionAdmin(BaseAdminPage, ImportExportModelAdmin, ImportExportActionModel
             form = CheckinOrCancelForm(request.POST)
             if form.is_valid():
                 action_type = 'visited'
-                service.update_actions(action_type, queryset)
-                count = len(queryset)
+                count = service.update_actions(action_type, queryset, user=request.user)
                 self.message_user(request, "Подтверждено посещение по событию. Количество человек: %d." % (count))
                 return HttpResponseRedirect(request.get_full_path())
 
@@ -1500,13 +1623,75 @@ class ActionAdmin(BaseAdminPage, ImportExportModelAdmin, ImportExportActionModel
     # Выборка регистраций
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        if request.user.groups.filter(name='Модератор').exists():
-            qs = qs.filter(event__checkers=request.user)
-        if request.user.groups.filter(name='Менеджер').exists():
-            qs = qs.filter(event__managers=request.user)
+        if has_role(request.user, ROLE_CHECKER):
+            qs = qs.filter(event_id__in=user_access(request.user).checked)
+        if has_role(request.user, ROLE_MANAGER):
+            qs = qs.filter(event_id__in=user_access(request.user).managed)
         return qs
 
     # Отображение кнопок Сохранить, Сохранить и продолжить, Удалить, Закрыть
     def render_change_form(self, request, context, add=False, change=False, form_url='', obj=None):
         context.update(service.get_params_visible_buttons_save(request, obj))
         return super().render_change_form(request, context, add, change, form_url, obj)
+
+
+# Фоновые выгрузки
+@admin.register(ExportJob)
+class ExportJobAdmin(BaseAdminPage):
+    list_display = ('id', 'dataset', 'file_format', 'status', 'progress_display', 'create_user', 'create_date', 'download_link')
+    list_filter = ('status', 'dataset')
+    fields = ('dataset', 'file_format', 'filters', 'status', 'progress_display', 'create_user', 'create_date', 'started_at', 'finished_at', 'download_link', 'error')
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request).select_related('create_user')
+        if not request.user.is_superuser:
+            qs = qs.filter(create_user=request.user)
+        return qs
+
+    def progress_display(self, obj):
+        if obj.rows_total is None:
+            return '-'
+        return f'{obj.rows_done} / {obj.rows_total} ({obj.progress}%)'
+    progress_display.short_description = 'Прогресс'
+
+    def download_link(self, obj):
+        if obj.status != 'done' or not obj.file:
+            return '-'
+        return format_html('<a href="{}">Скачать</a>', reverse('export_job_download', args=[obj.pk]))
+    download_link.short_description = 'Файл'
+
+
+# Нечёткий поиск дублей (manage.py find_fuzzy_duplicates)
+@admin.register(DuplicateCandidatePair)
+class DuplicateCandidatePairAdmin(BaseAdminPage):
+    list_display = ('contact_a', 'contact_b', 'score_display', 'reasons', 'status', 'merge_link')
+    list_filter = ('status',)
+    list_select_related = ('contact_a', 'contact_b')
+    fields = ('contact_a', 'contact_b', 'score', 'reasons', 'status', 'create_date', 'update_date')
+    readonly_fields = ('contact_a', 'contact_b', 'score', 'reasons', 'create_date', 'update_date')
+    actions = ['dismiss_action']
+
+    def has_add_permission(self, request):
+        return False
+
+    def score_display(self, obj):
+        return f'{obj.score:.0%}'
+    score_display.short_description = 'Сходство'
+    score_display.admin_order_field = 'score'
+
+    def merge_link(self, obj):
+        url = reverse('admin:event_contact_changelist') + f'?id__in={obj.contact_a_id},{obj.contact_b_id}'
+        return format_html('<a href="{}">Открыть пару</a>', url)
+    merge_link.short_description = 'Объединение'
+
+    @admin.action(description='Отметить: не дубли')
+    def dismiss_action(self, request, queryset):
+        updated = queryset.update(status='dismissed', update_date=timezone.now())
+        self.message_user(request, f'Отмечено пар: {updated}', messages.SUCCESS)
@@ -5,3 +5,13 @@ class EventConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'event'
     verbose_name = 'Меню'
+
+    def ready(self):
+        from . import access, checks, contact_duplicates, contact_search, counters, producers, references, sync
+        access.connect_signals()
+        contact_duplicates.connect_signals()
+        contact_search.connect_signals()
+        counters.connect_signals()
+        producers.connect_signals()
+        references.connect_signals()
+        sync.connect_signals()
@@ -0,0 +1,462 @@
+"""
+Массовый импорт людей и регистраций без построчных запросов к БД.
+
+ContactBulkImporter — правила те же, что у ContactImport: поиск человека по ФИО
+(отчество пустое = NULL), справочники создаются по имени, продюсер ищется как в
+ProducerWidget, соцсеть строки создаёт или обновляет InfoContact.
+
+ActionBulkImporter — правила ActionImport: мероприятие по названию (создаётся при
+отсутствии), человек по ФИО без учёта регистра, регистрация создаётся, если её ещё нет.
+
+Отличие от построчного импорта — все поиски идут по словарям, загруженным заранее
+несколькими IN-запросами, а запись — через bulk_create/bulk_update порциями.
+"""
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .contact_duplicates import sync_duplicate_keys
+from .counters import rebuild_event_counters
+from .models import (
+    CONTACT_SEARCH_FIELDS,
+    Action,
+    CategoryContact,
+    CompanyContact,
+    Contact,
+    InfoContact,
+    ModuleInstance,
+    SocialNetwork,
+    TypeGuestContact,
+)
+from .producers import get_producer_directory
+from .signals import models_bulk_changed
+
+BULK_BATCH_SIZE = 1000
+
+CONTACT_TEXT_FIELDS = ('nickname', 'comment')
+CONTACT_REFERENCE_FIELDS = {
+    'company': CompanyContact,
+    'category': CategoryContact,
+    'type_guest': TypeGuestContact,
+}
+CONTACT_FK_FIELDS = tuple(CONTACT_REFERENCE_FIELDS) + ('producer',)
+
+
+def parse_middle_name(raw):
+    if raw is None or raw == 'None':
+        return None
+    value = str(raw).strip()
+    return value or None
+
+
+def parse_subscribers(raw):
+    if not raw:
+        return None
+    try:
+        return int(float(str(raw)))
+    except (ValueError, TypeError):
+        return None
+
+
+def _clean(value):
+    if value is None:
+        return ''
+    return value.strip() if isinstance(value, str) else str(value).strip()
+
+
+def build_contact_match_index():
+    """Индексы для поиска контакта по ФИО (как ContactImport.get_instance)."""
+    with_middle = {}
+    without_middle = {}
+
+    for pk, last_name, first_name, middle_name in Contact.objects.values_list(
+        'pk', 'last_name', 'first_name', 'middle_name'
+    ).iterator(chunk_size=5000):
+        if middle_name and str(middle_name).strip():
+            with_middle[(last_name, first_name, str(middle_name).strip())] = pk
+        else:
+            key = (last_name, first_name)
+            if key not in without_middle:
+                without_middle[key] = pk
+
+    return with_middle, without_middle
+
+
+class ReferenceResolver:
+    """Имя -> объект справочника; отсутствующие имена создаются одним bulk_create."""
+
+    def __init__(self, model, field='name'):
+        self.model = model
+        self.field = field
+        self._by_name = {}
+
+    def _load(self, names):
+        names = list(names)
+        for start in range(0, len(names), BULK_BATCH_SIZE):
+            chunk = names[start:start + BULK_BATCH_SIZE]
+            for obj in self.model.objects.filter(**{f'{self.field}__in': chunk}):
+                self._by_name[getattr(obj, self.field)] = obj
+
+    def prepare(self, names):
+        wanted = {name for name in names if name} - set(self._by_name)
+        if not wanted:
+            return
+        self._load(wanted)
+        missing = wanted - set(self._by_name)
+        if missing:
+            self.model.objects.bulk_create(
+                [self.model(**{self.field: name}) for name in missing],
+                batch_size=BULK_BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+            # ignore_conflicts не возвращает pk — перечитываем созданные записи
+            self._load(missing)
+
+    def get(self, name):
+        if not name:
+            return None
+        if name not in self._by_name:
+            self.prepare([name])
+        return self._by_name.get(name)
+
+
+class BulkImportResult:
+    """Итоги импорта в формате import_export Result.totals (new/update/skip/error)."""
+
+    def __init__(self):
+        self.totals = {'new': 0, 'update': 0, 'skip': 0, 'error': 0}
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.totals['error'] += 1
+        self.errors.append((line, message))
+
+    def has_errors(self):
+        return bool(self.errors)
+
+
+class ContactBulkImporter:
+    """
+    Импорт списка строк (dict по колонкам CONTACT_IMPORT_COLUMNS).
+    Колонки, которых нет в строке, не меняются — как в import_export.
+    """
+
+    def __init__(self, batch_size=BULK_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.references = {
+            field: ReferenceResolver(model) for field, model in CONTACT_REFERENCE_FIELDS.items()
+        }
+        self.social_networks = ReferenceResolver(SocialNetwork)
+        self.producers = None
+
+    def run(self, rows, raise_errors=False):
+        result = BulkImportResult()
+        rows = [{key: _clean(value) for key, value in row.items()} for row in rows]
+
+        valid = []
+        for line, row in enumerate(rows, start=1):
+            if not row.get('last_name') or not row.get('first_name'):
+                result.add_error(line, 'Не заполнены фамилия или имя')
+                continue
+            valid.append(row)
+        if raise_errors and result.has_errors():
+            line, message = result.errors[0]
+            raise ValueError(f'Строка {line}: {message}')
+
+        with transaction.atomic():
+            contacts = self._import_contacts(valid, result)
+            self._import_social_networks(valid, contacts)
+            sync_duplicate_keys(contact.pk for contact in contacts)
+        models_bulk_changed.send(sender=Contact)
+        return result
+
+    def _prepare_references(self, rows):
+        for field, resolver in self.references.items():
+            resolver.prepare(row.get(field) for row in rows if field in row)
+        self.producers = get_producer_directory() if any(row.get('producer') for row in rows) else None
+
+    def _row_values(self, row):
+        values = {}
+        if 'middle_name' in row:
+            values['middle_name'] = parse_middle_name(row['middle_name'])
+        for field in CONTACT_TEXT_FIELDS:
+            if field in row:
+                values[field] = row[field] or None
+        for field, resolver in self.references.items():
+            if field in row:
+                values[field] = resolver.get(row[field])
+        if 'producer' in row:
+            values['producer'] = self.producers.resolve_import(row['producer']) if self.producers else None
+        return values
+
+    @staticmethod
+    def _changed(contact, values):
+        changed = []
+        for field, value in values.items():
+            if field in CONTACT_FK_FIELDS:
+                current = getattr(contact, f'{field}_id')
+                new = value.pk if value is not None else None
+            else:
+                current = getattr(contact, field)
+                new = value
+            if (current or None) != (new or None):
+                changed.append(field)
+        return changed
+
+    def _import_contacts(self, rows, result):
+        """Возвращает список Contact, соответствующий rows (для соцсетей)."""
+        self._prepare_references(rows)
+        with_middle, without_middle = build_contact_match_index()
+        matched_pks = set()
+        for row in rows:
+            middle = parse_middle_name(row.get('middle_name'))
+            key = (row['last_name'], row['first_name'], middle) if middle else (row['last_name'], row['first_name'])
+            pk = (with_middle if middle else without_middle).get(key)
+            if pk:
+                matched_pks.add(pk)
+        existing = Contact.objects.in_bulk(matched_pks) if matched_pks else {}
+
+        pending = {}
+        to_create = []
+        to_update = {}
+        update_fields = set()
+        row_contacts = []
+
+        for row in rows:
+            middle = parse_middle_name(row.get('middle_name'))
+            key = (row['last_name'], row['first_name'], middle) if middle else (row['last_name'], row['first_name'])
+            contact = pending.get(key)
+            if contact is None:
+                pk = (with_middle if middle else without_middle).get(key)
+                contact = existing.get(pk) if pk else None
+
+            values = self._row_values(row)
+            if contact is None:
+                contact = Contact(last_name=row['last_name'], first_name=row['first_name'])
+                for field, value in values.items():
+                    setattr(contact, field, value)
+                to_create.append(contact)
+                pending[key] = contact
+                result.totals['new'] += 1
+            else:
+                changed = self._changed(contact, values)
+                if changed:
+                    for field in changed:
+                        setattr(contact, field, values[field])
+                    if contact.pk:
+                        to_update[contact.pk] = contact
+                        update_fields.update(changed)
+                    result.totals['update'] += 1
+                else:
+                    result.totals['skip'] += 1
+            row_contacts.append(contact)
+
+        # bulk_create/bulk_update не вызывают Contact.save — строку поиска заполняем сами
+        for contact in to_create:
+            contact.search_text = contact.build_search_text()
+        if update_fields & set(CONTACT_SEARCH_FIELDS):
+            for contact in to_update.values():
+                contact.search_text = contact.build_search_text()
+            update_fields.add('search_text')
+        Contact.objects.bulk_create(to_create, batch_size=self.batch_size)
+        self._fill_missing_pks(to_create)
+        if to_update:
+            # bulk_update не заполняет auto_now — время изменения нужно дельта-синхронизации таблиц
+            now = timezone.now()
+            for contact in to_update.values():
+                contact.updated_at = now
+            update_fields.add('updated_at')
+            Contact.objects.bulk_update(
+                list(to_update.values()), sorted(update_fields), batch_size=self.batch_size
+            )
+        return row_contacts
+
+    @staticmethod
+    def _fill_missing_pks(contacts):
+        """Бэкенды без RETURNING не заполняют pk после bulk_create — дочитываем по ФИО."""
+        missing = [c for c in contacts if c.pk is None]
+        if not missing:
+            return
+        with_middle, without_middle = build_contact_match_index()
+        for contact in missing:
+            if contact.middle_name:
+                contact.pk = with_middle.get((contact.last_name, contact.first_name, contact.middle_name))
+            else:
+                contact.pk = without_middle.get((contact.last_name, contact.first_name))
+
+    def _import_social_networks(self, rows, contacts):
+        entries = [
+            (contact, row['social_network_name'], row['social_network_id'], parse_subscribers(row.get('social_network_subscribers')))
+            for row, contact in zip(rows, contacts)
+            if row.get('social_network_name') and row.get('social_network_id')
+        ]
+        if not entries:
+            return
+        self.social_networks.prepare(name for _, name, _, _ in entries)
+
+        contact_ids = {contact.pk for contact, _, _, _ in entries}
+        network_ids = {self.social_networks.get(name).pk for _, name, _, _ in entries}
+        existing = {}
+        infos = InfoContact.objects.filter(
+            contact_id__in=contact_ids, social_network_id__in=network_ids
+        ).order_by('pk')
+        for info in infos.iterator(chunk_size=self.batch_size):
+            existing.setdefault((info.contact_id, info.social_network_id), info)
+
+        to_create = {}
+        to_update = {}
+        for contact, name, external_id, subscribers in entries:
+            network = self.social_networks.get(name)
+            key = (contact.pk, network.pk)
+            info = existing.get(key) or to_create.get(key)
+            if info is None:
+                to_create[key] = InfoContact(
+                    contact_id=contact.pk,
+                    social_network=network,
+                    external_id=external_id,
+                    subscribers=subscribers,
+                )
+                continue
+            info.external_id = external_id
+            info.subscribers = subscribers
+            if info.pk:
+                to_update[info.pk] = info
+
+        InfoContact.objects.bulk_create(list(to_create.values()), batch_size=self.batch_size)
+        if to_update:
+            InfoContact.objects.bulk_update(
+                list(to_update.values()), ['external_id', 'subscribers'], batch_size=self.batch_size
+            )
+
+
+# Колонки файла регистраций: внутреннее имя -> варианты заголовка (как в ActionImport)
+ACTION_IMPORT_COLUMNS = {
+    'event': ('event', 'Мероприятие'),
+    'last_name': ('last_name', 'Фамилия'),
+    'first_name': ('first_name', 'Имя'),
+    'middle_name': ('middle_name', 'Отчество'),
+}
+
+
+def _column(row, names):
+    for name in names:
+        value = _clean(row.get(name))
+        if value:
+            return value
+    return ''
+
+
+def contact_lookup_key(last_name, first_name, middle_name=None):
+    """Нормализованный ключ ФИО: без учёта регистра, пустое отчество = ''."""
+    return (last_name.lower(), first_name.lower(), (parse_middle_name(middle_name) or '').lower())
+
+
+class ActionBulkImporter:
+    """
+    Регистрация людей на мероприятия по строкам файла ActionImport.
+    Ненайденные люди попадают в result.errors с номером строки, остальные строки загружаются.
+    """
+
+    def __init__(self, user=None, batch_size=BULK_BATCH_SIZE):
+        self.user = user
+        self.batch_size = batch_size
+        self.events = ReferenceResolver(ModuleInstance)
+        self.contacts = {}
+
+    @staticmethod
+    def parse_row(row):
+        """(event, last_name, first_name, middle_name) из строки с любым вариантом заголовков."""
+        return tuple(_column(row, names) for names in ACTION_IMPORT_COLUMNS.values())
+
+    def prepare(self, rows):
+        """Загружает мероприятия и людей для всех строк; возвращает разобранные строки."""
+        parsed = [self.parse_row(row) for row in rows]
+        self.events.prepare(event for event, _, _, _ in parsed)
+        self._load_contacts(parsed)
+        return parsed
+
+    def _load_contacts(self, parsed):
+        wanted = {
+            contact_lookup_key(last, first, middle)
+            for _, last, first, middle in parsed
+            if last and first
+        }
+        # Исходное написание тоже в списке: Lower() в SQLite не меняет кириллицу
+        last_names = sorted({last for _, last, _, _ in parsed if last} | {key[0] for key in wanted})
+        for start in range(0, len(last_names), self.batch_size):
+            chunk = last_names[start:start + self.batch_size]
+            candidates = (
+                Contact.objects.annotate(last_name_lower=Lower('last_name'))
+                .filter(last_name_lower__in=chunk)
+                .order_by('pk')
+                .values_list('pk', 'last_name', 'first_name', 'middle_name')
+            )
+            for pk, last_name, first_name, middle_name in candidates:
+                key = contact_lookup_key(last_name, first_name, middle_name)
+                if key in wanted:
+                    self.contacts.setdefault(key, pk)
+
+    def contact_id(self, last_name, first_name, middle_name=None):
+        return self.contacts.get(contact_lookup_key(last_name, first_name, middle_name))
+
+    def _existing_pairs(self, pairs):
+        event_ids = {event_id for _, event_id in pairs}
+        contact_ids = sorted({contact_id for contact_id, _ in pairs})
+        existing = set()
+        for start in range(0, len(contact_ids), self.batch_size):
+            existing.update(
+                Action.objects.filter(
+                    event_id__in=event_ids,
+                    contact_id__in=contact_ids[start:start + self.batch_size],
+                ).values_list('contact_id', 'event_id')
+            )
+        return existing
+
+    def _row_error(self, event_name, last, first, middle):
+        if not event_name:
+            return 'Не указано мероприятие'
+        if self.contact_id(last, first, middle) is None:
+            return f'Не найден человек: {" ".join(filter(None, (last, first, middle)))}'
+        return None
+
+    def check(self, rows):
+        """Только проверка строк (предпросмотр импорта): мероприятия не создаются, в БД ничего не пишется."""
+        result = BulkImportResult()
+        parsed = [self.parse_row(row) for row in rows]
+        self._load_contacts(parsed)
+        for line, row in enumerate(parsed, start=1):
+            message = self._row_error(*row)
+            if message:
+                result.add_error(line, message)
+        result.totals['skip'] = len(parsed) - result.totals['error']
+        return result
+
+    def run(self, rows):
+        result = BulkImportResult()
+        with transaction.atomic():
+            parsed = self.prepare(rows)
+            pairs = {}
+            for line, (event_name, last, first, middle) in enumerate(parsed, start=1):
+                message = self._row_error(event_name, last, first, middle)
+                if message:
+                    result.add_error(line, message)
+                    continue
+                pairs.setdefault((self.contact_id(last, first, middle), self.events.get(event_name).pk), line)
+
+            existing = self._existing_pairs(pairs) if pairs else set()
+            to_create = [
+                Action(contact_id=contact_id, event_id=event_id, create_user=self.user)
+                for contact_id, event_id in pairs
+                if (contact_id, event_id) not in existing
+            ]
+            Action.objects.bulk_create(to_create, batch_size=self.batch_size, ignore_conflicts=True)
+
+            # bulk_create не вызывает сигналы — счётчики затронутых мероприятий пересчитываются
+            if to_create:
+                rebuild_event_counters({action.event_id for action in to_create})
+
+        result.totals['new'] = len(to_create)
+        result.totals['skip'] = len(parsed) - len(to_create) - result.totals['error']
+        models_bulk_changed.send(sender=ModuleInstance)
+        models_bulk_changed.send(sender=Action)
+        return result
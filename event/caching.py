@@ -0,0 +1,18 @@
+"""
+Виден ли кэш Django всем процессам сервера.
+
+Кэш в памяти процесса (LocMemCache — значение по умолчанию) у каждого воркера свой:
+версия, увеличенная в одном процессе, в остальных не меняется. Модули, которым
+нужна согласованность между процессами, без общего кэша не кэшируют
+или ограничивают время жизни данных.
+"""
+from django.conf import settings
+
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def shared_cache_configured(alias='default'):
+    return settings.CACHES.get(alias, {}).get('BACKEND') not in PROCESS_LOCAL_BACKENDS
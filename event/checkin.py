@@ -0,0 +1,278 @@
+"""
+Быстрый чекин: смена статуса регистрации на входе за минимум обращений к БД.
+
+Прежний путь (ActionView.post) на каждый скан: чтение Action, проверка доступа
+к мероприятию, сохранение через save() с сигналами и ленивые загрузки человека,
+справочников и соцсетей при сериализации. Здесь:
+
+1. одно чтение с JOIN: статус, человек, справочники, мероприятие и признак доступа,
+   вычисленный в SQL (EXISTS по managers/checkers/producers и группе «Администратор»);
+2. условный UPDATE — тот же доступ и прежний статус в WHERE: параллельный скан той же
+   записи не перезапишет чужое изменение, а получит CheckinError(409);
+3. запись аудита и счётчики мероприятия — в той же транзакции.
+
+Бенчмарк: manage.py bench_checkin.
+
+Пакетный чекин (apply_checkin_batch) — очередь сканов, накопленная устройством без
+сети: у каждого скана ключ идемпотентности и время на устройстве. Пакет применяется
+одной транзакцией, побеждает более поздний скан (сравнение с Action.update_date),
+результат каждого ключа сохраняется в CheckinReceipt — повторная отправка той же
+очереди после обрыва связи возвращает прежние результаты. Ключи уникальны в пределах
+пользователя. Время устройства не может быть позже времени сервера: скан с часами,
+ушедшими вперёд, иначе навсегда выигрывал бы у последующих изменений.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import BooleanField, Exists, ExpressionWrapper, OuterRef, Q, Value
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .access import ROLE_ADMIN
+from .counters import apply_action_change, apply_action_changes
+from .models import STATUS_MODEL, Action, ActionLog, CheckinReceipt, Contact, CustomUser, ModuleInstance
+from .signals import models_bulk_changed
+
+STATUSES = {key for key, _ in STATUS_MODEL}
+_READ_FIELDS = (
+    'pk', 'event_id', 'action_type', 'contact_id',
+    'contact__last_name', 'contact__first_name', 'contact__nickname', 'contact__photo',
+    'contact__category__name', 'contact__category__color',
+    'contact__company__name',
+    'contact__type_guest__name', 'contact__type_guest__color',
+    'event__name',
+)
+
+
+class CheckinError(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def event_access_q(user, event_ref='event_id'):
+    """Условие «пользователь может работать с мероприятием event_ref» для WHERE."""
+    if user.is_superuser:
+        return Q()
+    is_admin = Exists(CustomUser.groups.through.objects.filter(customuser_id=user.pk, group__name=ROLE_ADMIN))
+    condition = Q(is_admin)
+    for role in ('managers', 'checkers', 'producers'):
+        through = getattr(ModuleInstance, role).through
+        condition |= Q(Exists(through.objects.filter(moduleinstance_id=OuterRef(event_ref), customuser_id=user.pk)))
+    return condition
+
+
+def _photo_url(name):
+    return Contact._meta.get_field('photo').storage.url(name) if name else '-'
+
+
+def _reference(name, color=None):
+    if name is None:
+        return None
+    return {'name': name, 'color': color} if color is not None else {'name': name}
+
+
+def compact_checkin(row, update_date):
+    """Компактный ответ сканеру по строке _READ_FIELDS."""
+    return {
+        'id': row['pk'],
+        'action_type': row['action_type'],
+        'action_date': update_date.isoformat(),
+        'event': row['event_id'],
+        'event_name': row['event__name'],
+        'contact': {
+            'id': row['contact_id'],
+            'fio': f"{row['contact__last_name']} {row['contact__first_name']}",
+            'nickname': row['contact__nickname'],
+            'photo_link': _photo_url(row['contact__photo']),
+            'category': _reference(row['contact__category__name'], row['contact__category__color']),
+            'company': _reference(row['contact__company__name']),
+            'type_guest': _reference(row['contact__type_guest__name'], row['contact__type_guest__color']),
+        },
+    }
+
+
+def transition_action(user, action_id, action_type):
+    """
+    Переводит регистрацию action_id в статус action_type от имени user.
+    Возвращает (строка _READ_FIELDS с новым статусом, время изменения);
+    CheckinError со статусом 400/403/404/409 — если перевод невозможен.
+    """
+    if action_type not in STATUSES:
+        raise CheckinError('Неизвестный статус', 400)
+    access = event_access_q(user)
+
+    with transaction.atomic():
+        rows = Action.objects.filter(pk=action_id)
+        if user.is_superuser:
+            rows = rows.annotate(allowed=Value(True))
+        else:
+            rows = rows.annotate(allowed=ExpressionWrapper(access, output_field=BooleanField()))
+        row = rows.values(*_READ_FIELDS, 'allowed').first()
+        if row is None:
+            raise CheckinError('Регистрация не найдена', 404)
+        if not row['allowed']:
+            raise CheckinError('Нет прав для работы с этим мероприятием', 403)
+
+        now = timezone.now()
+        old_type = row['action_type']
+        updated = Action.objects.filter(access, pk=action_id, action_type=old_type).update(
+            action_type=action_type, update_user_id=user.pk, update_date=now,
+        )
+        if not updated:
+            raise CheckinError('Статус регистрации изменился, обновите список', 409)
+        if old_type != action_type:
+            ActionLog.objects.create(
+                action_id=action_id, old_status=old_type, new_status=action_type, create_user_id=user.pk,
+            )
+            apply_action_change(
+                (row['event_id'], old_type, row['contact_id']),
+                (row['event_id'], action_type, row['contact_id']),
+            )
+    models_bulk_changed.send(sender=Action)
+    row['action_type'] = action_type
+    return row, now
+
+
+CHECKIN_BATCH_MAX = 1000
+# Сколько дней хранятся квитанции: дольше устройство очередь не держит
+CHECKIN_RECEIPT_DAYS = 7
+WRITE_BATCH_SIZE = 500
+
+# Результаты пакетного чекина по каждому скану
+APPLIED = 'applied'
+STALE = 'stale'
+NOT_FOUND = 'not_found'
+FORBIDDEN = 'forbidden'
+INVALID = 'invalid'
+
+
+def _parse_item(item, now):
+    """(key, action_id, action_type, client_time) или None для некорректного скана; client_time не позже now."""
+    if not isinstance(item, dict):
+        return None
+    key = item.get('key')
+    action_type = item.get('action_type')
+    client_time = parse_datetime(str(item.get('client_time') or ''))
+    try:
+        action_id = int(item.get('action_id'))
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(key, str) or not key or len(key) > 64 or action_type not in STATUSES or client_time is None:
+        return None
+    if timezone.is_naive(client_time):
+        client_time = timezone.make_aware(client_time)
+    return key, action_id, action_type, min(client_time, now)
+
+
+def apply_checkin_batch(user, items):
+    """
+    Применяет очередь сканов [{'key', 'action_id', 'action_type', 'client_time'}].
+    Возвращает результаты в том же порядке: {'key', 'status', 'action_id', 'action_type', 'replayed'}.
+    action_type в результате — статус записи на сервере после пакета.
+    """
+    if len(items) > CHECKIN_BATCH_MAX:
+        raise CheckinError(f'Не больше {CHECKIN_BATCH_MAX} сканов за раз', 400)
+    now = timezone.now()
+    parsed = [_parse_item(item, now) for item in items]
+    keys = [entry[0] for entry in parsed if entry]
+
+    with transaction.atomic():
+        CheckinReceipt.objects.filter(
+            create_date__lt=now - timedelta(days=CHECKIN_RECEIPT_DAYS)
+        ).delete()
+        # Повторы тоже читаются — в ответе нужен текущий статус записи
+        action_ids = {entry[1] for entry in parsed if entry}
+        rows = Action.objects.filter(pk__in=action_ids).select_for_update()
+        if not user.is_superuser:
+            rows = rows.annotate(allowed=ExpressionWrapper(event_access_q(user), output_field=BooleanField()))
+        else:
+            rows = rows.annotate(allowed=Value(True))
+        states = {
+            row['pk']: row
+            for row in rows.values('pk', 'event_id', 'action_type', 'contact_id', 'update_date', 'allowed')
+        } if action_ids else {}
+        # Квитанции читаются после блокировки записей: повторная отправка той же очереди,
+        # пришедшая параллельно, ждёт фиксации первой и видит её квитанции
+        receipts = {
+            receipt.key: receipt
+            for receipt in CheckinReceipt.objects.filter(user_id=user.pk, key__in=keys)
+        } if keys else {}
+
+        fresh = {}
+        for entry in parsed:
+            if entry and entry[0] not in receipts:
+                fresh.setdefault(entry[0], entry)
+        initial = {pk: (row['event_id'], row['action_type'], row['contact_id']) for pk, row in states.items()}
+
+        # Сканы одной записи применяются по времени устройства: последний побеждает
+        outcome = {}
+        logs = []
+        for key, action_id, action_type, client_time in sorted(fresh.values(), key=lambda entry: entry[3]):
+            row = states.get(action_id)
+            if row is None:
+                outcome[key] = NOT_FOUND
+            elif not row['allowed']:
+                outcome[key] = FORBIDDEN
+            elif row['update_date'] is not None and (
+                client_time < row['update_date']
+                # Равное время у сканов одного пакета (например, срезанное до now) — побеждает поздний в очереди
+                or client_time == row['update_date'] and not row.get('changed')
+            ):
+                outcome[key] = STALE
+            else:
+                if row['action_type'] != action_type:
+                    logs.append(ActionLog(
+                        action_id=action_id, old_status=row['action_type'], new_status=action_type,
+                        create_user_id=user.pk,
+                    ))
+                row.update(action_type=action_type, update_date=client_time, changed=True)
+                outcome[key] = APPLIED
+
+        changed = [row for row in states.values() if row.get('changed')]
+        Action.objects.bulk_update(
+            [
+                Action(pk=row['pk'], action_type=row['action_type'], update_date=row['update_date'], update_user_id=user.pk)
+                for row in changed
+            ],
+            ['action_type', 'update_date', 'update_user'],
+            batch_size=WRITE_BATCH_SIZE,
+        )
+        ActionLog.objects.bulk_create(logs, batch_size=WRITE_BATCH_SIZE)
+        apply_action_changes(
+            (initial[row['pk']], (row['event_id'], row['action_type'], row['contact_id']))
+            for row in changed
+        )
+        CheckinReceipt.objects.bulk_create(
+            [
+                CheckinReceipt(
+                    key=key, user_id=user.pk, action_type=action_type, result=outcome[key],
+                    action_id=action_id if action_id in states else None,
+                )
+                for key, action_id, action_type, _ in fresh.values()
+            ],
+            batch_size=WRITE_BATCH_SIZE,
+            # Сканы несуществующих записей блокировкой не защищены; параллельный повтор
+            # получит тот же not_found, его квитанция просто не запишется второй раз
+            ignore_conflicts=True,
+        )
+    if changed:
+        models_bulk_changed.send(sender=Action)
+
+    results = []
+    for item, entry in zip(items, parsed):
+        if entry is None:
+            key = item.get('key') if isinstance(item, dict) else None
+            results.append({'key': key, 'status': INVALID, 'action_id': None, 'action_type': None, 'replayed': False})
+            continue
+        key, action_id = entry[0], entry[1]
+        receipt = receipts.get(key)
+        row = states.get(action_id)
+        results.append({
+            'key': key,
+            'status': receipt.result if receipt else outcome[key],
+            'action_id': action_id,
+            'action_type': row['action_type'] if row and row['allowed'] else None,
+            'replayed': receipt is not None,
+        })
+    return results
@@ -0,0 +1,65 @@
+"""
+Проверки конфигурации (manage.py check, запуск сервера).
+
+Живой канал мероприятий (event/live.py) между процессами работает только через
+PostgreSQL NOTIFY; бэкенд 'local' без DEBUG канал выключает.
+
+Справочники в памяти процесса (event/references.py, event/producers.py) сбрасываются
+во всех процессах только через версию в общем кэше Django. С кэшем процесса сброс
+виден лишь процессу, где изменили справочник, — остальные воркеры до LOCAL_TTL секунд
+отдают устаревшие id. Роли пользователя (event/access.py) в кэше процесса не хранятся
+вовсе: ACCESS_CACHE_TIMEOUT без общего кэша не действует.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+from django.db import connection
+
+from .caching import shared_cache_configured
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    if settings.DEBUG or shared_cache_configured():
+        return []
+    return [Warning(
+        'Кэш Django не общий для процессов сервера: справочники людей и продюсеров '
+        'в других воркерах обновятся с задержкой, итоги /table/ не кэшируются.',
+        hint='Задайте CACHE_URL (redis, memcached или dbcache), если сервер запущен в нескольких процессах.',
+        id='event.W001',
+    )]
+
+
+@register(Tags.caches)
+def check_access_cache(app_configs, **kwargs):
+    if not getattr(settings, 'ACCESS_CACHE_TIMEOUT', 0) or shared_cache_configured():
+        return []
+    return [Warning(
+        'ACCESS_CACHE_TIMEOUT задан, но кэш Django не общий для процессов: роли и доступ '
+        'к мероприятиям не кэшируются (снятие прав не дошло бы до других воркеров).',
+        hint='Задайте CACHE_URL (redis, memcached или dbcache) или уберите ACCESS_CACHE_TIMEOUT.',
+        id='event.W005',
+    )]
+
+
+@register()
+def check_live_events(app_configs, **kwargs):
+    backend = getattr(settings, 'LIVE_EVENTS_BACKEND', '')
+    if backend not in ('', 'local', 'postgres'):
+        return [Error(
+            f'Неизвестный LIVE_EVENTS_BACKEND: {backend!r}.',
+            hint="Допустимо: пусто (выключен), 'postgres' или 'local' (только с DEBUG).",
+            id='event.E002',
+        )]
+    if backend == 'postgres' and connection.vendor != 'postgresql':
+        return [Error(
+            "LIVE_EVENTS_BACKEND='postgres' требует базу PostgreSQL (NOTIFY/LISTEN).",
+            id='event.E003',
+        )]
+    if backend == 'local' and not settings.DEBUG:
+        return [Warning(
+            "LIVE_EVENTS_BACKEND='local' без DEBUG не действует: сообщения не дошли бы "
+            'до подписчиков других процессов, живой канал выключен.',
+            hint="Используйте LIVE_EVENTS_BACKEND='postgres'.",
+            id='event.W004',
+        )]
+    return []
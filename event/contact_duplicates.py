@@ -1,14 +1,58 @@
 """
 Поиск предположительных дублей контакта для списка в админке.
+
+Для глобального списка у каждого человека хранятся ключи ContactDuplicateKey:
+фамилия+имя, имя+отчество, никнейм (без учёта регистра) и логины в соцсетях.
+Ключи обновляются сигналами Contact/InfoContact и массовым импортом
+(sync_duplicate_keys), флаг shared отмечает ключи, совпадающие с ключом другого
+человека. Список дублей — выборка по индексу shared, без пересчёта по всей таблице.
+Первичное заполнение: manage.py rebuild_duplicate_keys.
+
+Две транзакции, одновременно добавившие одинаковый ключ, не видят чужую незафиксированную
+строку, и каждая оставила бы shared = False. Поэтому на PostgreSQL пересчёт shared
+берёт транзакционную advisory-блокировку на (kind, value) (по корзинам хэша): вторая
+транзакция ждёт фиксации первой и видит её строку.
 """
-from django.core.cache import cache
-from django.db.models import Count, Exists, OuterRef, Q
-from django.db.models.functions import Length, Lower
+import hashlib
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+
+from .models import Contact, ContactDuplicateKey, InfoContact
 
-from .models import Contact, InfoContact
+NAME_KINDS = ('name', 'first_middle', 'nickname')
+SOCIAL_KINDS = ('social',)
+KEY_KINDS = NAME_KINDS + SOCIAL_KINDS
+DUPLICATE_KEY_BATCH_SIZE = 1000
+# Блокировки берутся по корзинам хэша ключа: их число в транзакции ограничено
+DUPLICATE_KEY_LOCK_BUCKETS = 256
+# Пространство advisory-блокировок этого модуля (первый аргумент pg_advisory_xact_lock)
+_LOCK_NAMESPACE = 7301
 
-DUPLICATE_IDS_CACHE_KEY = 'contact_presumed_duplicate_ids'
-DUPLICATE_IDS_CACHE_TTL = 300
+
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred_duplicate_keys():
+    """
+    Сигналы Contact/InfoContact не пересчитывают ключи внутри блока: массовые операции
+    (contact_merge.merge_duplicate_clusters) обновляют их сами одним проходом в конце.
+    """
+    previous = getattr(_deferred, 'active', False)
+    _deferred.active = True
+    try:
+        yield
+    finally:
+        _deferred.active = previous
+
+
+def _keys_deferred():
+    return getattr(_deferred, 'active', False)
 
 
 def _norm(value):
@@ -17,8 +61,124 @@ def _norm(value):
     return str(value).strip()
 
 
-def invalidate_presumed_duplicates_cache():
-    cache.delete(DUPLICATE_IDS_CACHE_KEY)
+def _batches(items, size=DUPLICATE_KEY_BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def contact_name_keys(last_name, first_name, middle_name, nickname):
+    """Ключи дублей по полям карточки: [(kind, value)]."""
+    last, first, middle, nick = (_norm(v).lower() for v in (last_name, first_name, middle_name, nickname))
+    keys = []
+    if last and first:
+        keys.append(('name', f'{last}|{first}'))
+    if first and middle:
+        keys.append(('first_middle', f'{first}|{middle}'))
+    if len(nick) >= 2:
+        keys.append(('nickname', nick))
+    return keys
+
+
+def _lock_bucket(kind, value):
+    digest = hashlib.blake2b(f'{kind}|{value}'.encode('utf-8'), digest_size=4).digest()
+    return int.from_bytes(digest, 'big') % DUPLICATE_KEY_LOCK_BUCKETS
+
+
+def _lock_keys(pairs):
+    """Блокирует ключи до конца транзакции; корзины берутся по возрастанию — без взаимоблокировок."""
+    if connection.vendor != 'postgresql':
+        return
+    buckets = sorted({_lock_bucket(kind, value) for kind, value in pairs})
+    if not buckets:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(%s, bucket) FROM (SELECT unnest(%s::int[]) AS bucket ORDER BY 1) AS buckets',
+            [_LOCK_NAMESPACE, buckets],
+        )
+
+
+def refresh_shared(pairs):
+    """Пересчитывает флаг shared для ключей (kind, value)."""
+    pairs = set(pairs)
+    if not pairs:
+        return
+    with transaction.atomic():
+        _lock_keys(pairs)
+        _refresh_shared(pairs)
+
+
+def _refresh_shared(pairs):
+    by_kind = defaultdict(set)
+    for kind, value in pairs:
+        by_kind[kind].add(value)
+
+    for kind, values in by_kind.items():
+        for chunk in _batches(sorted(values)):
+            rows = ContactDuplicateKey.objects.filter(kind=kind, value__in=chunk)
+            contacts = defaultdict(set)
+            flags = {}
+            for pk, value, contact_id, shared in rows.values_list('pk', 'value', 'contact_id', 'shared'):
+                contacts[value].add(contact_id)
+                flags[pk] = (value, shared)
+            set_on = [pk for pk, (value, shared) in flags.items() if not shared and len(contacts[value]) > 1]
+            set_off = [pk for pk, (value, shared) in flags.items() if shared and len(contacts[value]) < 2]
+            if set_on:
+                ContactDuplicateKey.objects.filter(pk__in=set_on).update(shared=True)
+            if set_off:
+                ContactDuplicateKey.objects.filter(pk__in=set_off).update(shared=False)
+
+
+def sync_duplicate_keys(contact_ids, kinds=KEY_KINDS):
+    """Приводит ключи людей к текущим данным; kinds — какие признаки пересчитывать."""
+    kinds = tuple(kinds)
+    touched = set()
+    for chunk in _batches(sorted({pk for pk in contact_ids if pk})):
+        wanted = {}
+        for pk, last, first, middle, nick in Contact.objects.filter(pk__in=chunk).values_list(
+            'pk', 'last_name', 'first_name', 'middle_name', 'nickname'
+        ):
+            wanted[pk] = {key for key in contact_name_keys(last, first, middle, nick) if key[0] in kinds}
+        if 'social' in kinds:
+            handles = (
+                InfoContact.objects.filter(contact_id__in=list(wanted), community__isnull=True)
+                .exclude(external_id='')
+                .values_list('contact_id', 'external_id')
+            )
+            for contact_id, external_id in handles:
+                wanted[contact_id].add(('social', external_id))
+
+        existing = defaultdict(dict)
+        for pk, contact_id, kind, value in ContactDuplicateKey.objects.filter(
+            contact_id__in=chunk, kind__in=kinds
+        ).values_list('pk', 'contact_id', 'kind', 'value'):
+            existing[contact_id][(kind, value)] = pk
+
+        stale = []
+        new = []
+        for contact_id in chunk:
+            have = existing.get(contact_id, {})
+            want = wanted.get(contact_id, set())
+            stale.extend(pk for key, pk in have.items() if key not in want)
+            new.extend(
+                ContactDuplicateKey(contact_id=contact_id, kind=kind, value=value)
+                for kind, value in want - set(have)
+            )
+            touched |= set(have) ^ want
+
+        if stale:
+            ContactDuplicateKey.objects.filter(pk__in=stale).delete()
+        if new:
+            ContactDuplicateKey.objects.bulk_create(new, ignore_conflicts=True)
+    refresh_shared(touched)
+
+
+def rebuild_duplicate_keys():
+    """Полное заполнение ключей (после появления таблицы); возвращает число людей."""
+    ids = list(Contact.objects.order_by('pk').values_list('pk', flat=True))
+    sync_duplicate_keys(ids)
+    return len(ids)
 
 
 def build_duplicate_candidates_q(contact, *, weak_last_name=False):
@@ -76,114 +236,58 @@ def duplicate_candidates_queryset(contact, *, weak_last_name=False):
     ).distinct()
 
 
-def _ids_from_grouped_contacts(group_fields, *, min_field_length=None):
-    """Контакты из групп, где по group_fields больше одной непустой записи."""
-    annotations = {f'{f}_l': Lower(f) for f in group_fields}
-    non_empty = {f'{f}_l__gt': '' for f in group_fields}
-
-    def base_qs():
-        qs = Contact.objects.annotate(**annotations).filter(**non_empty)
-        if min_field_length is not None and len(group_fields) == 1:
-            field = group_fields[0]
-            qs = qs.annotate(**{f'{field}_len': Length(field)}).filter(
-                **{f'{field}_len__gte': min_field_length}
-            )
-        return qs
-
-    match = {f'{f}_l': OuterRef(f'{f}_l') for f in group_fields}
-    duplicate = base_qs().filter(**match).exclude(pk=OuterRef('pk'))
-
-    return set(
-        base_qs()
-        .filter(Exists(duplicate))
-        .values_list('pk', flat=True)
-    )
+def all_presumed_duplicate_contact_ids():
+    """Все карточки, у которых есть хотя бы один предположительный дубль."""
+    return set(presumed_duplicates_queryset().values_list('pk', flat=True))
 
 
-def _ids_from_duplicate_social_handles():
-    dup_handles = (
-        InfoContact.objects.filter(community__isnull=True)
-        .exclude(external_id='')
-        .exclude(contact__isnull=True)
-        .values('external_id')
-        .annotate(cnt=Count('contact_id', distinct=True))
-        .filter(cnt__gt=1)
-        .values_list('external_id', flat=True)
-    )
-    return set(
-        InfoContact.objects.filter(community__isnull=True, external_id__in=dup_handles)
-        .exclude(contact__isnull=True)
-        .values_list('contact_id', flat=True)
-        .distinct()
+def presumed_duplicates_queryset():
+    return Contact.objects.filter(
+        pk__in=ContactDuplicateKey.objects.filter(shared=True).values('contact_id')
     )
 
 
-def all_presumed_duplicate_contact_ids():
-    """Все карточки, у которых есть хотя бы один предположительный дубль."""
-    cached = cache.get(DUPLICATE_IDS_CACHE_KEY)
-    if cached is not None:
-        return cached
-
-    ids = set()
-    ids.update(_ids_from_grouped_contacts(['last_name', 'first_name']))
-    ids.update(_ids_from_grouped_contacts(['first_name', 'middle_name']))
-    ids.update(_ids_from_grouped_contacts(['nickname'], min_field_length=2))
-    ids.update(_ids_from_duplicate_social_handles())
-    cache.set(DUPLICATE_IDS_CACHE_KEY, ids, DUPLICATE_IDS_CACHE_TTL)
-    return ids
+GLOBAL_REASON_LABELS = (
+    ('name', 'фамилия и имя'),
+    ('first_middle', 'имя и отчество'),
+    ('nickname', 'никнейм'),
+    ('social', 'контакт в соцсетях'),
+)
 
 
-def presumed_duplicates_queryset():
-    ids = all_presumed_duplicate_contact_ids()
-    if not ids:
-        return Contact.objects.none()
-    return Contact.objects.filter(pk__in=ids)
+def global_duplicate_reasons_map(contacts):
+    """{pk: [причины]} для страницы людей из глобального списка дублей — один запрос."""
+    ids = [contact.pk for contact in contacts]
+    kinds = defaultdict(set)
+    for chunk in _batches(ids):
+        for contact_id, kind in ContactDuplicateKey.objects.filter(
+            contact_id__in=chunk, shared=True
+        ).values_list('contact_id', 'kind'):
+            kinds[contact_id].add(kind)
+    return {
+        pk: [label for kind, label in GLOBAL_REASON_LABELS if kind in kinds[pk]]
+        for pk in ids
+    }
 
 
 def get_global_duplicate_reasons(contact):
     """Почему контакт попал в глобальный список возможных дублей."""
-    reasons = []
-    last = _norm(contact.last_name)
-    first = _norm(contact.first_name)
-    middle = _norm(contact.middle_name)
-    nick = _norm(contact.nickname)
-
-    if last and first:
-        if Contact.objects.filter(
-            last_name__iexact=last,
-            first_name__iexact=first,
-        ).exclude(pk=contact.pk).exists():
-            reasons.append('фамилия и имя')
+    return global_duplicate_reasons_map([contact])[contact.pk]
 
-    if first and middle:
-        if Contact.objects.filter(
-            first_name__iexact=first,
-            middle_name__iexact=middle,
-        ).exclude(pk=contact.pk).exists():
-            reasons.append('имя и отчество')
 
-    if nick and len(nick) >= 2:
-        if Contact.objects.filter(nickname__iexact=nick).exclude(pk=contact.pk).exists():
-            reasons.append('никнейм')
-
-    handles = list(
-        InfoContact.objects.filter(contact=contact, community__isnull=True)
-        .exclude(external_id='')
-        .values_list('external_id', flat=True)
-    )
-    for handle in handles:
-        if InfoContact.objects.filter(
-            community__isnull=True,
-            external_id=handle,
-        ).exclude(contact=contact).exclude(contact__isnull=True).exists():
-            reasons.append('контакт в соцсетях')
-            break
-
-    return reasons
+def _social_handles(contact_ids):
+    handles = defaultdict(set)
+    for chunk in _batches(contact_ids):
+        for contact_id, external_id in (
+            InfoContact.objects.filter(contact_id__in=chunk, community__isnull=True)
+            .exclude(external_id='')
+            .values_list('contact_id', 'external_id')
+        ):
+            handles[contact_id].add(external_id)
+    return handles
 
 
-def get_duplicate_match_reasons(anchor, candidate):
-    """Краткие подписи, почему запись попала в подборку."""
+def _name_match_reasons(anchor, candidate):
     reasons = []
     last = _norm(anchor.last_name)
     first = _norm(anchor.first_name)
@@ -208,22 +312,73 @@ def get_duplicate_match_reasons(anchor, candidate):
         reasons.append('фамилия')
     if nick and len(nick) >= 2 and c_nick.lower() == nick.lower():
         reasons.append('никнейм')
+    return reasons
 
-    anchor_handles = set(
-        InfoContact.objects.filter(contact=anchor, community__isnull=True)
-        .exclude(external_id='')
-        .values_list('external_id', flat=True)
+
+def duplicate_match_reasons_map(anchor, candidates):
+    """{pk: [причины]} совпадения страницы кандидатов с карточкой anchor — два запроса."""
+    candidates = list(candidates)
+    handles = _social_handles([anchor.pk] + [candidate.pk for candidate in candidates])
+    anchor_handles = handles.get(anchor.pk, set())
+
+    result = {}
+    for candidate in candidates:
+        reasons = _name_match_reasons(anchor, candidate)
+        if anchor_handles & handles.get(candidate.pk, set()):
+            reasons.append('контакт в соцсетях')
+        if candidate.pk == anchor.pk:
+            reasons.append('эта карточка')
+        result[candidate.pk] = reasons
+    return result
+
+
+def get_duplicate_match_reasons(anchor, candidate):
+    """Краткие подписи, почему запись попала в подборку."""
+    return duplicate_match_reasons_map(anchor, [candidate])[candidate.pk]
+
+
+def _contact_saved(sender, instance, **kwargs):
+    if _keys_deferred():
+        return
+    sync_duplicate_keys([instance.pk], NAME_KINDS)
+
+
+def _contact_deleting(sender, instance, **kwargs):
+    if _keys_deferred():
+        return
+    # Ключи удалятся каскадно — запоминаем их, чтобы снять shared у оставшихся людей
+    instance._duplicate_keys = set(
+        ContactDuplicateKey.objects.filter(contact_id=instance.pk).values_list('kind', 'value')
     )
-    if anchor_handles:
-        candidate_handles = set(
-            InfoContact.objects.filter(contact=candidate, community__isnull=True)
-            .exclude(external_id='')
-            .values_list('external_id', flat=True)
+
+
+def _contact_deleted(sender, instance, **kwargs):
+    if _keys_deferred():
+        return
+    refresh_shared(getattr(instance, '_duplicate_keys', ()))
+
+
+def _info_saving(sender, instance, **kwargs):
+    if _keys_deferred():
+        return
+    instance._duplicate_old_contact_id = None
+    if instance.pk:
+        instance._duplicate_old_contact_id = (
+            InfoContact.objects.filter(pk=instance.pk).values_list('contact_id', flat=True).first()
         )
-        if anchor_handles & candidate_handles:
-            reasons.append('контакт в соцсетях')
 
-    if candidate.pk == anchor.pk:
-        reasons.append('эта карточка')
 
-    return reasons
+def _info_changed(sender, instance, **kwargs):
+    if _keys_deferred():
+        return
+    contact_ids = {instance.contact_id, getattr(instance, '_duplicate_old_contact_id', None)}
+    sync_duplicate_keys(contact_ids, SOCIAL_KINDS)
+
+
+def connect_signals():
+    post_save.connect(_contact_saved, sender=Contact, dispatch_uid='contact_duplicates_save')
+    pre_delete.connect(_contact_deleting, sender=Contact, dispatch_uid='contact_duplicates_pre_delete')
+    post_delete.connect(_contact_deleted, sender=Contact, dispatch_uid='contact_duplicates_delete')
+    pre_save.connect(_info_saving, sender=InfoContact, dispatch_uid='contact_duplicates_info_pre_save')
+    post_save.connect(_info_changed, sender=InfoContact, dispatch_uid='contact_duplicates_info_save')
+    post_delete.connect(_info_changed, sender=InfoContact, dispatch_uid='contact_duplicates_info_delete')
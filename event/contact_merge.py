@@ -3,8 +3,26 @@ from collections import defaultdict
 
 from django.core.files.base import ContentFile
 from django.db import transaction
-from .contact_duplicates import invalidate_presumed_duplicates_cache
-from .models import Action, CommunityMember, Contact, InfoContact
+from django.db.models import Case, Count, IntegerField, Value, When
+from django.utils import timezone
+from .contact_duplicates import (
+    SOCIAL_KINDS,
+    deferred_duplicate_keys,
+    refresh_shared,
+    sync_duplicate_keys,
+)
+from .counters import rebuild_event_counters
+from .models import (
+    Action,
+    ActionLog,
+    CheckinReceipt,
+    CommunityMember,
+    Contact,
+    ContactDuplicateKey,
+    InfoContact,
+)
+from .signals import models_bulk_changed
+from .sync import record_deleted
 
 def format_contact_merge_label(contact):
     """Подпись карточки в форме объединения: ФИО, отчество, ник, id."""
@@ -126,7 +144,7 @@ def _reassign_related(primary, duplicates):
     if action_delete_pks:
         Action.objects.filter(pk__in=action_delete_pks).delete()
     if action_reassign_pks:
-        Action.objects.filter(pk__in=action_reassign_pks).update(contact=primary)
+        Action.objects.filter(pk__in=action_reassign_pks).update(contact=primary, update_date=timezone.now())
 
 
 @transaction.atomic
@@ -169,5 +187,268 @@ def merge_contacts(primary, duplicates, field_values, photo_from_contact_id=None
         primary.photo = None
 
     primary.save()
-    invalidate_presumed_duplicates_cache()
+    # Соцсети дублей перенесены update() без сигналов — ключи основной записи пересчитываем явно
+    sync_duplicate_keys([primary.pk], SOCIAL_KINDS)
     return len(duplicate_ids)
+
+
+# Пакетное объединение групп дублей (manage.py merge_duplicate_clusters, действие в админке)
+
+# Какими общими ключами ContactDuplicateKey связываются карточки одной группы.
+# «имя и отчество» и никнейм слишком часто совпадают у разных людей — только явно.
+CLUSTER_KINDS = ('name', 'social')
+# Правила выбора основной записи группы
+PRIMARY_RULES = {
+    'most_actions': 'больше всего регистраций',
+    'most_filled': 'больше всего заполненных полей',
+    'oldest': 'самая ранняя карточка',
+}
+DEFAULT_PRIMARY_RULE = 'most_actions'
+# Пустые поля основной записи заполняются из дублей
+MERGE_FILL_FIELDS = ('nickname', 'company', 'category', 'type_guest', 'producer', 'comment', 'photo')
+# Сколько карточек (основных и дублей) обрабатывается в одной транзакции
+BULK_MERGE_BATCH_SIZE = 200
+
+
+def duplicate_clusters(kinds=CLUSTER_KINDS, contact_ids=None):
+    """
+    Группы людей, связанных общими ключами дублей: ([[pk, ...], ...], число пропущенных).
+    contact_ids — ограничить группы этими людьми (например, выделенными в админке).
+    Группа пропускается, если в ней разные непустые отчества: это однофамильцы, а не дубли.
+    Пропускается и группа, где фамилия и имя связывают карточку с отчеством и карточку
+    без него: по одним фамилии и имени однофамильца не отличить от дубля, такие группы
+    объединяются вручную.
+    """
+    keys = ContactDuplicateKey.objects.filter(shared=True, kind__in=kinds)
+    if contact_ids is not None:
+        keys = keys.filter(contact_id__in=contact_ids)
+    by_key = defaultdict(list)
+    for kind, value, contact_id in keys.values_list('kind', 'value', 'contact_id').iterator(chunk_size=5000):
+        by_key[(kind, value)].append(contact_id)
+
+    parent = {}
+
+    def find(pk):
+        root = parent.setdefault(pk, pk)
+        while root != parent[root]:
+            root = parent[root]
+        while parent[pk] != root:
+            parent[pk], pk = root, parent[pk]
+        return root
+
+    for members in by_key.values():
+        if len(members) < 2:
+            continue
+        first = find(members[0])
+        for pk in members[1:]:
+            other = find(pk)
+            if other != first:
+                parent[other] = first
+
+    groups = defaultdict(list)
+    for pk in parent:
+        groups[find(pk)].append(pk)
+    groups = [sorted(members) for members in groups.values() if len(members) > 1]
+
+    middle_names = {}
+    ids = [pk for members in groups for pk in members]
+    for start in range(0, len(ids), BULK_MERGE_BATCH_SIZE):
+        middle_names.update(
+            (pk, (middle or '').strip().lower())
+            for pk, middle in Contact.objects.filter(pk__in=ids[start:start + BULK_MERGE_BATCH_SIZE])
+            .values_list('pk', 'middle_name')
+        )
+    # Группы, где ключ «фамилия и имя» связал карточки с отчеством и без него
+    ambiguous = set()
+    for (kind, _), members in by_key.items():
+        middles = {middle_names.get(pk, '') for pk in members}
+        if kind == 'name' and len(members) > 1 and '' in middles and len(middles) > 1:
+            ambiguous.add(find(members[0]))
+    clusters = []
+    skipped = 0
+    for members in groups:
+        middles = {middle_names[pk] for pk in members} - {''}
+        if len(middles) > 1 or find(members[0]) in ambiguous:
+            skipped += 1
+        else:
+            clusters.append(members)
+    clusters.sort()
+    return clusters, skipped
+
+
+def _fill_attnames():
+    return [Contact._meta.get_field(field).attname for field in MERGE_FILL_FIELDS]
+
+
+def _filled_count(contact):
+    return sum(1 for attname in _fill_attnames() if getattr(contact, attname))
+
+
+def _primary_sort_key(rule, contact, actions):
+    filled = _filled_count(contact)
+    if rule == 'oldest':
+        return (contact.pk,)
+    if rule == 'most_filled':
+        return (-filled, -actions, contact.pk)
+    return (-actions, -filled, contact.pk)
+
+
+def _remap_contact(queryset, primary_of, **values):
+    """Одним UPDATE переставляет contact_id строк queryset с дублей на их основные записи."""
+    if not primary_of:
+        return
+    queryset.update(contact_id=Case(
+        *[When(contact_id=dup, then=Value(primary)) for dup, primary in primary_of.items()],
+        output_field=IntegerField(),
+    ), **values)
+
+
+def _merge_batch(clusters, rule):
+    """Объединяет группы одного пакета; возвращает (удалённые pk, основные pk, снятые ключи)."""
+    ids = [pk for members in clusters for pk in members]
+    contacts = Contact.objects.in_bulk(ids)
+    action_counts = dict(
+        Action.objects.filter(contact_id__in=ids).values('contact_id')
+        .annotate(total=Count('pk')).values_list('contact_id', 'total')
+    )
+
+    primary_of = {}
+    to_fill = []
+    for members in clusters:
+        present = [contacts[pk] for pk in members if pk in contacts]
+        if len(present) < 2:
+            continue
+        present.sort(key=lambda contact: _primary_sort_key(rule, contact, action_counts.get(contact.pk, 0)))
+        primary, duplicates = present[0], present[1:]
+        filled = False
+        for attname in _fill_attnames():
+            if getattr(primary, attname):
+                continue
+            source = next((dup for dup in sorted(duplicates, key=lambda c: c.pk) if getattr(dup, attname)), None)
+            if source is not None:
+                setattr(primary, attname, getattr(source, attname))
+                filled = True
+        if filled:
+            primary.search_text = primary.build_search_text()
+            to_fill.append(primary)
+        for dup in duplicates:
+            primary_of[dup.pk] = primary.pk
+    if not primary_of:
+        return [], [], set()
+
+    duplicate_ids = list(primary_of)
+    all_ids = duplicate_ids + sorted(set(primary_of.values()))
+
+    _remap_contact(InfoContact.objects.filter(contact_id__in=duplicate_ids), primary_of)
+
+    # Членство в сообществах: у основной записи остаётся одна строка на сообщество
+    member_keep = {}
+    member_delete = []
+    for pk, contact_id, community_id in (
+        CommunityMember.objects.filter(contact_id__in=all_ids)
+        .values_list('pk', 'contact_id', 'community_id').order_by('pk')
+    ):
+        key = (primary_of.get(contact_id, contact_id), community_id)
+        kept = member_keep.get(key)
+        if kept is None:
+            member_keep[key] = (pk, contact_id)
+        elif contact_id == key[0] and kept[1] != key[0]:
+            # Своя строка основной записи важнее перенесённой
+            member_delete.append(kept[0])
+            member_keep[key] = (pk, contact_id)
+        else:
+            member_delete.append(pk)
+    if member_delete:
+        CommunityMember.objects.filter(pk__in=member_delete).delete()
+    member_move = [pk for (primary, _), (pk, contact_id) in member_keep.items() if contact_id != primary]
+    _remap_contact(CommunityMember.objects.filter(pk__in=member_move), primary_of)
+
+    # Регистрации: на мероприятие остаётся лучшая (как в merge_contacts), при равенстве — основной записи
+    by_event = defaultdict(list)
+    for action in (
+        Action.objects.filter(contact_id__in=all_ids)
+        .only('pk', 'contact_id', 'event_id', 'action_type', 'update_date').order_by('pk')
+    ):
+        primary = primary_of.get(action.contact_id, action.contact_id)
+        by_event[(primary, action.event_id)].append(action)
+    action_delete = []
+    action_move = []
+    for (primary, _), actions in by_event.items():
+        actions.sort(key=lambda action: action.contact_id != primary)
+        best = _best_action(actions)
+        action_delete.extend(action.pk for action in actions if action.pk != best.pk)
+        if best.contact_id != primary:
+            action_move.append(best.pk)
+    if action_delete:
+        event_of = dict(Action.objects.filter(pk__in=action_delete).values_list('pk', 'event_id'))
+        ActionLog.objects.filter(action_id__in=action_delete).delete()
+        # _raw_delete не применяет on_delete=SET_NULL — квитанции чекина отвязываются вручную
+        CheckinReceipt.objects.filter(action_id__in=action_delete).update(action=None)
+        # Без сигналов по каждой строке: счётчики мероприятий пересчитываются ниже одним проходом
+        Action.objects.filter(pk__in=action_delete)._raw_delete(Action.objects.db)
+        record_deleted(Action, action_delete, event_of)
+        rebuild_event_counters(set(event_of.values()) - {None})
+    # update_date — чтобы открытые таблицы увидели смену человека в строке (event/sync.py)
+    now = timezone.now()
+    _remap_contact(Action.objects.filter(pk__in=action_move), primary_of, update_date=now)
+
+    if to_fill:
+        for contact in to_fill:
+            contact.updated_at = now
+        Contact.objects.bulk_update(to_fill, list(MERGE_FILL_FIELDS) + ['search_text', 'updated_at'])
+
+    # Ключи и пары нечёткого поиска удалятся каскадно; снятые ключи нужны для пересчёта shared
+    removed_keys = set(
+        ContactDuplicateKey.objects.filter(contact_id__in=duplicate_ids).values_list('kind', 'value')
+    )
+    Contact.objects.filter(pk__in=duplicate_ids).delete()
+    return duplicate_ids, sorted(set(primary_of.values())), removed_keys
+
+
+def merge_duplicate_clusters(clusters, rule=DEFAULT_PRIMARY_RULE, batch_size=BULK_MERGE_BATCH_SIZE, progress=None):
+    """
+    Объединяет группы дублей [[pk, ...], ...]: в каждой группе основная запись выбирается
+    по правилу rule (PRIMARY_RULES), связи дублей переносятся на неё, дубли удаляются.
+
+    Связи переносятся пакетами по batch_size карточек — несколько UPDATE/DELETE на пакет,
+    каждый пакет в своей транзакции. Ключи дублей пересчитываются один раз в конце
+    (при сбое посередине — manage.py rebuild_duplicate_keys).
+    progress(обработано групп, всего групп) вызывается после каждого пакета.
+    Возвращает {'clusters': объединено групп, 'removed': удалено карточек}.
+    """
+    if rule not in PRIMARY_RULES:
+        raise ValueError(f'Неизвестное правило выбора основной записи: {rule}')
+    clusters = [list(members) for members in clusters if len(set(members)) > 1]
+
+    batches = []
+    batch = []
+    for members in clusters:
+        if batch and sum(len(m) for m in batch) + len(members) > batch_size:
+            batches.append(batch)
+            batch = []
+        batch.append(members)
+    if batch:
+        batches.append(batch)
+
+    result = {'clusters': 0, 'removed': 0}
+    primary_ids = set()
+    removed_keys = set()
+    done = 0
+    with deferred_duplicate_keys():
+        for batch in batches:
+            with transaction.atomic():
+                removed, primaries, keys = _merge_batch(batch, rule)
+            result['removed'] += len(removed)
+            result['clusters'] += len(primaries)
+            primary_ids.update(primaries)
+            removed_keys |= keys
+            done += len(batch)
+            if progress:
+                progress(done, len(clusters))
+
+    if primary_ids:
+        sync_duplicate_keys(primary_ids)
+        refresh_shared(removed_keys)
+        models_bulk_changed.send(sender=Contact)
+        models_bulk_changed.send(sender=Action)
+    return result
@@ -0,0 +1,165 @@
+"""
+Поиск людей по ФИО и нику через нормализованную колонку Contact.search_text.
+
+Каждое слово запроса должно встречаться в строке поиска (порядок не важен), результаты
+ранжируются: сначала совпадение с начала фамилии, затем с начала любого слова, затем
+вхождение в середине слова.
+
+Индексы создаёт manage.py setup_contact_search:
+PostgreSQL — GIN-индекс pg_trgm по search_text, его использует LIKE '%слово%';
+SQLite     — таблица FTS5 с токенизатором trigram, синхронизируемая триггерами.
+Без индекса поиск работает тем же LIKE, только полным просмотром таблицы.
+
+Людей, сохранённых до появления колонки, после каждого migrate дозаполняет
+post_migrate — иначе после выкладки поиск не находил бы их до setup_contact_search.
+"""
+from django.apps import apps
+from django.db import connections
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_migrate
+
+from .models import CONTACT_SEARCH_FIELDS, Contact, normalize_search_text
+
+FTS_TABLE = 'event_contact_search'
+TRGM_INDEX = 'event_contact_search_trgm'
+# Токенизатор trigram находит только подстроки от трёх символов
+FTS_MIN_WORD = 3
+
+_fts_available = {}
+
+
+def _sqlite_fts_available(alias):
+    if alias not in _fts_available:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE]
+            )
+            _fts_available[alias] = cursor.fetchone() is not None
+    return _fts_available[alias]
+
+
+def reset_search_backend_cache():
+    _fts_available.clear()
+
+
+def _fts_query(words):
+    return ' AND '.join('"{}"'.format(word.replace('"', '""')) for word in words)
+
+
+def _filter_words(queryset, words):
+    alias = queryset.db
+    if (
+        connections[alias].vendor == 'sqlite'
+        and all(len(word) >= FTS_MIN_WORD for word in words)
+        and _sqlite_fts_available(alias)
+    ):
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [_fts_query(words)]
+        ))
+    for word in words:
+        queryset = queryset.filter(search_text__contains=word)
+    return queryset
+
+
+def search_contacts(term, queryset=None):
+    """
+    Люди, подходящие под term, по убыванию релевантности (поле search_rank).
+    queryset — ограничить поиск (например, исключить уже зарегистрированных).
+    """
+    if queryset is None:
+        queryset = Contact.objects.all()
+    words = normalize_search_text(term).split()
+    if not words:
+        return queryset.none()
+
+    first = words[0]
+    rank = Case(
+        When(search_text__startswith=first, then=Value(0)),
+        When(search_text__contains=' ' + first, then=Value(1)),
+        default=Value(2),
+        output_field=IntegerField(),
+    )
+    return (
+        _filter_words(queryset, words)
+        .annotate(search_rank=rank)
+        .order_by('search_rank', 'last_name', 'first_name', 'pk')
+    )
+
+
+def rebuild_search_text(batch_size=1000, only_missing=False, using='default'):
+    """
+    Заполняет search_text у людей, где он устарел; возвращает число обновлённых.
+    only_missing — только пустые строки поиска (без полного просмотра таблицы).
+    """
+    manager = Contact.objects.db_manager(using)
+    fields = ('pk', 'search_text') + tuple(CONTACT_SEARCH_FIELDS)
+    contacts = manager.only(*fields).order_by('pk')
+    if only_missing:
+        contacts = contacts.filter(search_text='')
+    changed = []
+    updated = 0
+    for contact in contacts.iterator(chunk_size=batch_size):
+        text = contact.build_search_text()
+        if contact.search_text != text:
+            contact.search_text = text
+            changed.append(contact)
+        if len(changed) >= batch_size:
+            updated += manager.bulk_update(changed, ['search_text'])
+            changed = []
+    if changed:
+        updated += manager.bulk_update(changed, ['search_text'])
+    return updated
+
+
+def _backfill_after_migrate(using='default', **kwargs):
+    connection = connections[using]
+    table = Contact._meta.db_table
+    with connection.cursor() as cursor:
+        # migrate до более ранней миграции: таблицы или колонки может ещё не быть
+        if table not in connection.introspection.table_names(cursor):
+            return
+        columns = {column.name for column in connection.introspection.get_table_description(cursor, table)}
+    if 'search_text' in columns:
+        rebuild_search_text(only_missing=True, using=using)
+
+
+_SQLITE_FTS_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"search_text, content='event_contact', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON event_contact BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON event_contact BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF search_text ON event_contact BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+    f"INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text); END",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+)
+
+_POSTGRES_TRGM_SQL = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    f'CREATE INDEX IF NOT EXISTS {TRGM_INDEX} ON event_contact USING gin (search_text gin_trgm_ops)',
+)
+
+
+def create_search_index(alias='default'):
+    """Создаёт индекс поиска для текущей БД; возвращает его описание или None."""
+    connection = connections[alias]
+    if connection.vendor == 'postgresql':
+        statements, description = _POSTGRES_TRGM_SQL, f'pg_trgm GIN {TRGM_INDEX}'
+    elif connection.vendor == 'sqlite':
+        statements, description = _SQLITE_FTS_SQL, f'FTS5 {FTS_TABLE}'
+    else:
+        return None
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    reset_search_backend_cache()
+    return description
+
+
+def connect_signals():
+    post_migrate.connect(
+        _backfill_after_migrate, sender=apps.get_app_config('event'), dispatch_uid='event_contact_search_backfill'
+    )
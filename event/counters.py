@@ -0,0 +1,154 @@
+"""
+Поддержка EventStatusCounter — счётчиков статусов по мероприятию.
+
+Счётчики меняются F()-выражениями в той же транзакции, что и сохранение/удаление Action
+(сигналы post_save/post_delete; прежнее состояние log_action_status_change читает
+под блокировкой строки — два параллельных save() одной записи не применят дельту
+от одного и того же прежнего статуса).
+Массовые операции без сигналов (bulk_create, update) должны вызывать rebuild_event_counters.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.signals import post_delete, post_save
+
+from .live import publish_action_changes, publish_reload
+from .models import STATUS_MODEL, Action, EventStatusCounter, ModuleInstance
+
+STATUS_FIELDS = tuple(key for key, _ in STATUS_MODEL)
+COUNTER_FIELDS = STATUS_FIELDS + ('guests',)
+# Гостем считается человек с согласованным участием или чекином
+GUEST_STATUSES = ('registered', 'visited')
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def _contribution(event_id, action_type, contact_id):
+    """Вклад одной записи Action в счётчики её мероприятия."""
+    fields = {}
+    if event_id is None:
+        return fields
+    if action_type in STATUS_FIELDS:
+        fields[action_type] = 1
+    # Пара (contact, event) уникальна, поэтому число таких записей = число уникальных гостей
+    if action_type in GUEST_STATUSES and contact_id is not None:
+        fields['guests'] = 1
+    return fields
+
+
+def _apply(deltas, create_missing=True):
+    for event_id, fields in deltas.items():
+        changes = {name: F(name) + value for name, value in fields.items() if value}
+        if not changes:
+            continue
+        updated = EventStatusCounter.objects.filter(event_id=event_id).update(**changes)
+        if not updated and create_missing:
+            # Строки ещё нет (мероприятие создано до появления счётчиков) — пересчитываем целиком
+            rebuild_event_counters([event_id])
+
+
+def apply_action_changes(changes, create_missing=True):
+    """
+    changes — пары (old_state, new_state); по одному UPDATE на мероприятие.
+    После фиксации транзакции изменения уходят в живой канал мероприятия (event/live.py).
+    """
+    changes = list(changes)
+    publish_action_changes(changes)
+    deltas = defaultdict(lambda: defaultdict(int))
+    for old_state, new_state in changes:
+        if old_state:
+            for name, value in _contribution(*old_state).items():
+                deltas[old_state[0]][name] -= value
+        if new_state:
+            for name, value in _contribution(*new_state).items():
+                deltas[new_state[0]][name] += value
+    _apply(deltas, create_missing=create_missing)
+
+
+def apply_action_change(old_state, new_state, create_missing=True):
+    """old_state/new_state — (event_id, action_type, contact_id) или None."""
+    apply_action_changes([(old_state, new_state)], create_missing=create_missing)
+
+
+def counter_aggregates():
+    aggregates = {
+        name: Count('id', filter=Q(action_type=name))
+        for name in STATUS_FIELDS
+    }
+    aggregates['guests'] = Count(
+        'contact', filter=Q(action_type__in=GUEST_STATUSES), distinct=True
+    )
+    return aggregates
+
+
+def rebuild_event_counters(event_ids=None):
+    """Пересчитывает счётчики по таблице Action. event_ids=None — все мероприятия."""
+    events = ModuleInstance.objects.order_by('pk')
+    if event_ids is not None:
+        events = events.filter(pk__in=list(event_ids))
+    ids = list(events.values_list('pk', flat=True))
+
+    total = 0
+    for start in range(0, len(ids), REBUILD_BATCH_SIZE):
+        batch = ids[start:start + REBUILD_BATCH_SIZE]
+        rows = (
+            Action.objects.filter(event_id__in=batch)
+            .order_by()
+            .values('event_id')
+            .annotate(**counter_aggregates())
+        )
+        by_event = {row['event_id']: row for row in rows}
+        counters = [
+            EventStatusCounter(
+                event_id=pk,
+                **{name: by_event.get(pk, {}).get(name, 0) for name in COUNTER_FIELDS}
+            )
+            for pk in batch
+        ]
+        with transaction.atomic():
+            EventStatusCounter.objects.filter(event_id__in=batch).delete()
+            EventStatusCounter.objects.bulk_create(counters)
+        total += len(batch)
+    if event_ids is not None:
+        publish_reload(ids)
+    return total
+
+
+def get_event_counter(event):
+    """Счётчики мероприятия; если строки нет — пустой (нулевой) объект без запроса на запись."""
+    try:
+        return event.status_counter
+    except EventStatusCounter.DoesNotExist:
+        return EventStatusCounter(event_id=event.pk)
+
+
+def _action_saved(sender, instance, created, update_fields=None, **kwargs):
+    written = Action.written_attnames(update_fields)
+    if not created and written is not None and written.isdisjoint(Action.TRACKED_FIELDS):
+        return
+    old_state = None if created else getattr(instance, '_counter_state', None)
+    new_state = (instance.event_id, instance.action_type, instance.contact_id)
+    if old_state == new_state:
+        return
+    apply_action_change(old_state, new_state)
+
+
+def _action_deleted(sender, instance, **kwargs):
+    # При каскадном удалении мероприятия строка счётчика уже удалена — не пересоздаём её
+    apply_action_change(
+        (instance.event_id, instance.action_type, instance.contact_id),
+        None,
+        create_missing=False,
+    )
+
+
+def _event_saved(sender, instance, created, **kwargs):
+    if created:
+        EventStatusCounter.objects.get_or_create(event=instance)
+
+
+def connect_signals():
+    post_save.connect(_action_saved, sender=Action, dispatch_uid='event_counters_action_save')
+    post_delete.connect(_action_deleted, sender=Action, dispatch_uid='event_counters_action_delete')
+    post_save.connect(_event_saved, sender=ModuleInstance, dispatch_uid='event_counters_event_save')
@@ -0,0 +1,166 @@
+"""
+Фоновые выгрузки: задание ExportJob создаётся в запросе, файл строит отдельный процесс
+(manage.py run_export_worker), который опрашивает таблицу заданий — брокер не нужен.
+
+Задание захватывается условным UPDATE (status='pending' -> 'running'), поэтому
+несколько воркеров не возьмут одно задание дважды. update_date служит «пульсом»:
+задание в статусе running без обновлений дольше STALE_JOB_MINUTES возвращается в очередь.
+
+Выгрузка «всех записей списка» из админки хранит не id, а строку фильтров списка:
+воркер повторяет фильтры от имени автора задания, выборка остаётся подзапросом.
+"""
+import logging
+import tempfile
+import time
+import traceback
+from datetime import timedelta
+
+from django.contrib import admin
+from django.core.files import File
+from django.http import HttpRequest, QueryDict
+from django.urls import reverse
+from django.utils import timezone
+
+from .export_stream import EXPORT_FORMATS, write_csv, write_xlsx
+from .models import Action, Contact, ExportJob
+from .resources import ActionExport, ContactExport
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 2
+STALE_JOB_MINUTES = 30
+
+
+def _contacts_queryset():
+    return Contact.objects.select_related('company', 'category', 'type_guest', 'producer')
+
+
+EXPORT_JOB_SOURCES = {
+    'actions': (ActionExport, Action.objects.all),
+    'contacts': (ContactExport, _contacts_queryset),
+}
+
+
+def create_export_job(user, dataset, file_format='xlsx', object_ids=None, filters=None):
+    """
+    Ставит выгрузку в очередь. object_ids — ограничить выгрузку выбранными записями,
+    filters — строка запроса списка админки, фильтры которого повторить.
+    """
+    if dataset not in EXPORT_JOB_SOURCES:
+        raise ValueError(f'Неизвестный набор данных: {dataset}')
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f'Неизвестный формат выгрузки: {file_format}')
+    return ExportJob.objects.create(
+        dataset=dataset,
+        file_format=file_format,
+        object_ids=list(object_ids) if object_ids is not None else None,
+        filters=filters,
+        create_user=user if user and user.is_authenticated else None,
+    )
+
+
+def _changelist_queryset(model, job):
+    """Выборка списка админки с сохранёнными фильтрами, поиском и ограничениями доступа автора."""
+    if job.create_user is None:
+        raise ValueError('Автор выгрузки удалён: фильтры списка не применить')
+    model_admin = admin.site._registry[model]
+    request = HttpRequest()
+    request.method = 'GET'
+    request.path = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+    request.GET = QueryDict(job.filters)
+    request.user = job.create_user
+    return model_admin.get_changelist_instance(request).get_queryset(request)
+
+
+def job_queryset(job):
+    _, queryset_factory = EXPORT_JOB_SOURCES[job.dataset]
+    qs = queryset_factory()
+    if job.filters is not None:
+        qs = qs.filter(pk__in=_changelist_queryset(qs.model, job).order_by().values('pk'))
+    if job.object_ids is not None:
+        qs = qs.filter(pk__in=job.object_ids)
+    return qs
+
+
+def serialize_export_job(job):
+    return {
+        'id': job.pk,
+        'dataset': job.dataset,
+        'file_format': job.file_format,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'rows_total': job.rows_total,
+        'rows_done': job.rows_done,
+        'progress': job.progress,
+        'error': job.error if job.status == 'failed' else None,
+        'status_url': reverse('export_job_status', args=[job.pk]),
+        'download_url': reverse('export_job_download', args=[job.pk]) if job.status == 'done' else None,
+    }
+
+
+def requeue_stale_jobs():
+    threshold = timezone.now() - timedelta(minutes=STALE_JOB_MINUTES)
+    return ExportJob.objects.filter(status='running', update_date__lt=threshold).update(
+        status='pending', update_date=timezone.now()
+    )
+
+
+def claim_next_job():
+    """Захватывает самое старое задание из очереди; None, если очередь пуста."""
+    candidates = ExportJob.objects.filter(status='pending').order_by('create_date', 'pk')
+    for pk in candidates.values_list('pk', flat=True)[:10]:
+        now = timezone.now()
+        claimed = ExportJob.objects.filter(pk=pk, status='pending').update(
+            status='running', started_at=now, update_date=now, rows_done=0, error=None
+        )
+        if claimed:
+            return ExportJob.objects.get(pk=pk)
+    return None
+
+
+def _report_progress(job):
+    def progress(rows_done):
+        ExportJob.objects.filter(pk=job.pk).update(rows_done=rows_done, update_date=timezone.now())
+    return progress
+
+
+def run_export_job(job):
+    """Строит файл выгрузки и сохраняет его в job.file."""
+    resource_class, _ = EXPORT_JOB_SOURCES[job.dataset]
+    try:
+        qs = job_queryset(job)
+        job.rows_total = qs.count()
+        job.save(update_fields=['rows_total', 'update_date'])
+
+        writer = write_csv if job.file_format == 'csv' else write_xlsx
+        with tempfile.TemporaryFile() as output:
+            writer(resource_class(), qs, output, progress=_report_progress(job))
+            output.seek(0)
+            job.file.save(job.download_name, File(output), save=False)
+
+        job.refresh_from_db(fields=['rows_done'])
+        job.status = 'done'
+        job.finished_at = timezone.now()
+        job.save(update_fields=['file', 'status', 'finished_at', 'update_date'])
+    except Exception:
+        logger.exception('Ошибка фоновой выгрузки #%s', job.pk)
+        job.status = 'failed'
+        job.error = traceback.format_exc()
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at', 'update_date'])
+    return job
+
+
+def run_worker(poll_interval=POLL_INTERVAL, once=False, stdout=None):
+    """Цикл воркера: берёт задания по одному; once=True — обработать очередь и выйти."""
+    while True:
+        requeue_stale_jobs()
+        job = claim_next_job()
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        run_export_job(job)
+        if stdout:
+            stdout.write(f'{job}: {job.rows_done} строк')
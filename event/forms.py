@@ -10,6 +10,7 @@ from .models import (
     TypeGuestContact,
 )
 from .contact_merge import format_contact_merge_label
+from .access import ROLE_MANAGER, has_role
 
 class CheckinOrCancelForm(forms.Form):
     _selected_action = forms.CharField(widget=forms.MultipleHiddenInput)
@@ -132,7 +133,7 @@ class ModuleInstanceForm(forms.ModelForm):
         # Если объект ещё не создан (нет pk) → это создание, а не редактирование
         if not self.instance.pk and self.request:
             # Проверяем, состоит ли пользователь в группе «Менеджер»
-            if self.request.user.groups.filter(name='Менеджер').exists():
+            if has_role(self.request.user, ROLE_MANAGER):
                 # Если прокси-модель без AUTH_USER_MODEL:
                 # Преобразуем request.user → CustomUser
                 custom_user = CustomUser.objects.get(pk=self.request.user.pk)
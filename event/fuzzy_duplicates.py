@@ -0,0 +1,181 @@
+"""
+Нечёткий поиск дублей людей: опечатки при импорте, женская/мужская форма фамилии,
+запись латиницей («Иванова»/«Иванов», «Ivanov»/«Иванов»).
+
+Сравнивать всех со всеми — O(n²), поэтому люди сначала раскладываются по блокам:
+начало фамилии в фонетической записи + первая буква имени, и ещё раз по «скелету»
+фамилии (первая буква и согласные) — так ловятся опечатки в гласных. Пары внутри
+блоков оцениваются по сходству строк (difflib), пары выше порога сохраняются
+в DuplicateCandidatePair для проверки в админке. Тёзки с явно разными отчествами
+(«Иван Петрович» и «Иван Сергеевич») дублями не считаются.
+
+Запуск: manage.py find_fuzzy_duplicates.
+"""
+from collections import defaultdict
+from difflib import SequenceMatcher
+from itertools import combinations
+
+from django.db import transaction
+
+from .models import Contact, DuplicateCandidatePair
+
+DEFAULT_THRESHOLD = 0.85
+BLOCK_PREFIX = 4
+# Блоки крупнее делятся по более длинному началу фамилии
+MAX_BLOCK_SIZE = 1000
+WRITE_BATCH_SIZE = 1000
+# Отчества с опечаткой похожи больше чем на 0.9, разные отчества — меньше 0.8
+MIDDLE_NAME_MIN = 0.85
+
+# Латинские сочетания -> общие коды (цифры — звуки без однобуквенной латинской записи)
+_LATIN_REPLACEMENTS = (
+    ('shch', '1'), ('sch', '1'), ('sh', '1'), ('ch', '2'), ('zh', '3'),
+    ('ts', '4'), ('tz', '4'), ('kh', 'h'), ('ph', 'f'), ('ck', 'k'),
+    ('yu', 'iu'), ('ju', 'iu'), ('ya', 'ia'), ('ja', 'ia'), ('yo', 'e'), ('ye', 'e'),
+    ('x', 'ks'), ('w', 'v'), ('y', 'i'), ('j', 'i'), ('q', 'k'), ('c', 'k'),
+)
+_CYRILLIC = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': '3',
+    'з': 'z', 'и': 'i', 'й': 'i', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': '4',
+    'ч': '2', 'ш': '1', 'щ': '1', 'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'iu',
+    'я': 'ia',
+}
+_VOWELS = set('aeiou')
+
+
+def phonetic(value):
+    """Фонетическая запись: кириллица и латиница приводятся к одному алфавиту, повторы схлопываются."""
+    text = str(value or '').lower()
+    for latin, code in _LATIN_REPLACEMENTS:
+        text = text.replace(latin, code)
+    text = ''.join(_CYRILLIC.get(char, char) for char in text)
+    result = []
+    for char in text:
+        if (char.isascii() and char.isalnum()) and (not result or result[-1] != char):
+            result.append(char)
+    return ''.join(result)
+
+
+def skeleton(value):
+    """Первая буква и согласные фонетической записи."""
+    return value[:1] + ''.join(char for char in value[1:] if char not in _VOWELS)
+
+
+def similarity(a, b):
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+class _Person:
+    __slots__ = ('pk', 'last', 'first', 'middle')
+
+    def __init__(self, pk, last_name, first_name, middle_name):
+        self.pk = pk
+        self.last = phonetic(last_name)
+        self.first = phonetic(first_name)
+        self.middle = phonetic(middle_name)
+
+
+def _blocking_keys(person):
+    initial = person.first[:1]
+    yield ('p', person.last[:BLOCK_PREFIX], initial)
+    yield ('s', skeleton(person.last)[:BLOCK_PREFIX], initial)
+
+
+def _split_block(people, depth=BLOCK_PREFIX):
+    """Слишком большой блок делится по более длинному началу фамилии."""
+    if len(people) <= MAX_BLOCK_SIZE or depth >= 12:
+        return [people]
+    groups = defaultdict(list)
+    for person in people:
+        groups[person.last[:depth + 2]].append(person)
+    result = []
+    for group in groups.values():
+        result.extend(_split_block(group, depth + 2))
+    return result
+
+
+def score_pair(a, b, threshold=0.0):
+    """(оценка, пояснение) или None, если пара заведомо ниже порога."""
+    # Даже при полном совпадении имени и отчества итог не выше порога, если сходство
+    # фамилий меньше 2·threshold − 1; быстрые верхние оценки difflib отсекают такие пары
+    minimum = 2 * threshold - 1
+    matcher = SequenceMatcher(None, a.last, b.last)
+    if matcher.real_quick_ratio() < minimum or matcher.quick_ratio() < minimum:
+        return None
+
+    last = 1.0 if a.last == b.last else matcher.ratio()
+    first = similarity(a.first, b.first)
+    parts = [(0.5, last), (0.35, first)]
+    reasons = [f'фамилия {last:.0%}', f'имя {first:.0%}']
+    if a.middle and b.middle:
+        middle = similarity(a.middle, b.middle)
+        if middle < MIDDLE_NAME_MIN:
+            # Оба отчества указаны и различаются — это тёзки, а не дубль
+            return None
+        parts.append((0.15, middle))
+        reasons.append(f'отчество {middle:.0%}')
+    score = sum(weight * value for weight, value in parts) / sum(weight for weight, _ in parts)
+    return round(score, 4), ', '.join(reasons)
+
+
+def find_candidate_pairs(threshold=DEFAULT_THRESHOLD, queryset=None):
+    """{(pk_a, pk_b): (score, reasons)} для пар с оценкой не ниже threshold; pk_a < pk_b."""
+    if queryset is None:
+        queryset = Contact.objects.all()
+    blocks = defaultdict(list)
+    rows = queryset.order_by('pk').values_list('pk', 'last_name', 'first_name', 'middle_name')
+    for row in rows.iterator(chunk_size=5000):
+        person = _Person(*row)
+        if not person.last or not person.first:
+            continue
+        for key in _blocking_keys(person):
+            blocks[key].append(person)
+
+    pairs = {}
+    for block in blocks.values():
+        if len(block) < 2:
+            continue
+        for group in _split_block(block):
+            for a, b in combinations(group, 2):
+                key = (a.pk, b.pk) if a.pk < b.pk else (b.pk, a.pk)
+                if key in pairs:
+                    continue
+                scored = score_pair(a, b, threshold)
+                if scored and scored[0] >= threshold:
+                    pairs[key] = scored
+    return pairs
+
+
+@transaction.atomic
+def save_candidate_pairs(pairs):
+    """
+    Сохраняет найденные пары. Пары, отклонённые при проверке (dismissed), сохраняют статус;
+    непроверенные пары, которых больше нет в результате, удаляются.
+    Возвращает (создано, обновлено, удалено).
+    """
+    existing = {
+        (a, b): (pk, status)
+        for pk, a, b, status in DuplicateCandidatePair.objects.values_list(
+            'pk', 'contact_a_id', 'contact_b_id', 'status'
+        )
+    }
+    to_create = []
+    to_update = []
+    for (a, b), (score, reasons) in pairs.items():
+        if (a, b) in existing:
+            pk, _ = existing[(a, b)]
+            to_update.append(DuplicateCandidatePair(pk=pk, score=score, reasons=reasons))
+        else:
+            to_create.append(DuplicateCandidatePair(contact_a_id=a, contact_b_id=b, score=score, reasons=reasons))
+
+    stale = [pk for key, (pk, status) in existing.items() if key not in pairs and status == 'new']
+    DuplicateCandidatePair.objects.bulk_create(to_create, batch_size=WRITE_BATCH_SIZE, ignore_conflicts=True)
+    DuplicateCandidatePair.objects.bulk_update(to_update, ['score', 'reasons'], batch_size=WRITE_BATCH_SIZE)
+    for start in range(0, len(stale), WRITE_BATCH_SIZE):
+        DuplicateCandidatePair.objects.filter(pk__in=stale[start:start + WRITE_BATCH_SIZE]).delete()
+    return len(to_create), len(to_update), len(stale)
@@ -0,0 +1,364 @@
+"""
+Живой канал мероприятия: Server-Sent Events со счётчиками и сменами статусов.
+
+Менеджеры и модераторы на входе раньше опрашивали events-list и ActionView.get,
+и каждый опрос заново сериализовал весь список гостей. Теперь изменения статусов
+(все пути записи проходят через counters.apply_action_changes) после фиксации
+транзакции публикуются в канал мероприятия: одно сообщение — актуальные счётчики
+и список изменений {'contact_id', 'old_type', 'action_type'} (пара человек/мероприятие
+уникальна). Массовые пересчёты (rebuild_event_counters) публикуют счётчики с reload:
+true — список гостей клиент перечитывает сам.
+
+Рассылка: сообщение кодируется в JSON один раз и кладётся в кольцевой буфер канала
+(LIVE_HISTORY последних сообщений), подписчики просыпаются по Condition и дочитывают
+буфер со своего номера. Переподключившийся EventSource присылает Last-Event-ID
+и получает пропущенное из буфера; если буфер уже ушёл вперёд или процесс другой —
+сообщение reload.
+
+LIVE_EVENTS_BACKEND (пусто — канал выключен, /events/<id>/live/ отвечает 404):
+- 'postgres' — публикация через NOTIFY, каждый процесс слушает канал фоновым потоком
+  (LISTEN) и раздаёт сообщения своим подписчикам. Открытый поток отмечает мероприятие
+  в общем кэше Django; без такой отметки публикация не читает счётчики и не шлёт NOTIFY
+  (с кэшем процесса отметку не видно другим воркерам — публикуется всегда);
+- 'local' — публикация в памяти процесса: подписчики других воркеров изменений
+  не увидят, поэтому работает только с DEBUG (runserver — один процесс).
+
+Каждое соединение держит рабочий поток сервера до LIVE_STREAM_SECONDS (затем EventSource
+переподключается сам); соединение с БД запроса закрывается до начала потока. С синхронными воркерами (gunicorn sync) несколько открытых
+дашбордов займут все воркеры — нужен сервер с лёгкими потоками (gunicorn -k gevent,
+-k gthread с --threads заметно больше LIVE_MAX_CONNECTIONS или ASGI). Сверх
+LIVE_MAX_CONNECTIONS открытых потоков на процесс новое подключение получает 503.
+Бенчмарк пути публикации: manage.py bench_live.
+"""
+import logging
+import select
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+from django.http import JsonResponse, StreamingHttpResponse
+
+from .caching import shared_cache_configured
+from .models import EventStatusCounter
+
+logger = logging.getLogger(__name__)
+
+LIVE_HISTORY = 200
+LIVE_HEARTBEAT_SECONDS = 15
+LIVE_STREAM_SECONDS = 300
+LIVE_RETRY_MS = 3000
+# Сколько канал без подписчиков продолжает копить сообщения — на время переподключения
+LIVE_IDLE_SECONDS = 60
+# Ограничение NOTIFY — 8000 байт; длинный список изменений заменяется на reload
+NOTIFY_CHANNEL = 'event_live'
+NOTIFY_MAX_BYTES = 7500
+# Отметка «мероприятие слушают» в общем кэше для бэкенда 'postgres'
+_WATCHED_KEY = 'event:live:watched:{}'
+
+_encoder = DjangoJSONEncoder()
+
+
+class _Channel:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.seq = 0
+        self.history = deque(maxlen=LIVE_HISTORY)
+        self.subscribers = 0
+        self.idle_since = None
+
+    def watched(self):
+        if self.subscribers:
+            return True
+        return self.idle_since is not None and time.monotonic() - self.idle_since < LIVE_IDLE_SECONDS
+
+
+class LiveBroker:
+    """Каналы мероприятий в памяти процесса."""
+
+    def __init__(self):
+        # Номера сообщений действительны только в этом процессе
+        self.token = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def _channel(self, event_id, create=False):
+        channel = self._channels.get(event_id)
+        if channel is None and create:
+            with self._lock:
+                channel = self._channels.setdefault(event_id, _Channel())
+        return channel
+
+    def open_streams(self):
+        return sum(channel.subscribers for channel in list(self._channels.values()))
+
+    def watched(self, event_ids):
+        """Есть ли подписчики (или недавно отключившиеся) хотя бы у одного из каналов."""
+        for event_id in event_ids:
+            channel = self._channels.get(event_id)
+            if channel is not None and channel.watched():
+                return True
+        return False
+
+    def publish(self, event_id, text):
+        """text — уже закодированный JSON; в канал, который никто не слушает, не пишется."""
+        channel = self._channel(event_id)
+        if channel is None or not channel.watched():
+            return
+        with channel.condition:
+            channel.seq += 1
+            channel.history.append((channel.seq, text))
+            channel.condition.notify_all()
+
+    def subscribe(self, event_id):
+        """Регистрирует подписчика; возвращает номер последнего сообщения канала."""
+        channel = self._channel(event_id, create=True)
+        with channel.condition:
+            channel.subscribers += 1
+            return channel.seq
+
+    def unsubscribe(self, event_id):
+        channel = self._channel(event_id)
+        with channel.condition:
+            channel.subscribers -= 1
+            if not channel.subscribers:
+                channel.idle_since = time.monotonic()
+
+    def wait(self, event_id, after, timeout):
+        """
+        Сообщения канала с номером больше after: ([(seq, text)], missed).
+        Ждёт не дольше timeout; missed — часть сообщений уже вытеснена из буфера.
+        """
+        channel = self._channel(event_id, create=True)
+        with channel.condition:
+            if channel.seq <= after:
+                channel.condition.wait(timeout)
+            if channel.seq <= after:
+                return [], False
+            oldest = channel.history[0][0]
+            messages = [item for item in channel.history if item[0] > after]
+            return messages, after < oldest - 1
+
+
+broker = LiveBroker()
+
+
+def _backend():
+    """Действующий бэкенд: 'postgres', 'local' (только с DEBUG) или '' — канал выключен."""
+    backend = getattr(settings, 'LIVE_EVENTS_BACKEND', '')
+    if backend == 'local' and not settings.DEBUG:
+        return ''
+    return backend
+
+
+def live_enabled():
+    return _backend() in ('local', 'postgres')
+
+
+def encode_message(event_id, counters, changes=(), reload=False):
+    return _encoder.encode({
+        'event': event_id,
+        'counters': counters,
+        'changes': list(changes),
+        'reload': reload,
+    })
+
+
+def read_counters(event_ids):
+    """{event_id: {поле: значение}} одним запросом."""
+    return {
+        row.pop('event_id'): row
+        for row in EventStatusCounter.objects.filter(event_id__in=list(event_ids)).values()
+    }
+
+
+def _mark_watched(event_id):
+    if shared_cache_configured():
+        # Отметка переживает отключение последнего подписчика на время переподключения
+        cache.set(_WATCHED_KEY.format(event_id), 1, LIVE_IDLE_SECONDS + LIVE_HEARTBEAT_SECONDS)
+
+
+def _watched_events(event_ids):
+    """Мероприятия, у которых есть подписчики хоть в одном процессе (для 'postgres')."""
+    if not shared_cache_configured():
+        return list(event_ids)
+    keys = {_WATCHED_KEY.format(event_id): event_id for event_id in event_ids}
+    return [keys[key] for key in cache.get_many(list(keys))]
+
+
+def _publish(changes_by_event, reload=False):
+    backend = _backend()
+    if backend == 'postgres':
+        watched = _watched_events(changes_by_event)
+        changes_by_event = {event_id: changes_by_event[event_id] for event_id in watched}
+    elif backend != 'local' or not broker.watched(changes_by_event):
+        return
+    if not changes_by_event:
+        return
+    counters = read_counters(changes_by_event)
+    for event_id, changes in changes_by_event.items():
+        if event_id not in counters:
+            continue
+        text = encode_message(event_id, counters[event_id], changes, reload)
+        if backend == 'postgres':
+            _notify(event_id, text, counters[event_id])
+        else:
+            broker.publish(event_id, text)
+
+
+def _notify(event_id, text, counters):
+    payload = f'{event_id}:{text}'
+    if len(payload.encode('utf-8')) > NOTIFY_MAX_BYTES:
+        payload = f'{event_id}:{encode_message(event_id, counters, reload=True)}'
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [NOTIFY_CHANNEL, payload])
+
+
+def publish_action_changes(changes):
+    """changes — пары (old_state, new_state) из counters; публикуются после фиксации."""
+    if not live_enabled():
+        return
+    changes_by_event = defaultdict(list)
+    for old_state, new_state in changes:
+        old_type = old_state[1] if old_state else None
+        new_type = new_state[1] if new_state else None
+        if old_state and new_state and old_state[0] == new_state[0]:
+            if old_type != new_type:
+                changes_by_event[new_state[0]].append(
+                    {'contact_id': new_state[2], 'old_type': old_type, 'action_type': new_type}
+                )
+            continue
+        # Создание, удаление или перенос в другое мероприятие
+        if old_state and old_state[0] is not None:
+            changes_by_event[old_state[0]].append(
+                {'contact_id': old_state[2], 'old_type': old_type, 'action_type': None}
+            )
+        if new_state and new_state[0] is not None:
+            changes_by_event[new_state[0]].append(
+                {'contact_id': new_state[2], 'old_type': None, 'action_type': new_type}
+            )
+    if changes_by_event:
+        transaction.on_commit(lambda: _publish(dict(changes_by_event)))
+
+
+def publish_reload(event_ids):
+    """Счётчики пересчитаны массово — подписчики перечитывают список целиком."""
+    event_ids = [event_id for event_id in event_ids if event_id is not None]
+    if event_ids and live_enabled():
+        transaction.on_commit(lambda: _publish({event_id: () for event_id in event_ids}, reload=True))
+
+
+# --- LISTEN для LIVE_EVENTS_BACKEND = 'postgres' ---
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _listen_forever():
+    while True:
+        conn = None
+        try:
+            wrapper = connections['default']
+            conn = wrapper.get_new_connection(wrapper.get_connection_params())
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {NOTIFY_CHANNEL}')
+            while True:
+                if select.select([conn], [], [], LIVE_HEARTBEAT_SECONDS) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    event_id, _, text = conn.notifies.pop(0).payload.partition(':')
+                    broker.publish(int(event_id), text)
+        except Exception:
+            logger.exception('Живой канал: соединение LISTEN потеряно, переподключение')
+            if conn is not None:
+                conn.close()
+            time.sleep(LIVE_RETRY_MS / 1000)
+
+
+def _ensure_listener():
+    global _listener
+    if _backend() != 'postgres' or _listener is not None:
+        return
+    with _listener_lock:
+        if _listener is None:
+            _listener = threading.Thread(target=_listen_forever, name='event-live-listener', daemon=True)
+            _listener.start()
+
+
+# --- Поток SSE ---
+
+def _parse_last_event_id(value):
+    """Номер сообщения из Last-Event-ID этого процесса или None."""
+    token, _, seq = (value or '').partition('-')
+    if token != broker.token:
+        return None
+    try:
+        return int(seq)
+    except ValueError:
+        return None
+
+
+def _frame(text, seq=None):
+    head = f'id: {broker.token}-{seq}\n' if seq is not None else ''
+    return f'{head}event: update\ndata: {text}\n\n'
+
+
+def stream(event_id, snapshot, last_event_id=None, duration=LIVE_STREAM_SECONDS):
+    """
+    Генератор кадров SSE. snapshot — сообщение с текущими счётчиками; оно отправляется
+    первым, если клиент подключается впервые или его Last-Event-ID уже не восстановить.
+    """
+    _ensure_listener()
+    current = broker.subscribe(event_id)
+    _mark_watched(event_id)
+    marked = time.monotonic()
+    try:
+        yield f'retry: {LIVE_RETRY_MS}\n\n'
+        after = _parse_last_event_id(last_event_id)
+        if after is None or after > current:
+            after = current
+            yield _frame(snapshot, current)
+        deadline = time.monotonic() + duration
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if time.monotonic() - marked >= LIVE_HEARTBEAT_SECONDS:
+                _mark_watched(event_id)
+                marked = time.monotonic()
+            messages, missed = broker.wait(event_id, after, min(LIVE_HEARTBEAT_SECONDS, remaining))
+            if missed:
+                yield _frame(_encoder.encode({'event': event_id, 'reload': True}))
+            if not messages:
+                yield ': ping\n\n'
+                continue
+            yield ''.join(_frame(text, seq) for seq, text in messages)
+            after = messages[-1][0]
+    finally:
+        broker.unsubscribe(event_id)
+
+
+def live_response(event_id, last_event_id=None):
+    """SSE-ответ; JsonResponse 404, если канал выключен, и 503 сверх LIVE_MAX_CONNECTIONS."""
+    if not live_enabled():
+        return JsonResponse({'error': 'Живой канал выключен'}, status=404)
+    if broker.open_streams() >= getattr(settings, 'LIVE_MAX_CONNECTIONS', 20):
+        response = JsonResponse({'error': 'Слишком много подключений, обновляйте список вручную'}, status=503)
+        response['Retry-After'] = str(LIVE_RETRY_MS // 1000)
+        return response
+    counters = read_counters([event_id]).get(event_id) or {}
+    snapshot = encode_message(event_id, counters, reload=last_event_id is not None)
+    if not connection.in_atomic_block:
+        # Поток живёт минутами и к БД не обращается — соединение запроса не держим
+        connection.close()
+    response = StreamingHttpResponse(stream(event_id, snapshot, last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx не должен буферизовать поток
+    response['X-Accel-Buffering'] = 'no'
+    return response
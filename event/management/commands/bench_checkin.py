@@ -0,0 +1,87 @@
+import json
+import time
+
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from config.views import ActionView, CheckinView
+from event.access import ROLE_CHECKER, can_access_event
+from event.models import Action, CategoryContact, CompanyContact, Contact, CustomUser, ModuleInstance
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Сравнивает число запросов и время одного скана на входе: save() и быстрый чекин (event/checkin.py)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scans', type=int, default=200, help='Сколько сканов в каждом прогоне')
+
+    def handle(self, *args, **options):
+        # Данные создаются во временной транзакции и откатываются после замеров
+        try:
+            with transaction.atomic():
+                self._run(options['scans'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, scans):
+        checker = CustomUser.objects.create_user(phone='+79990000000', password=None, first_name='Bench')
+        checker.groups.add(Group.objects.get_or_create(name=ROLE_CHECKER)[0])
+        event = ModuleInstance.objects.create(name='bench_checkin', is_visible=True, date_start=timezone.now())
+        event.checkers.add(checker)
+        company = CompanyContact.objects.create(name='bench_checkin company')
+        category = CategoryContact.objects.create(name='bench_checkin category')
+        actions = [
+            Action.objects.create(
+                event=event,
+                action_type='registered',
+                contact=Contact.objects.create(
+                    last_name=f'Bench{i}', first_name='Checkin', company=company, category=category,
+                ),
+            )
+            for i in range(scans)
+        ]
+        factory = RequestFactory()
+
+        def request(data):
+            req = factory.post('/', json.dumps(data), content_type='application/json')
+            # Свежий пользователь на каждый скан: роли кэшируются только в рамках запроса
+            req.user = CustomUser.objects.get(pk=checker.pk)
+            return req
+
+        def legacy(action_id, action_type):
+            # Прежний путь: чтение, проверка доступа, save() с сигналами, полная сериализация
+            user = CustomUser.objects.get(pk=checker.pk)
+            action = Action.objects.get(pk=action_id)
+            can_access_event(user, action.event_id)
+            action.action_type = action_type
+            action.update_user = user
+            action.save()
+            ActionView()._serialize_action(action)
+
+        cases = [
+            ('save() + сериализация', legacy),
+            ('ActionView.post', lambda pk, status: ActionView().post(request({'action_id': pk, 'action_type': status}))),
+            ('быстрый чекин', lambda pk, status: CheckinView().post(request({'action_id': pk, 'action_type': status}))),
+        ]
+        status = 'registered'
+        for title, scan in cases:
+            status = 'visited' if status == 'registered' else 'registered'
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                for action in actions:
+                    scan(action.pk, status)
+                elapsed = time.perf_counter() - started
+            # Получение пользователя — работа middleware, в запросы скана не входит
+            per_scan = len(ctx.captured_queries) / scans - 1
+            self.stdout.write(
+                f'{title:<24} запросов на скан: {per_scan:>5.1f}  среднее время: {elapsed / scans * 1000:.2f} мс'
+            )
@@ -0,0 +1,112 @@
+import json
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from event import live
+from event.counters import rebuild_event_counters
+from event.models import ModuleInstance
+
+
+class Command(BaseCommand):
+    help = (
+        "Путь публикации живого канала мероприятия (event/live.py): фиксация транзакции -> чтение "
+        "счётчиков -> рассылка (память процесса или NOTIFY/LISTEN) -> кадры SSE у множества подписчиков"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=200, help='Сколько подписчиков')
+        parser.add_argument('--messages', type=int, default=100, help='Сколько сообщений опубликовать')
+        parser.add_argument('--interval', type=float, default=0.01, help='Пауза между сообщениями, секунд')
+        parser.add_argument(
+            '--backend', choices=('local', 'postgres'),
+            help='Бэкенд рассылки (по умолчанию LIVE_EVENTS_BACKEND; local в бенчмарке работает и без DEBUG)',
+        )
+
+    def handle(self, *args, **options):
+        backend = options['backend'] or live._backend() or 'local'
+        overrides = {'LIVE_EVENTS_BACKEND': backend}
+        if backend == 'local':
+            # Бенчмарк — один процесс: ограничение 'local' только для DEBUG здесь не нужно
+            overrides['DEBUG'] = True
+        # Сообщения NOTIFY доставляются только после фиксации, поэтому мероприятие
+        # создаётся по-настоящему и удаляется после замеров
+        event = ModuleInstance.objects.create(name='bench_live', date_start=timezone.now())
+        try:
+            rebuild_event_counters([event.pk])
+            with override_settings(**overrides):
+                self._run(event.pk, backend, options)
+        finally:
+            event.delete()
+
+    def _run(self, event_id, backend, options):
+        subscribers = options['subscribers']
+        messages = options['messages']
+        ready = threading.Barrier(subscribers + 1)
+        started = {}
+        latencies = []
+        received = []
+        lock = threading.Lock()
+
+        def subscriber():
+            # Тот же генератор кадров, что отдаёт SSE-представление: учитывается и разбор буфера
+            frames = live.stream(event_id, live.encode_message(event_id, {}), duration=3600)
+            next(frames)
+            ready.wait()
+            own = []
+            try:
+                for frame in frames:
+                    arrived = time.perf_counter()
+                    for line in frame.splitlines():
+                        if not line.startswith('data: '):
+                            continue
+                        for change in json.loads(line[6:]).get('changes', ()):
+                            own.append(arrived - started[change['contact_id']])
+                    if len(own) >= messages:
+                        break
+            finally:
+                frames.close()
+            with lock:
+                latencies.extend(own)
+                received.append(len(own))
+
+        threads = [threading.Thread(target=subscriber, daemon=True) for _ in range(subscribers)]
+        for thread in threads:
+            thread.start()
+        ready.wait()
+        if backend == 'postgres':
+            # LISTEN запускается первым подписчиком; даём ему подключиться
+            time.sleep(1)
+
+        publish_time = 0.0
+        for index in range(messages):
+            old_type, new_type = ('registered', 'visited') if index % 2 else ('visited', 'registered')
+            started[index] = time.perf_counter()
+            # Как после записи статуса: публикация ставится в on_commit и выполняется при фиксации
+            with transaction.atomic():
+                live.publish_action_changes([((event_id, old_type, index), (event_id, new_type, index))])
+            publish_time += time.perf_counter() - started[index]
+            time.sleep(options['interval'])
+
+        deadline = time.monotonic() + 10
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+        delivered = sum(received)
+        self.stdout.write(f'бэкенд: {backend}  подписчиков: {subscribers}  сообщений: {messages}')
+        self.stdout.write(f'доставлено: {delivered} из {subscribers * messages}')
+        self.stdout.write(
+            f'публикация (фиксация, счётчики, рассылка): {publish_time / messages * 1000:.3f} мс на сообщение'
+        )
+        if latencies:
+            latencies.sort()
+            quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+            self.stdout.write(
+                f'задержка доставки, мс: p50 {quantiles[49] * 1000:.2f}  p95 {quantiles[94] * 1000:.2f}  '
+                f'p99 {quantiles[98] * 1000:.2f}  max {latencies[-1] * 1000:.2f}'
+            )
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from event.fuzzy_duplicates import DEFAULT_THRESHOLD, find_candidate_pairs, save_candidate_pairs
+
+
+class Command(BaseCommand):
+    help = "Ищет похожих людей (опечатки, транслитерация) и сохраняет пары для проверки в админке"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Минимальное сходство (0..1)')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать пары, ничего не сохранять')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        pairs = find_candidate_pairs(threshold=options['threshold'])
+        self.stdout.write(f'Найдено пар: {len(pairs)} за {time.monotonic() - started:.1f} с')
+        if options['dry_run']:
+            return
+        created, updated, removed = save_candidate_pairs(pairs)
+        self.stdout.write(self.style.SUCCESS(
+            f'Новых пар: {created}, обновлено: {updated}, снято с проверки: {removed}'
+        ))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from event.contact_duplicates import KEY_KINDS
+from event.contact_merge import (
+    BULK_MERGE_BATCH_SIZE,
+    CLUSTER_KINDS,
+    DEFAULT_PRIMARY_RULE,
+    PRIMARY_RULES,
+    duplicate_clusters,
+    merge_duplicate_clusters,
+)
+
+
+class Command(BaseCommand):
+    help = "Объединяет все группы предположительных дублей людей (по общим ключам ContactDuplicateKey)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rule', choices=sorted(PRIMARY_RULES), default=DEFAULT_PRIMARY_RULE,
+            help='Как выбрать основную запись группы',
+        )
+        parser.add_argument(
+            '--kinds', nargs='+', choices=KEY_KINDS, default=list(CLUSTER_KINDS),
+            help='Ключи, по которым люди считаются одной группой',
+        )
+        parser.add_argument('--batch-size', type=int, default=BULK_MERGE_BATCH_SIZE, help='Карточек в одной транзакции')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать число групп')
+
+    def handle(self, *args, **options):
+        clusters, skipped = duplicate_clusters(kinds=options['kinds'])
+        total = sum(len(members) for members in clusters)
+        self.stdout.write(
+            f'Групп: {len(clusters)}, карточек в них: {total}, пропущено групп с несовпадающими отчествами: {skipped}'
+        )
+        if options['dry_run'] or not clusters:
+            return
+
+        def progress(done, count):
+            self.stdout.write(f'  {done} / {count}')
+
+        result = merge_duplicate_clusters(
+            clusters, rule=options['rule'], batch_size=options['batch_size'], progress=progress
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Объединено групп: {result["clusters"]}, удалено дубликатов: {result["removed"]}'
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from event.contact_duplicates import rebuild_duplicate_keys
+
+
+class Command(BaseCommand):
+    help = "Заполняет ключи поиска дублей людей (ContactDuplicateKey) по текущим данным"
+
+    def handle(self, *args, **options):
+        total = rebuild_duplicate_keys()
+        self.stdout.write(self.style.SUCCESS(f'Обработано людей: {total}'))
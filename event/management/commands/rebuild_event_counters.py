@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from event.counters import rebuild_event_counters
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики статусов мероприятий (EventStatusCounter) по таблице действий"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, action='append', dest='events', help='ID мероприятия (можно несколько раз)')
+
+    def handle(self, *args, **options):
+        total = rebuild_event_counters(options['events'])
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано мероприятий: {total}'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from event.export_jobs import POLL_INTERVAL, run_worker
+
+
+class Command(BaseCommand):
+    help = "Воркер фоновых выгрузок: опрашивает очередь ExportJob и строит файлы"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=POLL_INTERVAL, help='Пауза между опросами очереди, сек')
+        parser.add_argument('--once', action='store_true', help='Обработать текущую очередь и завершиться')
+
+    def handle(self, *args, **options):
+        run_worker(poll_interval=options['interval'], once=options['once'], stdout=self.stdout)
@@ -52,7 +52,12 @@ class Command(BaseCommand):
                             'add_typeguestcontact',
                             'change_typeguestcontact',
                             'delete_typeguestcontact',
-                            'view_typeguestcontact'],
+                            'view_typeguestcontact',
+                            'delete_exportjob',
+                            'view_exportjob',
+                            'change_duplicatecandidatepair',
+                            'delete_duplicatecandidatepair',
+                            'view_duplicatecandidatepair'],
                 'Менеджер': ['add_categorycontact',
                             'change_categorycontact',
                             'view_categorycontact',
@@ -85,7 +90,10 @@ class Command(BaseCommand):
                             'view_socialnetwork',
                             'add_typeguestcontact',
                             'change_typeguestcontact',
-                            'view_typeguestcontact'],
+                            'view_typeguestcontact',
+                            'view_exportjob',
+                            'change_duplicatecandidatepair',
+                            'view_duplicatecandidatepair'],
                 'Модератор': ['view_categorycontact',
                             'add_action',
                             'view_action',
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from event.contact_search import create_search_index, rebuild_search_text
+
+
+class Command(BaseCommand):
+    help = "Заполняет строку поиска людей (Contact.search_text) и создаёт индекс поиска (pg_trgm или SQLite FTS5)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-index', action='store_true', help='Только заполнить search_text')
+
+    def handle(self, *args, **options):
+        updated = rebuild_search_text()
+        self.stdout.write(f'Обновлена строка поиска: {updated}')
+        if options['skip_index']:
+            return
+        index = create_search_index()
+        if index:
+            self.stdout.write(self.style.SUCCESS(f'Индекс поиска: {index}'))
+        else:
+            self.stdout.write(self.style.WARNING('Для этой БД индекс не поддерживается, поиск без индекса'))
@@ -1,5 +1,8 @@
+import os
 import uuid
-from django.db import models
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
 from colorfield.fields import ColorField
 from django.core.exceptions import ValidationError
 from django.urls import reverse
@@ -24,6 +27,14 @@ STATUS_MODEL = (
     ('visited', 'Зачекинен')
 )
 
+# Поля человека, из которых строится Contact.search_text
+CONTACT_SEARCH_FIELDS = ('last_name', 'first_name', 'middle_name', 'nickname')
+
+
+def normalize_search_text(value):
+    """Строка для поиска: нижний регистр, ё -> е, пробелы схлопнуты."""
+    return ' '.join(str(value or '').lower().replace('ё', 'е').split())
+
 class CustomUserManager(BaseUserManager):
     """
     Менеджер пользователей, использующий телефон как логин (USERNAME_FIELD).
@@ -171,9 +182,18 @@ class Contact(models.Model):
     producer = models.ForeignKey('CustomUser', on_delete=models.SET_NULL, blank=True, null=True, verbose_name='Продюсер')
     comment = models.TextField(verbose_name='Комментарий', blank=True, null=True)
     photo = models.ImageField(upload_to='contacts/photos/', blank=True, null=True, verbose_name='Фото сотрудника')
+    # Нормализованные ФИО и ник для поиска (event/contact_search.py), заполняется при сохранении
+    search_text = models.TextField(blank=True, default='', editable=False, verbose_name='Строка поиска')
+    # Время последнего изменения — по нему таблицы дочитывают изменённые строки (event/sync.py)
+    updated_at = models.DateTimeField(auto_now=True, null=True, blank=True, db_index=True, verbose_name='Дата изменения')
 
     def __str__(self):
         return self.get_fio()
+
+    def build_search_text(self):
+        return normalize_search_text(' '.join(
+            getattr(self, field) or '' for field in CONTACT_SEARCH_FIELDS
+        ))
     
     def get_fio(self):
         return f'{self.last_name} {self.first_name}'
@@ -201,6 +221,13 @@ class Contact(models.Model):
     link_contact.short_description = 'Ссылка на контакт'
 
     def save(self, *args, **kwargs):
+        self.search_text = self.build_search_text()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields) | {'updated_at'}
+            if update_fields & set(CONTACT_SEARCH_FIELDS):
+                update_fields.add('search_text')
+            kwargs['update_fields'] = update_fields
         super().save(*args, **kwargs)
         if self.photo:
             img = Image.open(self.photo.path)
@@ -271,7 +298,7 @@ class Action(models.Model):
     )
     comment = models.TextField(verbose_name='Комментарий', blank=True, null=True)
     create_date = models.DateTimeField(auto_now_add=True, null=True, blank=True, verbose_name='Дата создания записи')
-    update_date = models.DateTimeField(auto_now=True, null=True, blank=True, verbose_name='Дата изменения записи')
+    update_date = models.DateTimeField(auto_now=True, null=True, blank=True, db_index=True, verbose_name='Дата изменения записи')
     create_user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='create_user', verbose_name='Кто создал')
     update_user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='update_user', verbose_name='Кто обновил')
 
@@ -298,6 +325,66 @@ class Action(models.Model):
 
     def get_action_type_display(self):
         return dict(STATUS_MODEL).get(self.action_type, self.action_type or '—')
+
+    # Значения (event_id, action_type, contact_id), загруженные или записанные этим экземпляром:
+    # по ним save() видит, что отслеживаемые поля не менялись. Прежнее состояние для аудита
+    # и счётчиков log_action_status_change всё равно читает из БД. None — значения неизвестны.
+    TRACKED_FIELDS = ('event_id', 'action_type', 'contact_id')
+
+    @classmethod
+    def written_attnames(cls, update_fields):
+        """attname полей, записанных save(update_fields=...); None — записаны все."""
+        if update_fields is None:
+            return None
+        return {cls._meta.get_field(name).attname for name in update_fields}
+
+    def _remember_db_state(self, update_fields=None):
+        written = self.written_attnames(update_fields)
+        previous = getattr(self, '_db_state', None)
+        deferred = self.get_deferred_fields()
+        state = []
+        for index, attname in enumerate(self.TRACKED_FIELDS):
+            if written is not None and attname not in written:
+                # Поле не записывалось — в БД осталось прежнее значение
+                if previous is None:
+                    self._db_state = None
+                    return
+                state.append(previous[index])
+            elif attname in deferred:
+                self._db_state = None
+                return
+            else:
+                state.append(getattr(self, attname))
+        self._db_state = tuple(state)
+
+    def _tracked_unchanged(self):
+        state = getattr(self, '_db_state', None)
+        return state is not None and state == tuple(getattr(self, attname) for attname in self.TRACKED_FIELDS)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_db_state()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_db_state()
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        if update_fields is None and not force_insert and not self._state.adding and self._tracked_unchanged():
+            # Статус, мероприятие и человек не менялись: пишем остальные поля — параллельная
+            # смена статуса (чекин, массовое действие) не затирается, прежнее состояние не читается
+            deferred = self.get_deferred_fields()
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in self.TRACKED_FIELDS and field.attname not in deferred
+            ]
+        # log_action_status_change читает прежнее состояние под блокировкой строки:
+        # блокировка держится до конца этой транзакции, параллельное сохранение ждёт
+        with transaction.atomic(using=using):
+            super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
+        self._remember_db_state(update_fields)
     
     class Meta:
         verbose_name = 'Действие'
@@ -310,23 +397,58 @@ class Action(models.Model):
             )
         ]
 
+# Счётчики статусов мероприятия (денормализация для списков, экспорта и API)
+class EventStatusCounter(models.Model):
+    event = models.OneToOneField(
+        'ModuleInstance',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='status_counter',
+        verbose_name='Мероприятие'
+    )
+    announced = models.IntegerField(default=0, verbose_name='Заявлено')
+    invited = models.IntegerField(default=0, verbose_name='Приглашено')
+    registered = models.IntegerField(default=0, verbose_name='Согласовано')
+    cancelled = models.IntegerField(default=0, verbose_name='Отклонено')
+    visited = models.IntegerField(default=0, verbose_name='Посещено')
+    guests = models.IntegerField(default=0, verbose_name='Уникальных гостей')
+
+    def __str__(self):
+        return f'{self.event_id}'
+
+    class Meta:
+        verbose_name = 'Счётчики мероприятия'
+        verbose_name_plural = 'Счётчики мероприятий'
+
 @receiver(pre_save, sender=Action)
 def log_action_status_change(sender, instance, **kwargs):
+    # Состояние до сохранения нужно счётчикам мероприятий (event/counters.py)
+    instance._counter_state = None
     if not instance.pk:
         # Новая запись, не логируем
         return
+    written = Action.written_attnames(kwargs.get('update_fields'))
+    if written is not None and written.isdisjoint(Action.TRACKED_FIELDS):
+        # Статус, мероприятие и человек не записываются — ни аудита, ни дельты счётчиков
+        return
 
-    try:
-        old_instance = Action.objects.get(pk=instance.pk)
-    except Action.DoesNotExist:
+    # Снимок на момент загрузки мог устареть (update_actions, чекин в другом запросе):
+    # дельта счётчиков и аудит считаются от строки, заблокированной до конца сохранения
+    state = (
+        Action.objects.select_for_update().filter(pk=instance.pk)
+        .values_list(*Action.TRACKED_FIELDS).first()
+    )
+    if state is None:
         return
+    instance._counter_state = state
+    old_action_type = state[1]
 
-    if old_instance.action_type != instance.action_type:
+    if old_action_type != instance.action_type:
         ActionLog.objects.create(
             action=instance,
-            old_status=old_instance.action_type,
+            old_status=old_action_type,
             new_status=instance.action_type,
-            create_user=instance.update_user
+            create_user_id=instance.update_user_id
         )
 
 # Аудит действий
@@ -355,6 +477,43 @@ class ActionLog(models.Model):
         verbose_name = 'Запись аудита'
         verbose_name_plural = 'Аудит действий'
 
+# Квитанции пакетного чекина: повторная отправка той же очереди со сканера не применяется дважды
+class CheckinReceipt(models.Model):
+    # Ключ уникален в пределах пользователя: устройства разных людей генерируют ключи независимо
+    key = models.CharField(max_length=64, verbose_name='Ключ идемпотентности')
+    user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='Кто отправил')
+    action = models.ForeignKey('Action', on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='Действие')
+    action_type = models.CharField(max_length=100, choices=STATUS_MODEL, verbose_name='Статус со сканера')
+    result = models.CharField(max_length=20, verbose_name='Результат')
+    create_date = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата получения')
+
+    def __str__(self):
+        return self.key
+
+    class Meta:
+        verbose_name = 'Квитанция чекина'
+        verbose_name_plural = 'Квитанции чекина'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_checkin_receipt_user_key')
+        ]
+
+
+# Удалённые строки таблиц: по ним открытые таблицы убирают строки без полной перезагрузки
+class DeletedRecord(models.Model):
+    model = models.CharField(max_length=50, verbose_name='Модель')
+    object_id = models.BigIntegerField(verbose_name='ID записи')
+    # Мероприятие удалённой регистрации — без внешнего ключа: мероприятие могло быть удалено
+    event_id = models.BigIntegerField(blank=True, null=True, verbose_name='ID мероприятия')
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата удаления')
+
+    def __str__(self):
+        return f'{self.model} #{self.object_id}'
+
+    class Meta:
+        verbose_name = 'Удалённая запись'
+        verbose_name_plural = 'Удалённые записи'
+
+
 # Социальные сети
 class SocialNetwork(BaseModelClass):
     name = models.CharField(max_length=100, unique=True, verbose_name='Наименование соцсети')
@@ -382,6 +541,60 @@ class InfoContact(models.Model):
         verbose_name_plural = 'Контакты'
 
 
+# Ключи поиска дублей людей (event/contact_duplicates.py)
+class ContactDuplicateKey(models.Model):
+    KIND_CHOICES = (
+        ('name', 'Фамилия и имя'),
+        ('first_middle', 'Имя и отчество'),
+        ('nickname', 'Никнейм'),
+        ('social', 'Контакт в соцсетях'),
+    )
+
+    contact = models.ForeignKey('Contact', on_delete=models.CASCADE, related_name='duplicate_keys', verbose_name='Человек')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='Признак')
+    value = models.CharField(max_length=700, verbose_name='Нормализованное значение')
+    # Тот же ключ есть у другого человека
+    shared = models.BooleanField(default=False, db_index=True, verbose_name='Совпадает с другим человеком')
+
+    def __str__(self):
+        return f'{self.contact_id}: {self.kind}={self.value}'
+
+    class Meta:
+        verbose_name = 'Ключ поиска дублей'
+        verbose_name_plural = 'Ключи поиска дублей'
+        indexes = [models.Index(fields=['kind', 'value'], name='event_dupkey_kind_value')]
+        constraints = [
+            models.UniqueConstraint(fields=['contact', 'kind', 'value'], name='unique_contact_duplicate_key')
+        ]
+
+
+# Пары похожих людей, найденные нечётким поиском (manage.py find_fuzzy_duplicates)
+class DuplicateCandidatePair(models.Model):
+    STATUS_CHOICES = (
+        ('new', 'На проверке'),
+        ('dismissed', 'Не дубль'),
+    )
+
+    contact_a = models.ForeignKey('Contact', on_delete=models.CASCADE, related_name='+', verbose_name='Человек 1')
+    contact_b = models.ForeignKey('Contact', on_delete=models.CASCADE, related_name='+', verbose_name='Человек 2')
+    score = models.FloatField(verbose_name='Сходство', db_index=True)
+    reasons = models.CharField(max_length=255, blank=True, default='', verbose_name='Совпадения')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='new', db_index=True, verbose_name='Статус')
+    create_date = models.DateTimeField(auto_now_add=True, verbose_name='Найдено')
+    update_date = models.DateTimeField(auto_now=True, verbose_name='Обновлено')
+
+    def __str__(self):
+        return f'{self.contact_a_id} ~ {self.contact_b_id} ({self.score:.2f})'
+
+    class Meta:
+        verbose_name = 'Возможный дубль'
+        verbose_name_plural = 'Возможные дубли (нечёткий поиск)'
+        ordering = ['-score']
+        constraints = [
+            models.UniqueConstraint(fields=['contact_a', 'contact_b'], name='unique_duplicate_candidate_pair')
+        ]
+
+
 class Community(BaseModelClass):
     name = models.CharField(max_length=255, unique=True, verbose_name='Наименование сообщества')
 
@@ -407,3 +620,75 @@ class CommunityMember(models.Model):
                 name='unique_community_member'
             )
         ]
+
+
+EXPORT_JOB_STATUSES = (
+    ('pending', 'В очереди'),
+    ('running', 'Выполняется'),
+    ('done', 'Готово'),
+    ('failed', 'Ошибка'),
+)
+
+EXPORT_JOB_DATASETS = (
+    ('actions', 'Действия'),
+    ('contacts', 'Люди'),
+)
+
+class ExportJobStorage(FileSystemStorage):
+    """
+    Выгрузки с персональными данными лежат вне MEDIA_ROOT (EXPORT_JOBS_ROOT)
+    и отдаются только через export_job_download с проверкой владельца.
+    """
+
+    @property
+    def base_location(self):
+        return settings.EXPORT_JOBS_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    @property
+    def base_url(self):
+        return None
+
+
+def export_job_file_name(instance, filename):
+    # Случайное имя: по номеру задания файл не угадать
+    return f'{uuid.uuid4().hex}.{instance.file_format}'
+
+
+# Фоновая выгрузка (выполняется командой run_export_worker)
+class ExportJob(models.Model):
+    dataset = models.CharField(max_length=50, choices=EXPORT_JOB_DATASETS, verbose_name='Данные')
+    file_format = models.CharField(max_length=10, default='xlsx', verbose_name='Формат')
+    object_ids = models.JSONField(blank=True, null=True, verbose_name='ID выбранных записей')
+    filters = models.TextField(blank=True, null=True, verbose_name='Фильтры списка')
+    status = models.CharField(max_length=20, choices=EXPORT_JOB_STATUSES, default='pending', db_index=True, verbose_name='Статус')
+    rows_total = models.IntegerField(blank=True, null=True, verbose_name='Всего строк')
+    rows_done = models.IntegerField(default=0, verbose_name='Выгружено строк')
+    file = models.FileField(storage=ExportJobStorage(), upload_to=export_job_file_name, blank=True, null=True, verbose_name='Файл')
+    error = models.TextField(blank=True, null=True, verbose_name='Ошибка')
+    create_user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Кто создал')
+    create_date = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    update_date = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+    started_at = models.DateTimeField(blank=True, null=True, verbose_name='Начало')
+    finished_at = models.DateTimeField(blank=True, null=True, verbose_name='Окончание')
+
+    def __str__(self):
+        return f'{self.get_dataset_display()} #{self.pk} ({self.get_status_display()})'
+
+    @property
+    def download_name(self):
+        return f'{self.dataset}_{self.pk}.{self.file_format}'
+
+    @property
+    def progress(self):
+        if not self.rows_total:
+            return 100 if self.status == 'done' else 0
+        return min(100, int(self.rows_done * 100 / self.rows_total))
+
+    class Meta:
+        verbose_name = 'Фоновая выгрузка'
+        verbose_name_plural = 'Фоновые выгрузки'
+        ordering = ['-create_date']
@@ -0,0 +1,194 @@
+"""
+Справочник продюсеров в памяти процесса: поиск по ФИО и автокомплит без запросов к БД.
+
+Загружается одним запросом (все пользователи с признаком членства в группе «Продюсер»)
+и сбрасывается при изменении пользователей, групп и членства в группах. Правила
+обновления те же, что у event/references.py: с общим кэшем Django версия и данные лежат
+в нём, с кэшем процесса справочник живёт не дольше LOCAL_TTL секунд.
+
+Правила поиска сохранены:
+resolve        — таблица и карточка гостя: только продюсеры, без учёта регистра,
+                 «Фамилия Имя» или «Фамилия»;
+resolve_import — импорт людей (ProducerWidget): любые пользователи, точное совпадение,
+                 «Фамилия», «Фамилия Имя» или «Имя Фамилия»; неоднозначность = не найден.
+"""
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .models import CustomUser
+from .references import LOCAL_TTL, SHARED_TIMEOUT, shared_cache_enabled
+
+PRODUCER_GROUP = 'Продюсер'
+_VERSION_KEY = 'event:producers:version'
+_DATA_KEY = 'event:producers:{}'
+# Сохранения пользователя, не влияющие на справочник (вход, токен Telegram, пароль)
+_IGNORED_UPDATE_FIELDS = {'last_login', 'auth_token', 'password'}
+
+
+def _load_users():
+    in_group = CustomUser.groups.through.objects.filter(
+        customuser_id=OuterRef('pk'), group__name=PRODUCER_GROUP
+    )
+    return list(
+        CustomUser.objects.annotate(is_producer=Exists(in_group))
+        .order_by('pk')
+        .values_list('pk', 'last_name', 'first_name', 'is_producer')
+    )
+
+
+class ProducerDirectory:
+    def __init__(self, users):
+        """users — список (pk, last_name, first_name, is_producer)."""
+        self._names = {}
+        self._exact_full = defaultdict(list)
+        self._exact_last = defaultdict(list)
+        self._producer_full = {}
+        self._producer_last = {}
+        producers = []
+        for pk, last_name, first_name, is_producer in users:
+            last_name, first_name = last_name or '', first_name or ''
+            self._names[pk] = (last_name, first_name)
+            self._exact_full[(last_name, first_name)].append(pk)
+            self._exact_last[last_name].append(pk)
+            if is_producer:
+                producers.append(pk)
+                self._producer_full.setdefault((last_name.lower(), first_name.lower()), pk)
+                self._producer_last.setdefault(last_name.lower(), pk)
+
+        # Продюсеры в порядке «Фамилия Имя» и отсортированные слова ФИО для поиска по префиксу
+        self._producers = sorted(producers, key=lambda pk: (self._names[pk], pk))
+        self._order = {pk: index for index, pk in enumerate(self._producers)}
+        self._prefixes = sorted(
+            (word.lower(), pk)
+            for pk in producers
+            for word in self._names[pk]
+            if word
+        )
+
+    def user(self, pk):
+        """Экземпляр CustomUser (загружены id, фамилия и имя) или None."""
+        if pk is None:
+            return None
+        last_name, first_name = self._names[pk]
+        return CustomUser.from_db(
+            CustomUser.objects.db, ['id', 'last_name', 'first_name'], [pk, last_name, first_name]
+        )
+
+    def display_name(self, pk):
+        return ' '.join(self._names[pk]).strip()
+
+    def resolve(self, value):
+        parts = (value or '').split()
+        if not parts:
+            return None
+        if len(parts) >= 2:
+            pk = self._producer_full.get((parts[0].lower(), parts[1].lower()))
+        else:
+            pk = self._producer_last.get(parts[0].lower())
+        return self.user(pk)
+
+    @staticmethod
+    def _single(candidates):
+        # Несколько совпадений — неоднозначно, продюсер не проставляется
+        return candidates[0] if len(candidates) == 1 else None
+
+    def resolve_import(self, value):
+        parts = str(value or '').split()
+        if not parts:
+            return None
+        if len(parts) == 1:
+            return self.user(self._single(self._exact_last.get(parts[0], [])))
+
+        p1, p2 = parts[0], parts[1]
+        for key in ((p1, p2), (p2, p1)):
+            candidates = self._exact_full.get(key, [])
+            if candidates:
+                return self.user(self._single(candidates))
+        return self.user(self._single(self._exact_last.get(p1, [])))
+
+    def autocomplete(self, term='', limit=20):
+        """
+        [{'id', 'name'}] продюсеров, у которых фамилия или имя содержат term.
+        Совпадения с начала слова идут первыми, внутри групп — по «Фамилия Имя».
+        """
+        term = (term or '').strip().lower()
+        if not term:
+            matched = self._producers[:limit]
+        else:
+            prefixed = set()
+            index = bisect_left(self._prefixes, (term,))
+            while index < len(self._prefixes) and self._prefixes[index][0].startswith(term):
+                prefixed.add(self._prefixes[index][1])
+                index += 1
+            others = {
+                pk for pk in self._producers
+                if pk not in prefixed and any(term in word.lower() for word in self._names[pk])
+            }
+            matched = sorted(prefixed, key=self._order.get) + sorted(others, key=self._order.get)
+            matched = matched[:limit]
+        return [{'id': pk, 'name': self.display_name(pk)} for pk in matched]
+
+
+_state = {'directory': None, 'version': None, 'loaded_at': 0.0}
+
+
+def get_producer_directory():
+    if shared_cache_enabled():
+        version = cache.get(_VERSION_KEY, 0)
+        if version != _state['version']:
+            _state['directory'] = None
+            _state['version'] = version
+    elif time.monotonic() - _state['loaded_at'] > LOCAL_TTL:
+        _state['directory'] = None
+
+    if _state['directory'] is None:
+        users = None
+        if shared_cache_enabled():
+            users = cache.get(_DATA_KEY.format(_state['version']))
+        if users is None:
+            users = _load_users()
+            if shared_cache_enabled():
+                cache.set(_DATA_KEY.format(_state['version']), users, SHARED_TIMEOUT)
+        _state['directory'] = ProducerDirectory(users)
+        _state['loaded_at'] = time.monotonic()
+    return _state['directory']
+
+
+def invalidate_producer_directory():
+    _state['directory'] = None
+    _state['version'] = None
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:
+        cache.set(_VERSION_KEY, 1, None)
+
+
+def _on_user_save(sender, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= _IGNORED_UPDATE_FIELDS:
+        return
+    invalidate_producer_directory()
+
+
+def _on_change(sender, **kwargs):
+    invalidate_producer_directory()
+
+
+def _on_groups_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_producer_directory()
+
+
+def connect_signals():
+    post_save.connect(_on_user_save, sender=CustomUser, dispatch_uid='event_producers_user_save')
+    post_delete.connect(_on_change, sender=CustomUser, dispatch_uid='event_producers_user_delete')
+    post_save.connect(_on_change, sender=Group, dispatch_uid='event_producers_group_save')
+    post_delete.connect(_on_change, sender=Group, dispatch_uid='event_producers_group_delete')
+    m2m_changed.connect(
+        _on_groups_changed, sender=CustomUser.groups.through, dispatch_uid='event_producers_groups'
+    )
@@ -0,0 +1,137 @@
+"""
+Кэш «название -> id» для небольших справочников людей: компании, категории, типы гостя.
+
+Таблица /table/, карточка гостя и импорт указывают справочник по названию; раньше на
+каждое сохранение выполнялся get_or_create по каждому полю. Теперь id берётся из словаря
+процесса, при промахе — из общего кэша Django, и только затем из БД с созданием записи.
+
+Новые записи не меняют уже известные соответствия, поэтому кэш сбрасывают только
+изменение и удаление справочника (post_save/post_delete, models_bulk_changed).
+Сброс виден всем процессам через версию в кэше Django, поэтому общий кэш используется
+всегда, когда он настроен (CACHE_URL; отключается REFERENCE_CACHE_SHARED=False).
+С кэшем процесса — один процесс, например runserver, — словарь дополнительно живёт
+не дольше LOCAL_TTL секунд; без DEBUG об этом предупреждает проверка event.W001.
+
+Соответствие запоминается после фиксации транзакции (on_commit): id записи, созданной
+в откатившейся транзакции, в кэш не попадает.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .caching import shared_cache_configured
+from .models import CategoryContact, CompanyContact, TypeGuestContact
+from .signals import models_bulk_changed
+
+REFERENCE_MODELS = {
+    'company': CompanyContact,
+    'category': CategoryContact,
+    'type_guest': TypeGuestContact,
+}
+LOCAL_TTL = 60
+SHARED_TIMEOUT = 3600
+_VERSION_KEY = 'event:references:version:{}'
+_NAME_KEY = 'event:references:{}:{}:{}'
+
+
+def shared_cache_enabled():
+    return getattr(settings, 'REFERENCE_CACHE_SHARED', True) and shared_cache_configured()
+
+
+class ReferenceNameCache:
+    def __init__(self, model):
+        self.model = model
+        self.label = model._meta.label_lower
+        self._ids = {}
+        self._version = None
+        self._loaded_at = time.monotonic()
+
+    def _shared_version(self):
+        return cache.get(_VERSION_KEY.format(self.label), 0)
+
+    def _name_key(self, name):
+        # Название с пробелами или длиннее 250 символов memcached в ключе не примет
+        digest = hashlib.md5(name.encode('utf-8')).hexdigest()
+        return _NAME_KEY.format(self.label, self._version, digest)
+
+    def _refresh(self):
+        if shared_cache_enabled():
+            version = self._shared_version()
+            if version != self._version:
+                self._ids = {}
+                self._version = version
+        elif time.monotonic() - self._loaded_at > LOCAL_TTL:
+            self._ids = {}
+            self._loaded_at = time.monotonic()
+
+    def _remember(self, name, pk):
+        self._ids[name] = pk
+        if shared_cache_enabled():
+            cache.set(self._name_key(name), pk, SHARED_TIMEOUT)
+
+    def get_id(self, name):
+        """id записи справочника с таким названием; отсутствующая запись создаётся."""
+        self._refresh()
+        pk = self._ids.get(name)
+        if pk is None and shared_cache_enabled():
+            pk = cache.get(self._name_key(name))
+            if pk is not None:
+                self._ids[name] = pk
+        if pk is None:
+            pk = self.model.objects.get_or_create(name=name)[0].pk
+            transaction.on_commit(lambda: self._remember(name, pk), using=self.model.objects.db)
+        return pk
+
+    def get(self, name):
+        """Экземпляр справочника (загружены только id и name) или None для пустого названия."""
+        name = (name or '').strip()
+        if not name:
+            return None
+        return self.model.from_db(self.model.objects.db, ['id', 'name'], [self.get_id(name), name])
+
+    def invalidate(self):
+        self._ids = {}
+        self._version = None
+        key = _VERSION_KEY.format(self.label)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+_caches = {model: ReferenceNameCache(model) for model in REFERENCE_MODELS.values()}
+
+
+def reference_cache(model):
+    return _caches[model]
+
+
+def resolve_reference(field, name):
+    """Справочник для поля Contact (company/category/type_guest) по названию."""
+    return _caches[REFERENCE_MODELS[field]].get(name)
+
+
+def _on_save(sender, created, **kwargs):
+    if not created:
+        _caches[sender].invalidate()
+
+
+def _on_delete(sender, **kwargs):
+    _caches[sender].invalidate()
+
+
+def _on_bulk_change(sender, **kwargs):
+    if sender in _caches:
+        _caches[sender].invalidate()
+
+
+def connect_signals():
+    models_bulk_changed.connect(_on_bulk_change, dispatch_uid='event_references_bulk')
+    for model in _caches:
+        uid = f'event_references_{model._meta.label_lower}'
+        post_save.connect(_on_save, sender=model, dispatch_uid=uid + '_save')
+        post_delete.connect(_on_delete, sender=model, dispatch_uid=uid + '_delete')
@@ -1,86 +1,41 @@
+import tablib
 from import_export import resources, fields
-from django.db import transaction
 from import_export.widgets import ForeignKeyWidget
-from django.db.models import Q
+from django.db.models import QuerySet
 
+from .bulk_import import ActionBulkImporter, build_contact_match_index, parse_middle_name
+from .counters import get_event_counter
+from .producers import get_producer_directory
+from .references import REFERENCE_MODELS, reference_cache
 from .models import Contact, InfoContact, SocialNetwork, ModuleInstance, CompanyContact, CategoryContact, TypeGuestContact, Action, CustomUser, CommunityMember
 
 
 class ForeignKeyGetOrCreateWidget(ForeignKeyWidget):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Кэш на время импорта: одно и то же название не ищется повторно
+        self._cache = {}
+
     def clean(self, value, row=None, *args, **kwargs):
         if not value:
             return None
-        try:
-            return self.model.objects.get(**{self.field: value})
-        except self.model.DoesNotExist:
-            return self.model.objects.create(**{self.field: value})
+        if value not in self._cache:
+            if self.field == 'name' and self.model in REFERENCE_MODELS.values():
+                self._cache[value] = reference_cache(self.model).get(value)
+            else:
+                try:
+                    self._cache[value] = self.model.objects.get(**{self.field: value})
+                except self.model.DoesNotExist:
+                    self._cache[value] = self.model.objects.create(**{self.field: value})
+        return self._cache[value]
 
 class ProducerWidget(ForeignKeyWidget):
+    """Продюсер по «Фамилия», «Фамилия Имя» или «Имя Фамилия»; неоднозначное значение пропускается."""
+
     def clean(self, value, row=None, *args, **kwargs):
         if not value:
             return None
-        # Очищаем значение
-        value = str(value).strip()
-        if not value:
-            return None
-
-        parts = value.split()
-
-        # Если в поле указана одна часть - считаем, что это фамилия (старое поведение)
-        if len(parts) == 1:
-            last_name = parts[0]
-            try:
-                producer = CustomUser.objects.get(last_name=last_name)
-                print(f"Найден продюсер по фамилии: {producer.last_name} {producer.first_name}")
-                return producer
-            except CustomUser.MultipleObjectsReturned:
-                print(f"Найдено несколько продюсеров с фамилией '{last_name}', пропускаю")
-                return None
-            except CustomUser.DoesNotExist:
-                print(f"Продюсер не найден по фамилии: {last_name}")
-                return None
-
-        # Если частей две и больше - пробуем интерпретировать как Фамилия Имя и Имя Фамилия
-        if len(parts) >= 2:
-            p1, p2 = parts[0], parts[1]
-
-            # 1) Пытаемся найти как Фамилия Имя
-            try:
-                producer = CustomUser.objects.get(last_name=p1, first_name=p2)
-                print(f"Найден продюсер по ФИО (Фамилия Имя): {producer.last_name} {producer.first_name}")
-                return producer
-            except CustomUser.MultipleObjectsReturned:
-                print(f"Найдено несколько продюсеров по ФИО '{p1} {p2}' (Фамилия Имя), пропускаю")
-                return None
-            except CustomUser.DoesNotExist:
-                pass
-
-            # 2) Пытаемся найти как Имя Фамилия
-            try:
-                producer = CustomUser.objects.get(last_name=p2, first_name=p1)
-                print(f"Найден продюсер по ФИО (Имя Фамилия): {producer.last_name} {producer.first_name}")
-                return producer
-            except CustomUser.MultipleObjectsReturned:
-                print(f"Найдено несколько продюсеров по ФИО '{p1} {p2}' (Имя Фамилия), пропускаю")
-                return None
-            except CustomUser.DoesNotExist:
-                pass
-
-            # 3) Фоллбек: пробуем как раньше, только по фамилии (первая часть)
-            try:
-                producer = CustomUser.objects.get(last_name=p1)
-                print(f"Найден продюсер по фамилии (фоллбек): {producer.last_name} {producer.first_name}")
-                return producer
-            except CustomUser.MultipleObjectsReturned:
-                print(f"Найдено несколько продюсеров с фамилией '{p1}' (фоллбек), пропускаю")
-                return None
-            except CustomUser.DoesNotExist:
-                print(f"Продюсер не найден ни по ФИО, ни по фамилии: '{value}'")
-                return None
-
-        # На всякий случай, если формат совсем неожиданный
-        print(f"Неверный формат значения продюсера: '{value}'")
-        return None
+        return get_producer_directory().resolve_import(value)
 
 class ContactImport(resources.ModelResource):
     social_network_name = fields.Field(column_name='social_network_name')
@@ -117,35 +72,50 @@ class ContactImport(resources.ModelResource):
         import_id_fields = ('last_name', 'first_name', 'middle_name')
         skip_unchanged = True
 
-    def get_instance(self, instance_loader, row):
-        last_name = row.get('last_name', '').strip()
-        first_name = row.get('first_name', '').strip()
-        middle_name = row.get('middle_name')
-        
-        # Преобразуем middle_name в None если это пустая строка или None
-        if not middle_name or middle_name == 'None' or middle_name.strip() == '':
-            middle_name = None
-
+    def before_import(self, dataset, **kwargs):
+        # Индекс ФИО и найденные люди загружаются один раз на файл, а не запросом на строку
+        self._with_middle, self._without_middle = build_contact_match_index()
+        pks = {self._matched_pk(row) for row in dataset.dict} - {None}
+        self._instances = Contact.objects.in_bulk(pks) if pks else {}
+        self._social_networks = {}
+
+    @staticmethod
+    def _match_key(row):
+        last_name = (row.get('last_name') or '').strip()
+        first_name = (row.get('first_name') or '').strip()
+        middle_name = parse_middle_name(row.get('middle_name'))
         if not last_name or not first_name:
             return None
+        if middle_name:
+            return (last_name, first_name, middle_name)
+        return (last_name, first_name)
 
-        # Ищем контакт с учетом отчества
-        try:
-            if middle_name:
-                return Contact.objects.get(
-                    last_name=last_name,
-                    first_name=first_name,
-                    middle_name=middle_name
-                )
-            else:
-                return Contact.objects.filter(
-                    last_name=last_name,
-                    first_name=first_name
-                ).filter(
-                    Q(middle_name__isnull=True) | Q(middle_name='')
-                ).first()
-        except Contact.DoesNotExist:
+    def _matched_pk(self, row):
+        key = self._match_key(row)
+        if key is None:
+            return None
+        index = self._with_middle if len(key) == 3 else self._without_middle
+        return index.get(key)
+
+    def get_instance(self, instance_loader, row):
+        if not hasattr(self, '_with_middle'):
+            self.before_import(tablib.Dataset())
+        pk = self._matched_pk(row)
+        if pk is None:
             return None
+        if pk not in self._instances:
+            self._instances[pk] = Contact.objects.filter(pk=pk).first()
+        return self._instances[pk]
+
+    def after_save_instance(self, instance, row, **kwargs):
+        super().after_save_instance(instance, row, **kwargs)
+        # Новые люди попадают в индекс — повтор ФИО в файле обновит ту же карточку
+        key = self._match_key(row)
+        if key is None or instance.pk is None:
+            return
+        index = self._with_middle if len(key) == 3 else self._without_middle
+        index.setdefault(key, instance.pk)
+        self._instances.setdefault(instance.pk, instance)
     
     def before_import_row(self, row, **kwargs):
         for key, value in row.items():
@@ -169,7 +139,10 @@ class ContactImport(resources.ModelResource):
         if social_name and social_id:
             instance = self.get_instance(None, row)
             if instance:
-                social_network, _ = SocialNetwork.objects.get_or_create(name=social_name)
+                social_network = self._social_networks.get(social_name)
+                if social_network is None:
+                    social_network, _ = SocialNetwork.objects.get_or_create(name=social_name)
+                    self._social_networks[social_name] = social_network
                 info_contact, created = InfoContact.objects.get_or_create(
                     contact=instance,
                     social_network=social_network,
@@ -257,25 +230,28 @@ class EventExport(resources.ModelResource):
         """Формирует список модераторов в формате Фамилия Имя или телефон"""
         return ', '.join([f"{c.last_name} {c.first_name}" if c.last_name and c.first_name else c.phone for c in obj.checkers.all()])
 
+    def get_queryset(self):
+        return super().get_queryset().select_related('status_counter')
+
     def dehydrate_announced_count(self, obj):
-        """Считает количество заявленных"""
-        return Action.objects.filter(event=obj, action_type='announced').count()
+        """Количество заявленных (из счётчиков мероприятия)"""
+        return get_event_counter(obj).announced
 
     def dehydrate_invited_count(self, obj):
-        """Считает количество приглашенных"""
-        return Action.objects.filter(event=obj, action_type='invited').count()
+        """Количество приглашенных (из счётчиков мероприятия)"""
+        return get_event_counter(obj).invited
 
     def dehydrate_registered_count(self, obj):
-        """Считает количество зарегистрированных"""
-        return Action.objects.filter(event=obj, action_type='registered').count()
+        """Количество зарегистрированных (из счётчиков мероприятия)"""
+        return get_event_counter(obj).registered
     
     def dehydrate_cancelled_count(self, obj):
-        """Считает количество отмененных"""
-        return Action.objects.filter(event=obj, action_type='cancelled').count()
+        """Количество отмененных (из счётчиков мероприятия)"""
+        return get_event_counter(obj).cancelled
     
     def dehydrate_visited_count(self, obj):
-        """Считает количество посетивших"""
-        return Action.objects.filter(event=obj, action_type='visited').count()
+        """Количество посетивших (из счётчиков мероприятия)"""
+        return get_event_counter(obj).visited
     
     def dehydrate_is_visible(self, obj):
         """
@@ -294,41 +270,26 @@ class ActionImport(resources.ModelResource):
         fields = ('module_name', 'last_name', 'first_name', 'middle_name')
         import_id_fields = ()  # id не требуется
         skip_unchanged = True
-        use_bulk = False  # обрабатываем строки по одной
-    
+        use_bulk = False  # строки только сообщают об ошибках, запись — в before_import
+
+    def import_data(self, dataset, dry_run=False, **kwargs):
+        self._dry_run = dry_run
+        return super().import_data(dataset, dry_run=dry_run, **kwargs)
+
+    def before_import(self, dataset, **kwargs):
+        # Мероприятия, люди и регистрации всего файла обрабатываются одним проходом;
+        # предпросмотр только проверяет строки — мероприятия не создаются даже до отката
+        importer = ActionBulkImporter(user=kwargs.get('user'))
+        if getattr(self, '_dry_run', False):
+            result = importer.check(dataset.dict)
+        else:
+            result = importer.run(dataset.dict)
+        self._row_errors = dict(result.errors)
+
     def before_import_row(self, row, **kwargs):
-        with transaction.atomic():
-            request = kwargs.get('user')
-            # Нормализация входных данных: убираем пробелы и приводим к стандартному виду
-            event_name = (row.get('event') or row.get('Мероприятие') or "").strip()
-            last_name = (row.get('last_name') or row.get('Фамилия') or "").strip()
-            first_name = (row.get('first_name') or row.get('Имя') or "").strip()
-            middle_name = row.get('middle_name') or row.get('Отчество')
-            if middle_name:
-                middle_name = middle_name.strip()
-            
-            if not event_name:
-                raise ValueError(f"Ошибка: Не указано мероприятие в строке данных: {row}")
-            
-            event, _ = ModuleInstance.objects.get_or_create(name=event_name)
-            
-            # Формируем комплексное условие поиска:
-            q = Q(last_name__iexact=last_name) & Q(first_name__iexact=first_name)
-            # Если отчество задано – требуем совпадения, иначе ищем записи, где отчество не задано
-            if middle_name:
-                q &= Q(middle_name__iexact=middle_name)
-            else:
-                q &= (Q(middle_name__isnull=True) | Q(middle_name=''))
-            
-            contact = Contact.objects.filter(q).first()
-            if not contact:
-                raise ValueError(f"Ошибка: Не найден человек по указанным данным: {row}")
-            
-            # Создаем или получаем запись Action
-            checkin, created = Action.objects.get_or_create(
-                contact=contact, event=event,
-                defaults={'create_user': request}
-            )
+        message = getattr(self, '_row_errors', {}).get(kwargs.get('row_number'))
+        if message:
+            raise ValueError(f"Ошибка: {message}. Строка данных: {row}")
 
 class ActionExport(resources.ModelResource):
     id = fields.Field(attribute='id', column_name='ID')
@@ -358,10 +319,16 @@ class ActionExport(resources.ModelResource):
                   'contact__producer',
                   'action_type_display', 'create_date', 'update_date', 'create_user', 'update_user', 'social_networks',
                   'communities_ids', 'communities_names', 'communities_socials')
-        
+        chunk_size = 1000
+
+    EXPORT_SELECT_RELATED = (
+        'event', 'contact', 'contact__company', 'contact__category', 'contact__type_guest',
+        'contact__producer', 'create_user', 'update_user',
+    )
+
     def dehydrate_contact__producer(self, obj):
         """Формирует список менеджеров в формате Фамилия Имя или телефон"""
-        if obj.contact.producer:
+        if obj.contact and obj.contact.producer:
             return f"{obj.contact.producer.last_name} {obj.contact.producer.first_name}"
         else:
             return "-"
@@ -380,6 +347,89 @@ class ActionExport(resources.ModelResource):
         else:
                 return "-"
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._reset_related_maps()
+
+    def iter_queryset(self, queryset):
+        """
+        Экспорт порциями: для каждой порции соцсети и сообщества контактов
+        загружаются несколькими запросами в словари, dehydrate_* читают из них.
+        """
+        self._reset_related_maps()
+        if isinstance(queryset, QuerySet):
+            queryset = queryset.select_related(*self.EXPORT_SELECT_RELATED)
+        batch = []
+        for obj in super().iter_queryset(queryset):
+            batch.append(obj)
+            if len(batch) >= self.get_chunk_size():
+                yield from self._with_related_loaded(batch)
+                batch = []
+        if batch:
+            yield from self._with_related_loaded(batch)
+
+    def _reset_related_maps(self):
+        self._contact_socials = {}
+        self._contact_members = {}
+        self._community_socials = {}
+
+    def _with_related_loaded(self, batch):
+        self._contact_socials = {}
+        self._contact_members = {}
+        self._load_related(batch)
+        return batch
+
+    def _load_related(self, objs):
+        contact_ids = {obj.contact_id for obj in objs if obj.contact_id} - set(self._contact_members)
+        with_empty_contact = any(not obj.contact_id for obj in objs) and None not in self._contact_socials
+
+        for contact_id in contact_ids:
+            self._contact_socials[contact_id] = []
+            self._contact_members[contact_id] = []
+        if contact_ids:
+            infos = InfoContact.objects.filter(
+                contact_id__in=contact_ids, community__isnull=True
+            ).select_related('social_network').order_by('pk')
+            for info in infos:
+                self._contact_socials[info.contact_id].append(info)
+            members = CommunityMember.objects.filter(
+                contact_id__in=contact_ids
+            ).select_related('community').order_by('pk')
+            for member in members:
+                self._contact_members[member.contact_id].append(member)
+        if with_empty_contact:
+            # Как и раньше: filter(contact=None) даёт записи без человека и без сообщества
+            self._contact_socials[None] = list(
+                InfoContact.objects.filter(
+                    contact__isnull=True, community__isnull=True
+                ).select_related('social_network').order_by('pk')
+            )
+
+        community_ids = {
+            member.community_id
+            for contact_id in contact_ids
+            for member in self._contact_members[contact_id]
+        } - set(self._community_socials)
+        for community_id in community_ids:
+            self._community_socials[community_id] = []
+        if community_ids:
+            infos = InfoContact.objects.filter(
+                community_id__in=community_ids, contact__isnull=True
+            ).select_related('social_network').order_by('pk')
+            for info in infos:
+                self._community_socials[info.community_id].append(info)
+
+    def _socials_for(self, obj):
+        key = obj.contact_id or None
+        if key not in self._contact_socials:
+            self._load_related([obj])
+        return self._contact_socials[key]
+
+    def _members_for(self, obj):
+        if obj.contact_id not in self._contact_members:
+            self._load_related([obj])
+        return self._contact_members[obj.contact_id]
+
     def dehydrate_social_networks(self, obj):
         """
         Формирует строку с соцсетями для выгрузки в формате:
@@ -391,9 +441,8 @@ class ActionExport(resources.ModelResource):
 
         И т.д.
         """
-        social_networks = InfoContact.objects.filter(contact=obj.contact, community__isnull=True)
         parts = []
-        for s in social_networks:
+        for s in self._socials_for(obj):
             title = f"{s.social_network.name} ({s.subscribers})" if s.social_network and s.subscribers else (s.social_network.name if s.social_network else '—')
             link = s.external_id or ""
             parts.append(f"{title}\n{link}")
@@ -403,15 +452,13 @@ class ActionExport(resources.ModelResource):
         """ID сообществ, в которых состоит человек (через запятую)."""
         if not obj.contact_id:
             return ""
-        ids = CommunityMember.objects.filter(contact=obj.contact).values_list('community_id', flat=True)
-        return ", ".join(str(pk) for pk in ids)
+        return ", ".join(str(m.community_id) for m in self._members_for(obj))
 
     def dehydrate_communities_names(self, obj):
         """Названия сообществ, в которых состоит человек (через запятую)."""
         if not obj.contact_id:
             return ""
-        members = CommunityMember.objects.filter(contact=obj.contact).select_related('community')
-        return ", ".join(m.community.name for m in members if m.community)
+        return ", ".join(m.community.name for m in self._members_for(obj) if m.community)
 
     def dehydrate_communities_socials(self, obj):
         """
@@ -420,15 +467,13 @@ class ActionExport(resources.ModelResource):
         """
         if not obj.contact_id:
             return ""
-        community_ids = list(
-            CommunityMember.objects.filter(contact=obj.contact).values_list('community_id', flat=True)
-        )
-        if not community_ids:
+        members = self._members_for(obj)
+        if not members:
             return ""
-        infos = InfoContact.objects.filter(
-            community_id__in=community_ids,
-            contact__isnull=True
-        ).select_related('social_network')
+        infos = sorted(
+            (info for m in members for info in self._community_socials.get(m.community_id, [])),
+            key=lambda info: info.pk,
+        )
         parts = []
         for s in infos:
             sn_name = s.social_network.name if s.social_network else "—"
@@ -1,8 +1,13 @@
+from django.db import transaction
 from django.urls import reverse
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from django.utils import timezone
 
+from event.counters import apply_action_changes
+from event.models import Action, ActionLog
+from event.signals import models_bulk_changed
+
 # Отображение кнопок Сохранить, Сохранить и продолжить, Удалить, Закрыть
 def get_params_visible_buttons_save(request, obj):
     button_save = obj is None
@@ -151,8 +156,50 @@ def do_after_add_action(action):
                 action_open.is_last_state = False
                 action_open.save(force_update=True)
 
+
+UPDATE_ACTIONS_BATCH_SIZE = 1000
+
+
 # Чекин или отмена регистрации
-def update_actions(action_type, queryset):
-    for action_rec in queryset:
-        action_rec.action_type = action_type
-        action_rec.save()
+def update_actions(action_type, queryset, user=None):
+    """
+    Переводит записи queryset в статус action_type без save() по каждой строке:
+    прежние статусы читаются одним запросом, записи аудита создаются bulk_create,
+    статус ставится одним UPDATE на UPDATE_ACTIONS_BATCH_SIZE записей, счётчики мероприятий — по UPDATE на мероприятие.
+    Строки блокируются (SELECT ... FOR UPDATE, по возрастанию id) до конца транзакции:
+    параллельный чекин не изменит статус между чтением прежних статусов и UPDATE,
+    и аудит со счётчиками не разойдутся с таблицей.
+    Возвращает число обработанных записей.
+    """
+    with transaction.atomic():
+        rows = list(
+            Action.objects.filter(pk__in=queryset.order_by().values('pk'))
+            .select_for_update()
+            .order_by('pk')
+            .values_list('pk', 'event_id', 'action_type', 'contact_id', 'update_user_id')
+        )
+        if not rows:
+            return 0
+        changed = [row for row in rows if row[2] != action_type]
+        # Как и log_action_status_change: автор записи аудита — тот, кто обновляет запись
+        ActionLog.objects.bulk_create([
+            ActionLog(
+                action_id=pk,
+                old_status=old_status,
+                new_status=action_type,
+                create_user_id=user.pk if user else update_user_id,
+            )
+            for pk, _, old_status, _, update_user_id in changed
+        ], batch_size=UPDATE_ACTIONS_BATCH_SIZE)
+        values = {'action_type': action_type, 'update_date': timezone.now()}
+        if user is not None:
+            values['update_user'] = user
+        pks = [row[0] for row in rows]
+        for start in range(0, len(pks), UPDATE_ACTIONS_BATCH_SIZE):
+            Action.objects.filter(pk__in=pks[start:start + UPDATE_ACTIONS_BATCH_SIZE]).update(**values)
+        apply_action_changes(
+            ((event_id, old_status, contact_id), (event_id, action_type, contact_id))
+            for _, event_id, old_status, contact_id, _ in changed
+        )
+    models_bulk_changed.send(sender=Action)
+    return len(rows)
@@ -0,0 +1,10 @@
+"""
+Собственные сигналы приложения.
+
+models_bulk_changed — массовая запись (bulk_create/bulk_update/update), при которой
+post_save/post_delete не вызываются; sender — модель. Подписчики сбрасывают кэши,
+зависящие от данных модели.
+"""
+from django.dispatch import Signal
+
+models_bulk_changed = Signal()
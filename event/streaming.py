@@ -0,0 +1,72 @@
+"""
+Потоковая отдача больших JSON-ответов.
+
+Строки queryset читаются через .iterator(chunk_size=...) и сериализуются по одной,
+поэтому память не растёт с размером мероприятия, а первый байт уходит клиенту сразу.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+STREAM_CHUNK_SIZE = 2000
+# Сколько строк склеивать в один кусок ответа (меньше системных вызовов на запись)
+STREAM_FLUSH_ROWS = 200
+
+_encoder = DjangoJSONEncoder()
+
+
+def iterate_queryset(queryset, chunk_size=STREAM_CHUNK_SIZE):
+    """Итерирует queryset порциями без кэша результатов (работает и с prefetch_related)."""
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+def iter_json_array(rows, serializer=None):
+    """Генератор кусков JSON-массива: '[', строки через запятую, ']'."""
+    yield '['
+    buffer = []
+    first = True
+    for row in rows:
+        item = serializer(row) if serializer else row
+        if item is None:
+            continue
+        encoded = _encoder.encode(item)
+        buffer.append(encoded if first else ',' + encoded)
+        first = False
+        if len(buffer) >= STREAM_FLUSH_ROWS:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+    yield ']'
+
+
+def iter_json_object(rows, serializer=None, key='data', extra=None):
+    """
+    Генератор объекта {"<key>": [...], ...extra}.
+    Значения extra могут быть callable — они вычисляются после выдачи массива
+    (например, курсор следующей страницы, известный только в конце).
+    """
+    yield '{' + json.dumps(key) + ':'
+    yield from iter_json_array(rows, serializer)
+    for name, value in (extra or {}).items():
+        if callable(value):
+            value = value()
+        yield ',' + json.dumps(name) + ':' + _encoder.encode(value)
+    yield '}'
+
+
+class StreamingJsonResponse(StreamingHttpResponse):
+    """
+    JSON-ответ, который пишется построчно.
+    key=None — голый массив (как JsonResponse(..., safe=False)),
+    иначе объект {"<key>": [...], **extra}.
+    """
+
+    def __init__(self, rows, serializer=None, key=None, extra=None, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        if key is None:
+            content = iter_json_array(rows, serializer)
+        else:
+            content = iter_json_object(rows, serializer, key=key, extra=extra)
+        super().__init__((chunk.encode('utf-8') for chunk in content), **kwargs)
@@ -0,0 +1,115 @@
+"""
+Дельта-синхронизация открытых таблиц (/table/ и таблица гостей мероприятия).
+
+Полная загрузка таблицы возвращает курсор — время сервера на начало запроса. Запрос
+с ?since=<курсор> возвращает только строки, изменённые после курсора, id строк,
+удалённых после него, и новый курсор; клиент обновляет строки по id.
+
+Изменением строки считается:
+- Action — update_date, updated_at человека (ФИО, компания и т.д. видны в строке)
+  и применённая квитанция пакетного чекина (там update_date — время скана на устройстве);
+- Contact — updated_at.
+
+Удаления записываются в DeletedRecord сигналом post_delete, а там, где строки
+удаляются в обход сигналов, — явно через record_deleted. У удалённой регистрации
+запоминается мероприятие: таблица гостей получает только удаления своего мероприятия.
+
+Курсор сравнивается с запасом SYNC_OVERLAP: транзакция, начатая до курсора, может
+зафиксироваться после него, повторно пришедшие строки клиент просто перезаписывает.
+Курсор старше SYNC_RETENTION_DAYS (записи об удалениях уже вычищены) устарел —
+клиент перезагружает таблицу целиком.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models.signals import post_delete
+from django.utils import timezone
+
+from .checkin import APPLIED
+from .models import Action, CheckinReceipt, Contact, DeletedRecord
+
+SYNC_OVERLAP = timedelta(seconds=5)
+SYNC_RETENTION_DAYS = 7
+# Больше строк в дельте — дешевле перезагрузить таблицу целиком
+SYNC_MAX_ROWS = 2000
+# Старые записи об удалениях вычищаются не чаще раза в интервал на процесс
+_PURGE_INTERVAL = timedelta(hours=1)
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_last_purge = None
+
+
+def make_cursor(moment=None):
+    """Курсор — микросекунды от начала эпохи; клиент хранит его как непрозрачную строку."""
+    moment = moment or timezone.now()
+    return str((moment - _EPOCH) // timedelta(microseconds=1))
+
+
+def parse_cursor(value):
+    """Курсор -> aware datetime; ValueError, если курсор некорректен."""
+    try:
+        return _EPOCH + timedelta(microseconds=int(value))
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('Некорректный курсор синхронизации')
+
+
+def is_expired(since):
+    return since < timezone.now() - timedelta(days=SYNC_RETENTION_DAYS)
+
+
+def changed_actions(queryset, since):
+    """Строки queryset (Action), изменённые после since."""
+    since = since - SYNC_OVERLAP
+    # OR по трём признакам через JOIN не использует ни один индекс — вместо него UNION
+    # трёх выборок id, каждая по своему индексу (update_date, updated_at, create_date квитанции)
+    base = queryset.order_by().values('pk')
+    updated_contacts = Contact.objects.filter(updated_at__gt=since).values('pk')
+    checked_in = CheckinReceipt.objects.filter(result=APPLIED, create_date__gt=since).values('action_id')
+    ids = base.filter(update_date__gt=since).union(
+        base.filter(contact_id__in=updated_contacts),
+        base.filter(pk__in=checked_in),
+    )
+    return queryset.filter(pk__in=ids)
+
+
+def changed_contacts(queryset, since):
+    """Строки queryset (Contact), изменённые после since."""
+    return queryset.filter(updated_at__gt=since - SYNC_OVERLAP)
+
+
+def deleted_ids(model, since, event_id=None):
+    """id строк model, удалённых после since; event_id — только регистрации этого мероприятия."""
+    records = DeletedRecord.objects.filter(model=model._meta.label_lower, deleted_at__gt=since - SYNC_OVERLAP)
+    if event_id is not None:
+        records = records.filter(event_id=event_id)
+    return sorted(set(records.values_list('object_id', flat=True)))
+
+
+def record_deleted(model, ids, event_ids=None):
+    """
+    Записывает удаление строк model (для удалений в обход post_delete).
+    event_ids — {id строки: id мероприятия} для регистраций.
+    """
+    event_ids = event_ids or {}
+    DeletedRecord.objects.bulk_create(
+        [DeletedRecord(model=model._meta.label_lower, object_id=pk, event_id=event_ids.get(pk)) for pk in ids],
+        batch_size=1000,
+    )
+    _purge_expired()
+
+
+def _purge_expired():
+    global _last_purge
+    now = timezone.now()
+    if _last_purge is not None and now - _last_purge < _PURGE_INTERVAL:
+        return
+    _last_purge = now
+    DeletedRecord.objects.filter(deleted_at__lt=now - timedelta(days=SYNC_RETENTION_DAYS)).delete()
+
+
+def _on_delete(sender, instance, **kwargs):
+    event_id = getattr(instance, 'event_id', None)
+    record_deleted(sender, [instance.pk], {instance.pk: event_id} if event_id else None)
+
+
+def connect_signals():
+    for model in (Action, Contact):
+        post_delete.connect(_on_delete, sender=model, dispatch_uid=f'event_sync_{model._meta.model_name}_delete')
@@ -0,0 +1,844 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import warnings
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+import tablib
+
+from config.views import get_user_events
+from event.bulk_import import ActionBulkImporter, ContactBulkImporter
+from event.counters import COUNTER_FIELDS, rebuild_event_counters
+from event.fuzzy_duplicates import find_candidate_pairs, save_candidate_pairs
+from event.export_jobs import create_export_job, run_export_job
+from event.checkin import CheckinError, apply_checkin_batch, transition_action
+from event.access import group_names
+from event.checks import check_access_cache, check_shared_cache
+from event.contact_duplicates import refresh_shared
+from event.contact_merge import duplicate_clusters, merge_duplicate_clusters
+from event.contact_search import search_contacts
+from event import live
+from event.live import broker
+from event.models import (
+    Action, ActionLog, CheckinReceipt, CompanyContact, Contact, ContactDuplicateKey, CustomUser, DuplicateCandidatePair,
+    EventStatusCounter, ExportJob, InfoContact, ModuleInstance,
+)
+from event.references import ReferenceNameCache
+from event.resources import ActionImport
+from event.services import update_actions
+from event.signals import models_bulk_changed
+
+
+class UserEventsQueryCountTests(TestCase):
+    """Число запросов get_user_events не должно зависеть от количества мероприятий."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.checker = CustomUser.objects.create_user(phone='+70000000001', password='x')
+        cls.checker.groups.add(Group.objects.create(name='Модератор'))
+        cls.admin = CustomUser.objects.create_superuser(phone='+70000000002', password='x')
+        cls.contacts = [
+            Contact.objects.create(last_name=f'Гость{i}', first_name='Тест') for i in range(3)
+        ]
+
+    def _create_events(self, count):
+        start = ModuleInstance.objects.count()
+        for i in range(start, start + count):
+            event = ModuleInstance.objects.create(name=f'Мероприятие {i}', is_visible=True)
+            event.checkers.add(self.checker)
+            for contact, status in zip(self.contacts, ('registered', 'visited', 'announced')):
+                Action.objects.create(contact=contact, event=event, action_type=status)
+
+    def _request(self, user):
+        # Свежий объект пользователя: кэш ролей живёт только в рамках одного запроса
+        request = RequestFactory().get('/events-list/')
+        request.user = CustomUser.objects.get(pk=user.pk)
+        return request
+
+    def test_checker_constant_queries(self):
+        self._create_events(1)
+        request = self._request(self.checker)
+        with self.assertNumQueries(2):
+            get_user_events(request)
+
+        self._create_events(20)
+        request = self._request(self.checker)
+        with self.assertNumQueries(2):
+            response = get_user_events(request)
+        self.assertEqual(len(json.loads(response.content)), 21)
+
+    def test_admin_constant_queries(self):
+        self._create_events(20)
+        request = self._request(self.admin)
+        with self.assertNumQueries(1):
+            get_user_events(request)
+
+    def test_guests_count(self):
+        self._create_events(1)
+        response = get_user_events(self._request(self.checker))
+        data = json.loads(response.content)
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]['guests_count'], 2)
+
+
+class EventCounterTests(TestCase):
+    """EventStatusCounter сопровождается при каждой записи Action и совпадает с пересчётом."""
+
+    def setUp(self):
+        self.event = ModuleInstance.objects.create(name='Форум')
+        self.other = ModuleInstance.objects.create(name='Выставка')
+        self.contacts = [Contact.objects.create(last_name=f'Гость{i}', first_name='Тест') for i in range(3)]
+
+    def _counters(self, event):
+        counter = EventStatusCounter.objects.get(event=event)
+        return {name: getattr(counter, name) for name in COUNTER_FIELDS}
+
+    def _assert_matches_rebuild(self, *events):
+        maintained = [self._counters(event) for event in events]
+        rebuild_event_counters([event.pk for event in events])
+        self.assertEqual(maintained, [self._counters(event) for event in events])
+
+    def test_create_change_delete(self):
+        first = Action.objects.create(contact=self.contacts[0], event=self.event, action_type='registered')
+        Action.objects.create(contact=self.contacts[1], event=self.event, action_type='announced')
+        counters = self._counters(self.event)
+        self.assertEqual((counters['registered'], counters['announced'], counters['guests']), (1, 1, 1))
+
+        first.action_type = 'visited'
+        first.save()
+        counters = self._counters(self.event)
+        self.assertEqual((counters['registered'], counters['visited'], counters['guests']), (0, 1, 1))
+
+        first.delete()
+        counters = self._counters(self.event)
+        self.assertEqual((counters['visited'], counters['guests']), (0, 0))
+        self._assert_matches_rebuild(self.event)
+
+    def test_move_between_events(self):
+        action = Action.objects.create(contact=self.contacts[0], event=self.event, action_type='visited')
+        action.event = self.other
+        action.save()
+        self.assertEqual(self._counters(self.event)['visited'], 0)
+        self.assertEqual(self._counters(self.other)['visited'], 1)
+        self._assert_matches_rebuild(self.event, self.other)
+
+    def test_bulk_status_update(self):
+        for contact in self.contacts:
+            Action.objects.create(contact=contact, event=self.event, action_type='registered')
+        update_actions('cancelled', Action.objects.filter(contact__in=self.contacts[:2]))
+        counters = self._counters(self.event)
+        self.assertEqual((counters['registered'], counters['cancelled'], counters['guests']), (1, 2, 1))
+        self._assert_matches_rebuild(self.event)
+
+    def test_missing_row_is_rebuilt(self):
+        Action.objects.create(contact=self.contacts[0], event=self.event, action_type='invited')
+        EventStatusCounter.objects.filter(event=self.event).delete()
+        Action.objects.create(contact=self.contacts[1], event=self.event, action_type='invited')
+        self.assertEqual(self._counters(self.event)['invited'], 2)
+
+    def test_interleaved_saves_of_one_row(self):
+        action = Action.objects.create(contact=self.contacts[0], event=self.event, action_type='registered')
+        # Два запроса загрузили запись до любых изменений
+        first = Action.objects.get(pk=action.pk)
+        second = Action.objects.get(pk=action.pk)
+        first.action_type = 'visited'
+        first.save()
+        second.action_type = 'cancelled'
+        second.save()
+        counters = self._counters(self.event)
+        self.assertEqual((counters['registered'], counters['visited'], counters['cancelled']), (0, 0, 1))
+        self.assertEqual(
+            list(ActionLog.objects.filter(action=action).order_by('pk').values_list('old_status', 'new_status')),
+            [('registered', 'visited'), ('visited', 'cancelled')],
+        )
+        self._assert_matches_rebuild(self.event)
+
+    def test_save_after_bulk_update(self):
+        action = Action.objects.create(contact=self.contacts[0], event=self.event, action_type='registered')
+        loaded = Action.objects.get(pk=action.pk)
+        update_actions('visited', Action.objects.filter(pk=action.pk))
+        # Экземпляр загружен до массового чекина: прежний статус берётся из БД, а не из снимка
+        loaded.action_type = 'cancelled'
+        loaded.save()
+        self.assertEqual(ActionLog.objects.filter(action=action).latest('pk').old_status, 'visited')
+        self._assert_matches_rebuild(self.event)
+
+
+    def test_field_save_keeps_concurrent_status(self):
+        action = Action.objects.create(contact=self.contacts[0], event=self.event, action_type='registered')
+        loaded = Action.objects.get(pk=action.pk)
+        update_actions('visited', Action.objects.filter(pk=action.pk))
+        loaded.comment = 'VIP'
+        with CaptureQueriesContext(connection) as queries:
+            loaded.save()
+        # Статус не менялся — строка не блокируется и не перечитывается, чекин не затирается
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT')])
+        action.refresh_from_db()
+        self.assertEqual((action.action_type, action.comment), ('visited', 'VIP'))
+        self.assertEqual(ActionLog.objects.filter(action=action).count(), 1)
+        self._assert_matches_rebuild(self.event)
+
+    def test_update_fields_snapshot(self):
+        action = Action.objects.get(pk=Action.objects.create(
+            contact=self.contacts[0], event=self.event, action_type='registered',
+        ).pk)
+        action.action_type = 'visited'
+        action.comment = 'VIP'
+        action.save(update_fields=['comment'])
+        self.assertEqual(Action.objects.get(pk=action.pk).action_type, 'registered')
+        # Статус в update_fields не входил — следующий save() должен его записать
+        action.save()
+        self.assertEqual(Action.objects.get(pk=action.pk).action_type, 'visited')
+        self.assertEqual(
+            list(ActionLog.objects.filter(action=action).values_list('old_status', 'new_status')),
+            [('registered', 'visited')],
+        )
+        self._assert_matches_rebuild(self.event)
+
+@skipUnlessDBFeature('has_select_for_update')
+class EventCounterConcurrencyTests(TransactionTestCase):
+    """Параллельные save() одной записи не применяют дельту от одного прежнего статуса."""
+
+    def test_concurrent_saves(self):
+        event = ModuleInstance.objects.create(name='Форум')
+        action = Action.objects.create(
+            contact=Contact.objects.create(last_name='Гость', first_name='Тест'), event=event, action_type='registered',
+        )
+        loaded = threading.Barrier(2)
+
+        def scan(action_type, hold):
+            try:
+                instance = Action.objects.get(pk=action.pk)
+                loaded.wait()
+                with transaction.atomic():
+                    instance.action_type = action_type
+                    instance.save()
+                    # Первый держит блокировку строки: второй ждёт и читает уже его статус
+                    time.sleep(hold)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=scan, args=('visited', 0.5)),
+            threading.Thread(target=scan, args=('cancelled', 0)),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        maintained = EventStatusCounter.objects.values(*COUNTER_FIELDS).get(event=event)
+        rebuild_event_counters([event.pk])
+        self.assertEqual(maintained, EventStatusCounter.objects.values(*COUNTER_FIELDS).get(event=event))
+
+
+class ExportJobTests(TestCase):
+    """Файлы фоновых выгрузок лежат вне MEDIA_ROOT и отдаются только владельцу."""
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        self.settings = override_settings(EXPORT_JOBS_ROOT=self.root.name)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.owner = CustomUser.objects.create_superuser(phone='+70000000001', password='x')
+        Contact.objects.create(last_name='Иванов', first_name='Иван')
+
+    def test_file_is_private_and_randomly_named(self):
+        job = create_export_job(self.owner, 'contacts', 'csv')
+        run_export_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        path = job.file.path
+        self.assertTrue(path.startswith(os.path.abspath(self.root.name)))
+        self.assertFalse(path.startswith(os.path.abspath(settings.MEDIA_ROOT)))
+        self.assertNotEqual(os.path.basename(path), job.download_name)
+        with self.assertRaises(ValueError):
+            job.file.url
+
+        url = reverse('export_job_download', args=[job.pk])
+        self.client.force_login(CustomUser.objects.create_user(phone='+70000000002', password='x', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(self.owner)
+        response = self.client.get(url)
+        self.assertIn(f'contacts_{job.pk}.csv', response['Content-Disposition'])
+        self.assertIn('Иванов', b''.join(response.streaming_content).decode('utf-8'))
+
+    @override_settings(EXPORT_JOBS_ENABLED=False)
+    def test_admin_action_streams_when_jobs_disabled(self):
+        self.client.force_login(self.owner)
+        response = self.client.post('/admin/event/contact/', {
+            'action': 'export_in_background_action',
+            '_selected_action': list(Contact.objects.values_list('pk', flat=True)),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('contacts.xlsx', response['Content-Disposition'])
+        self.assertFalse(ExportJob.objects.exists())
+
+    @override_settings(EXPORT_JOBS_ENABLED=True)
+    def test_admin_action_select_across_stores_filters(self):
+        Contact.objects.create(last_name='Петров', first_name='Пётр')
+        self.client.force_login(self.owner)
+        self.client.post('/admin/event/contact/?q=Иванов', {
+            'action': 'export_in_background_action',
+            'select_across': '1',
+            '_selected_action': list(Contact.objects.values_list('pk', flat=True)[:1]),
+        })
+        job = ExportJob.objects.get()
+        self.assertIsNone(job.object_ids)
+        self.assertEqual(job.filters, 'q=%D0%98%D0%B2%D0%B0%D0%BD%D0%BE%D0%B2')
+        run_export_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_total), ('done', 1))
+
+
+class ContactSearchTests(TestCase):
+    """Поиск людей по нормализованной строке: регистр и ё не важны, совпадение с начала фамилии выше."""
+
+    def setUp(self):
+        self.ivanov = Contact.objects.create(last_name='Иванов', first_name='Пётр')
+        self.petrov = Contact.objects.create(last_name='Петров', first_name='Иван')
+        self.livanov = Contact.objects.create(last_name='Ливанов', first_name='Олег')
+        self.yolkin = Contact.objects.create(last_name='Ёлкин', first_name='Семён', nickname='Ёж')
+
+    def _found(self, term):
+        return list(search_contacts(term))
+
+    def test_normalized_text(self):
+        self.assertEqual(self.yolkin.search_text, 'елкин семен еж')
+        self.assertEqual(self._found('ЕЛКИН'), [self.yolkin])
+        self.assertEqual(self._found('  сёмен   ёлк '), [self.yolkin])
+        self.assertEqual(self._found('петр иванов'), [self.ivanov])
+        self.assertEqual(self._found('   '), [])
+
+    def test_ranking(self):
+        self.assertEqual(self._found('иван'), [self.ivanov, self.petrov, self.livanov])
+
+    def test_backfill_after_migrate(self):
+        Contact.objects.update(search_text='')
+        emit_post_migrate_signal(0, False, 'default')
+        self.assertEqual(self._found('ёлкин'), [self.yolkin])
+        self.assertFalse(Contact.objects.filter(search_text='').exists())
+
+
+class BulkImportTests(TestCase):
+    """Массовый импорт людей и регистраций: повторная загрузка, ошибки строк, предпросмотр."""
+
+    CONTACT_ROWS = [
+        {'last_name': 'Иванов', 'first_name': 'Иван', 'middle_name': '', 'company': 'Ромашка',
+         'social_network_name': 'VK', 'social_network_id': 'ivanov', 'social_network_subscribers': '100'},
+        {'last_name': 'Петров', 'first_name': 'Пётр', 'middle_name': 'Петрович', 'company': 'Ромашка'},
+    ]
+
+    def _bulk_changed(self):
+        senders = []
+
+        def receiver(sender, **kwargs):
+            senders.append(sender)
+        models_bulk_changed.connect(receiver)
+        self.addCleanup(models_bulk_changed.disconnect, receiver)
+        return senders
+
+    def test_contacts_created_then_matched(self):
+        senders = self._bulk_changed()
+        result = ContactBulkImporter().run(self.CONTACT_ROWS)
+        self.assertEqual(result.totals, {'new': 2, 'update': 0, 'skip': 0, 'error': 0})
+        self.assertEqual(senders, [Contact])
+        ivanov = Contact.objects.get(last_name='Иванов')
+        self.assertEqual((ivanov.company.name, ivanov.middle_name), ('Ромашка', None))
+        self.assertEqual(ivanov.search_text, ivanov.build_search_text())
+
+        rows = [dict(self.CONTACT_ROWS[0], company='Лютик', social_network_subscribers='200'), self.CONTACT_ROWS[1]]
+        result = ContactBulkImporter().run(rows)
+        self.assertEqual(result.totals, {'new': 0, 'update': 1, 'skip': 1, 'error': 0})
+        self.assertEqual(Contact.objects.count(), 2)
+        ivanov.refresh_from_db()
+        self.assertEqual(ivanov.company.name, 'Лютик')
+        self.assertEqual(InfoContact.objects.get(contact=ivanov).subscribers, 200)
+
+    def test_contact_row_errors_keep_other_rows(self):
+        rows = [{'last_name': 'Иванов', 'first_name': ''}, self.CONTACT_ROWS[1]]
+        result = ContactBulkImporter().run(rows)
+        self.assertEqual(result.errors, [(1, 'Не заполнены фамилия или имя')])
+        self.assertEqual(list(Contact.objects.values_list('last_name', flat=True)), ['Петров'])
+        with self.assertRaisesMessage(ValueError, 'Строка 1'):
+            ContactBulkImporter().run(rows, raise_errors=True)
+
+    def test_actions_created_once_with_counters(self):
+        ContactBulkImporter().run(self.CONTACT_ROWS)
+        rows = [
+            {'Мероприятие': 'Форум', 'Фамилия': 'Иванов', 'Имя': 'Иван'},
+            {'Мероприятие': 'Форум', 'Фамилия': 'Петров', 'Имя': 'Пётр', 'Отчество': 'Петрович'},
+            {'Мероприятие': 'Форум', 'Фамилия': 'Сидоров', 'Имя': 'Сидор'},
+            {'Мероприятие': '', 'Фамилия': 'Петров', 'Имя': 'Пётр'},
+        ]
+        senders = self._bulk_changed()
+        result = ActionBulkImporter().run(rows)
+        self.assertEqual((result.totals['new'], result.totals['error']), (2, 2))
+        self.assertEqual([line for line, _ in result.errors], [3, 4])
+        self.assertEqual(senders, [ModuleInstance, Action])
+        event = ModuleInstance.objects.get(name='Форум')
+        self.assertEqual(EventStatusCounter.objects.get(event=event).announced, 2)
+
+        result = ActionBulkImporter().run(rows)
+        self.assertEqual((result.totals['new'], result.totals['skip']), (0, 2))
+        self.assertEqual(Action.objects.filter(event=event).count(), 2)
+
+    def test_action_import_dry_run_writes_nothing(self):
+        ContactBulkImporter().run(self.CONTACT_ROWS)
+        dataset = tablib.Dataset(
+            ['Форум', 'Иванов', 'Иван', ''], ['Форум', 'Сидоров', 'Сидор', ''],
+            headers=['Мероприятие', 'Фамилия', 'Имя', 'Отчество'],
+        )
+        result = ActionImport().import_data(dataset, dry_run=True)
+        self.assertFalse(ModuleInstance.objects.exists())
+        self.assertFalse(Action.objects.exists())
+        self.assertEqual([number for number, _ in result.row_errors()], [2])
+
+        del dataset[1]
+        result = ActionImport().import_data(dataset, dry_run=False)
+        self.assertFalse(result.has_errors())
+        self.assertEqual(Action.objects.get().event.name, 'Форум')
+
+
+class ReferenceCacheTests(TestCase):
+    """Переименование справочника в одном процессе сбрасывает кэш «название -> id» в остальных."""
+
+    def setUp(self):
+        self.location = tempfile.TemporaryDirectory()
+        self.addCleanup(self.location.cleanup)
+
+    def _shared_cache(self):
+        return override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': self.location.name,
+        }})
+
+    def test_rename_is_seen_by_other_process(self):
+        with self._shared_cache(), self.captureOnCommitCallbacks(execute=True):
+            # Два экземпляра кэша — словари двух процессов сервера
+            first, second = ReferenceNameCache(CompanyContact), ReferenceNameCache(CompanyContact)
+            company_id = first.get_id('Ромашка')
+            self.assertEqual(second.get_id('Ромашка'), company_id)
+
+            CompanyContact.objects.filter(pk=company_id).update(name='Лютик')
+            first.invalidate()
+            self.assertNotEqual(second.get_id('Ромашка'), company_id)
+
+    def test_multi_word_name_key(self):
+        with self._shared_cache(), warnings.catch_warnings():
+            # Memcached отвергает ключи с пробелами; остальные бэкенды об этом предупреждают
+            warnings.simplefilter('error', CacheKeyWarning)
+            first, second = ReferenceNameCache(CompanyContact), ReferenceNameCache(CompanyContact)
+            with self.captureOnCommitCallbacks(execute=True):
+                company_id = first.get_id('ООО Ромашка')
+            with self.assertNumQueries(0):
+                self.assertEqual(second.get_id('ООО Ромашка'), company_id)
+
+    def test_process_local_cache_warning(self):
+        with override_settings(DEBUG=False):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['event.W001'])
+            with self._shared_cache():
+                self.assertEqual(check_shared_cache(None), [])
+
+
+class DuplicateKeySharedTests(TestCase):
+    """Флаг shared отражает совпадение ключа с ключом другого человека."""
+
+    def _shared(self, contact):
+        return set(ContactDuplicateKey.objects.filter(contact=contact, shared=True).values_list('kind', flat=True))
+
+    def test_shared_follows_matching_keys(self):
+        first = Contact.objects.create(last_name='Иванов', first_name='Иван')
+        second = Contact.objects.create(last_name='Иванов', first_name='Иван')
+        self.assertEqual(self._shared(first), {'name'})
+        self.assertEqual(self._shared(second), {'name'})
+
+        second.last_name = 'Петров'
+        second.save()
+        self.assertEqual(self._shared(first), set())
+
+    def test_refresh_recomputes_missed_flags(self):
+        first = Contact.objects.create(last_name='Иванов', first_name='Иван')
+        second = Contact.objects.create(last_name='Иванов', first_name='Иван')
+        # Как после гонки двух транзакций: каждая видела только свою строку
+        ContactDuplicateKey.objects.update(shared=False)
+        refresh_shared([('name', 'иванов|иван')])
+        self.assertEqual(self._shared(first), {'name'})
+        self.assertEqual(self._shared(second), {'name'})
+
+
+class DuplicateClusterMergeTests(TestCase):
+    """Пакетное объединение групп дублей: однофамильцы пропускаются, объединение — после подтверждения."""
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(phone='+70000000001', password='x')
+        self.pair = [
+            Contact.objects.create(last_name='Ivanov', first_name='Ivan', middle_name='Petrovich'),
+            Contact.objects.create(last_name='IVANOV', first_name='Ivan', middle_name='petrovich'),
+        ]
+        Contact.objects.create(last_name='Петров', first_name='Пётр', middle_name='Иванович')
+        Contact.objects.create(last_name='Петров', first_name='Пётр')
+
+    def test_name_only_link_with_missing_middle_name_is_skipped(self):
+        clusters, skipped = duplicate_clusters()
+        self.assertEqual(clusters, [sorted(contact.pk for contact in self.pair)])
+        self.assertEqual(skipped, 1)
+
+    def test_admin_action_asks_for_confirmation(self):
+        self.client.force_login(self.admin)
+        data = {
+            'action': 'merge_duplicate_clusters_action',
+            '_selected_action': list(Contact.objects.values_list('pk', flat=True)),
+        }
+        response = self.client.post('/admin/event/contact/', data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Отменить объединение нельзя')
+        self.assertEqual(Contact.objects.count(), 4)
+
+        data['apply'] = ''
+        response = self.client.post('/admin/event/contact/', data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Contact.objects.filter(last_name__iexact='Ivanov').count(), 1)
+        self.assertEqual(Contact.objects.filter(last_name='Петров').count(), 2)
+
+
+class FuzzyDuplicateTests(TestCase):
+    """Нечёткий поиск дублей: транслит и опечатки находятся, тёзки и отклонённые пары — нет."""
+
+    def _find(self):
+        save_candidate_pairs(find_candidate_pairs())
+        return {
+            frozenset((pair.contact_a.last_name, pair.contact_b.last_name)): pair.status
+            for pair in DuplicateCandidatePair.objects.select_related('contact_a', 'contact_b')
+        }
+
+    def test_transliteration_and_typo(self):
+        Contact.objects.create(last_name='Иванова', first_name='Мария', middle_name='Петровна')
+        Contact.objects.create(last_name='Ivanova', first_name='Mariya', middle_name='Petrovna')
+        Contact.objects.create(last_name='Кузнецов', first_name='Дмитрий')
+        Contact.objects.create(last_name='Кузнецав', first_name='Дмитрий')
+        self.assertEqual(self._find(), {
+            frozenset(('Иванова', 'Ivanova')): 'new',
+            frozenset(('Кузнецов', 'Кузнецав')): 'new',
+        })
+
+    def test_namesake_with_other_patronymic(self):
+        Contact.objects.create(last_name='Сидоров', first_name='Иван', middle_name='Петрович')
+        Contact.objects.create(last_name='Сидоров', first_name='Иван', middle_name='Сергеевич')
+        Contact.objects.create(last_name='Сидоров', first_name='Иван', middle_name='Александрович')
+        Contact.objects.create(last_name='Сидоров', first_name='Иван', middle_name='Алексеевич')
+        self.assertEqual(self._find(), {})
+
+    def test_dismissed_pair_is_not_proposed_again(self):
+        Contact.objects.create(last_name='Кузнецов', first_name='Дмитрий')
+        Contact.objects.create(last_name='Кузнецав', first_name='Дмитрий')
+        self._find()
+        DuplicateCandidatePair.objects.update(status='dismissed')
+        self.assertEqual(self._find(), {frozenset(('Кузнецов', 'Кузнецав')): 'dismissed'})
+        self.assertEqual(DuplicateCandidatePair.objects.count(), 1)
+
+
+class AccessCacheTests(TestCase):
+    """ACCESS_CACHE_TIMEOUT действует только с общим для процессов кэшем."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(phone='+70000000001', password='x')
+        self.user.groups.add(Group.objects.create(name='Модератор'))
+        self.location = tempfile.TemporaryDirectory()
+        self.addCleanup(self.location.cleanup)
+
+    def _load_twice(self):
+        # Два запроса — два свежих объекта пользователя
+        for _ in range(2):
+            group_names(CustomUser.objects.get(pk=self.user.pk))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(group_names(CustomUser.objects.get(pk=self.user.pk)), {'Модератор'})
+        return len(queries) - 1
+
+    @override_settings(ACCESS_CACHE_TIMEOUT=60)
+    def test_process_local_cache_is_not_used(self):
+        self.assertEqual(self._load_twice(), 1)
+        self.assertEqual([error.id for error in check_access_cache(None)], ['event.W005'])
+
+    @override_settings(ACCESS_CACHE_TIMEOUT=60)
+    def test_shared_cache_is_used(self):
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': self.location.name,
+        }}):
+            self.assertEqual(self._load_twice(), 0)
+            self.assertEqual(check_access_cache(None), [])
+
+
+class TransitionActionTests(TestCase):
+    """Быстрый чекин: доступ и прежний статус проверяются в самом UPDATE."""
+
+    def setUp(self):
+        self.checker = CustomUser.objects.create_user(phone='+70000000001', password='x')
+        self.checker.groups.add(Group.objects.create(name='Модератор'))
+        self.event = ModuleInstance.objects.create(name='Форум')
+        self.event.checkers.add(self.checker)
+        self.contact = Contact.objects.create(last_name='Иванов', first_name='Иван')
+        self.action = Action.objects.create(contact=self.contact, event=self.event, action_type='registered')
+
+    def _error_status(self, user, action_id, action_type='visited'):
+        with self.assertRaises(CheckinError) as raised:
+            transition_action(user, action_id, action_type)
+        return raised.exception.status
+
+    def test_checkin(self):
+        row, update_date = transition_action(self.checker, self.action.pk, 'visited')
+        self.assertEqual(row['action_type'], 'visited')
+        self.action.refresh_from_db()
+        self.assertEqual(self.action.action_type, 'visited')
+        self.assertEqual(self.action.update_user, self.checker)
+        self.assertEqual(self.action.update_date, update_date)
+        log = ActionLog.objects.get(action=self.action)
+        self.assertEqual((log.old_status, log.new_status, log.create_user), ('registered', 'visited', self.checker))
+        counter = EventStatusCounter.objects.get(event=self.event)
+        self.assertEqual((counter.registered, counter.visited), (0, 1))
+
+    def test_errors(self):
+        other_event = ModuleInstance.objects.create(name='Чужое')
+        foreign = Action.objects.create(contact=self.contact, event=other_event, action_type='registered')
+        self.assertEqual(self._error_status(self.checker, self.action.pk, 'unknown'), 400)
+        self.assertEqual(self._error_status(self.checker, foreign.pk), 403)
+        self.assertEqual(self._error_status(self.checker, 0), 404)
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.action_type, 'registered')
+
+    def test_concurrent_change_is_not_overwritten(self):
+        real_now = timezone.now
+
+        def concurrent_scan():
+            # Другой сканер успел изменить запись между чтением и UPDATE
+            Action.objects.filter(pk=self.action.pk).update(action_type='cancelled')
+            return real_now()
+
+        with mock.patch('event.checkin.timezone.now', side_effect=concurrent_scan):
+            self.assertEqual(self._error_status(self.checker, self.action.pk), 409)
+        # Изменение «другого сканера» откатилось вместе с транзакцией чекина; visited не записан
+        self.action.refresh_from_db()
+        self.assertEqual(self.action.action_type, 'registered')
+        self.assertFalse(ActionLog.objects.filter(action=self.action).exists())
+        self.assertEqual(EventStatusCounter.objects.get(event=self.event).visited, 0)
+
+    def test_checkin_view(self):
+        self.client.force_login(self.checker)
+        response = self.client.post(
+            '/actions/checkin/', json.dumps({'action_id': self.action.pk}), content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['id'], data['action_type']), (self.action.pk, 'visited'))
+        self.assertEqual(data['contact']['fio'], 'Иванов Иван')
+
+        response = self.client.post(
+            '/actions/checkin/', json.dumps({'action_id': self.action.pk + 1}), content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_checkin_view_bad_input(self):
+        self.client.force_login(self.checker)
+        for body in ({'action_id': 'abc'}, {'action_id': [1]}, {}, [self.action.pk], 'visited', None):
+            response = self.client.post('/actions/checkin/', json.dumps(body), content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+        self.action.refresh_from_db()
+        self.assertEqual(self.action.action_type, 'registered')
+
+
+class CheckinBatchTests(TestCase):
+    """Пакетный чекин: квитанции по ключам пользователя, повторы и «последний скан побеждает»."""
+
+    def setUp(self):
+        self.checkers = []
+        moderator = Group.objects.create(name='Модератор')
+        self.event = ModuleInstance.objects.create(name='Форум')
+        for phone in ('+70000000001', '+70000000002'):
+            checker = CustomUser.objects.create_user(phone=phone, password='x')
+            checker.groups.add(moderator)
+            self.event.checkers.add(checker)
+            self.checkers.append(checker)
+        self.action = Action.objects.create(
+            contact=Contact.objects.create(last_name='Иванов', first_name='Иван'),
+            event=self.event, action_type='registered',
+        )
+        # Регистрация создана заранее — сканы последних минут позже неё
+        Action.objects.filter(pk=self.action.pk).update(update_date=timezone.now() - timedelta(hours=1))
+
+    def _scan(self, key, action_type, client_time, action=None):
+        return {
+            'key': key, 'action_id': (action or self.action).pk,
+            'action_type': action_type, 'client_time': client_time.isoformat(),
+        }
+
+    def _apply(self, user, *items):
+        return {result['key']: result for result in apply_checkin_batch(user, list(items))}
+
+    def test_same_key_from_different_users(self):
+        now = timezone.now()
+        first = self._apply(self.checkers[0], self._scan('scan-1', 'visited', now - timedelta(minutes=2)))
+        second = self._apply(self.checkers[1], self._scan('scan-1', 'cancelled', now - timedelta(minutes=1)))
+        self.assertEqual((first['scan-1']['status'], first['scan-1']['replayed']), ('applied', False))
+        self.assertEqual((second['scan-1']['status'], second['scan-1']['replayed']), ('applied', False))
+        self.assertEqual(CheckinReceipt.objects.filter(key='scan-1').count(), 2)
+        self.action.refresh_from_db()
+        self.assertEqual(self.action.action_type, 'cancelled')
+
+    def test_replay_returns_stored_result(self):
+        scan = self._scan('scan-1', 'visited', timezone.now() - timedelta(minutes=1))
+        self._apply(self.checkers[0], scan)
+        replay = self._apply(self.checkers[0], scan)['scan-1']
+        self.assertEqual((replay['status'], replay['replayed'], replay['action_type']), ('applied', True, 'visited'))
+        self.assertEqual(ActionLog.objects.filter(action=self.action).count(), 1)
+        self.assertEqual(EventStatusCounter.objects.get(event=self.event).visited, 1)
+
+    def test_last_writer_wins(self):
+        now = timezone.now()
+        results = self._apply(
+            self.checkers[0],
+            self._scan('undo', 'registered', now - timedelta(minutes=1)),
+            self._scan('scan', 'visited', now - timedelta(minutes=2)),
+        )
+        self.assertEqual(results['scan']['status'], 'applied')
+        self.assertEqual(results['undo']['status'], 'applied')
+        self.assertEqual(results['undo']['action_type'], 'registered')
+
+        # Изменение на сервере позже скана с устройства: скан устарел
+        transition_action(self.checkers[1], self.action.pk, 'cancelled')
+        stale = self._apply(self.checkers[0], self._scan('late', 'visited', now - timedelta(seconds=30)))['late']
+        self.assertEqual((stale['status'], stale['action_type']), ('stale', 'cancelled'))
+
+    def test_client_time_is_clamped_to_server_time(self):
+        future = timezone.now() + timedelta(days=1)
+        self._apply(
+            self.checkers[0],
+            self._scan('scan', 'visited', future),
+            self._scan('undo', 'registered', future + timedelta(minutes=1)),
+        )
+        self.action.refresh_from_db()
+        self.assertEqual(self.action.action_type, 'registered')
+        self.assertLessEqual(self.action.update_date, timezone.now())
+
+        # Часы устройства ушли вперёд, но следующий скан с верным временем применяется
+        later = self._apply(self.checkers[1], self._scan('next', 'visited', timezone.now()))['next']
+        self.assertEqual(later['status'], 'applied')
+
+    def test_merge_detaches_receipts_of_removed_actions(self):
+        duplicate = Contact.objects.create(last_name='иванов', first_name='иван')
+        loser = Action.objects.create(contact=duplicate, event=self.event, action_type='registered')
+        Action.objects.filter(pk=loser.pk).update(update_date=timezone.now() - timedelta(hours=1))
+        self._apply(self.checkers[0], self._scan('scan', 'visited', timezone.now(), action=self.action))
+        self._apply(self.checkers[0], self._scan('other', 'cancelled', timezone.now(), action=loser))
+
+        result = merge_duplicate_clusters(duplicate_clusters()[0])
+        self.assertEqual(result['removed'], 1)
+        self.assertFalse(Action.objects.filter(pk=loser.pk).exists())
+        self.assertIsNone(CheckinReceipt.objects.get(key='other').action_id)
+        self.assertEqual(CheckinReceipt.objects.get(key='scan').action_id, self.action.pk)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class CheckinBatchConcurrencyTests(TransactionTestCase):
+    """Одна и та же очередь, отправленная дважды параллельно, применяется один раз без ошибки."""
+
+    def test_parallel_retry(self):
+        event = ModuleInstance.objects.create(name='Форум')
+        user = CustomUser.objects.create_superuser(phone='+70000000001', password='x')
+        action = Action.objects.create(
+            contact=Contact.objects.create(last_name='Иванов', first_name='Иван'), event=event, action_type='registered',
+        )
+        items = [
+            {'key': 'scan-1', 'action_id': action.pk, 'action_type': 'visited', 'client_time': timezone.now().isoformat()},
+            {'key': 'scan-2', 'action_id': action.pk + 1000, 'action_type': 'visited',
+             'client_time': timezone.now().isoformat()},
+        ]
+        started = threading.Barrier(2)
+        results = []
+
+        def send():
+            try:
+                started.wait()
+                results.append(apply_checkin_batch(user, items))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=send) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(sorted(result[0]['replayed'] for result in results), [False, True])
+        self.assertEqual(ActionLog.objects.filter(action=action).count(), 1)
+        self.assertEqual(CheckinReceipt.objects.count(), 2)
+
+
+class LiveChannelTests(TestCase):
+    """Живой канал включается только с бэкендом, который доставит сообщения всем процессам."""
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(phone='+70000000001', password='x')
+        self.event = ModuleInstance.objects.create(name='Форум')
+        self.url = f'/events/{self.event.pk}/live/'
+        self.client.force_login(self.admin)
+
+    def test_disabled_by_default(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    @override_settings(LIVE_EVENTS_BACKEND='local', DEBUG=False)
+    def test_local_backend_requires_debug(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    @override_settings(LIVE_EVENTS_BACKEND='local', DEBUG=True, LIVE_MAX_CONNECTIONS=1)
+    def test_connection_cap(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        frames = iter(response.streaming_content)
+        next(frames)
+        self.assertIn(b'"counters"', next(frames))
+        self.assertEqual(broker.open_streams(), 1)
+
+        refused = self.client.get(self.url)
+        self.assertEqual(refused.status_code, 503)
+        self.assertIn('Retry-After', refused)
+
+        response.close()
+        self.assertEqual(broker.open_streams(), 0)
+
+    @override_settings(LIVE_EVENTS_BACKEND='local', DEBUG=True)
+    def test_stream_releases_db_connection(self):
+        with mock.patch('event.live.connection') as db:
+            db.in_atomic_block = False
+            response = self.client.get(self.url)
+        db.close.assert_called_once_with()
+        response.close()
+
+    @override_settings(LIVE_EVENTS_BACKEND='postgres')
+    def test_postgres_publish_skips_unwatched_events(self):
+        location = tempfile.TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        shared = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location.name,
+        }})
+        changes = {self.event.pk: [{'contact_id': 1, 'old_type': 'registered', 'action_type': 'visited'}]}
+        with shared, mock.patch('event.live._notify') as notify:
+            with self.assertNumQueries(0):
+                live._publish(changes)
+            notify.assert_not_called()
+
+            live._mark_watched(self.event.pk)
+            live._publish(changes)
+            self.assertEqual([call.args[0] for call in notify.call_args_list], [self.event.pk])
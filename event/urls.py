@@ -15,4 +15,8 @@ urlpatterns = [
     path('checkins/<int:pk>/cancel/', cancel_checkin, name='cancel_checkin'),
     path('checkins/<int:pk>/detail/', checkin_detail, name='checkin_detail'),
     path('instance/<int:pk>/checkins/', checkin_list, name='checkin_list'),
+
+    # Фоновые выгрузки
+    path('export-jobs/<int:pk>/', views.export_job_status, name='export_job_status'),
+    path('export-jobs/<int:pk>/download/', views.export_job_download, name='export_job_download'),
 ]
@@ -2,8 +2,10 @@ from django.contrib.auth import login
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
 
-from .models import Action, CustomUser, ModuleInstance
-from django.http import JsonResponse
+from .models import Action, CustomUser, ExportJob, ModuleInstance
+from django.http import FileResponse, Http404, JsonResponse
+from .export_jobs import serialize_export_job
+from .access import ROLE_CHECKER, has_role, user_access
 
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
@@ -24,9 +26,9 @@ def checkin_list(request, pk):
 
     # Если пользователь - проверяющий, проверяем, что inst.checkers=user
     # (или если в админке get_queryset требует event.checkers=user)
-    if request.user.groups.filter(name='Модератор').exists():
+    if has_role(request.user, ROLE_CHECKER):
         # Если мероприятие вообще не связано с этим user, можно запретить доступ
-        if not inst.checkers.filter(pk=request.user.pk).exists():
+        if inst.pk not in user_access(request.user).checked:
             return render(request, 'front/no_access.html')
         # Иначе qs уже правильно отфильтрован
 
@@ -57,8 +59,8 @@ def checkin_detail(request, pk):
     checkin = get_object_or_404(Action, pk=pk)
 
     # Доп. проверка: если "Модератор", убедиться, что checkin.event.checkers содержит user
-    if request.user.groups.filter(name='Модератор').exists():
-        if not checkin.event.checkers.filter(pk=request.user.pk).exists():
+    if has_role(request.user, ROLE_CHECKER):
+        if checkin.event_id not in user_access(request.user).checked:
             return render(request, 'front/no_access.html')
 
     return render(request, 'front/checkin_detail.html', {
@@ -145,3 +147,25 @@ def telegram_admin_auth(request):
 
     except CustomUser.DoesNotExist:
         return redirect('/')
+
+
+### Фоновые выгрузки ###
+
+def _get_export_job(request, pk):
+    job = get_object_or_404(ExportJob, pk=pk)
+    if not (request.user.is_superuser or job.create_user_id == request.user.pk):
+        raise Http404
+    return job
+
+
+@login_required
+def export_job_status(request, pk):
+    return JsonResponse(serialize_export_job(_get_export_job(request, pk)))
+
+
+@login_required
+def export_job_download(request, pk):
+    job = _get_export_job(request, pk)
+    if job.status != 'done' or not job.file:
+        raise Http404
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=job.download_name)
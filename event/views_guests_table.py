@@ -6,11 +6,15 @@
 from django.shortcuts import render, get_object_or_404
 from django.http import JsonResponse
 from django.db import transaction
-from django.db.models import Q
 from django.views.decorators.http import require_http_methods
 import json
 
-from .models import ModuleInstance, Action, Contact, CompanyContact, CategoryContact, TypeGuestContact, CustomUser
+from .models import ModuleInstance, Action, Contact, CompanyContact, CategoryContact, TypeGuestContact
+from .contact_search import search_contacts
+from .producers import get_producer_directory
+from .references import resolve_reference
+from .streaming import StreamingJsonResponse, iterate_queryset
+from .sync import SYNC_MAX_ROWS, changed_actions, deleted_ids, is_expired, make_cursor, parse_cursor
 
 
 def guests_table_view(request, event_id):
@@ -33,46 +37,64 @@ def guests_data_api(request, event_id):
     """
     API для получения данных гостей в JSON формате
     Используется таблицей Tabulator для загрузки данных
+    С ?since=<cursor> — только изменённые и удалённые строки (event/sync.py)
     """
+    cursor = make_cursor()
     # Проверяем существование мероприятия
     event = get_object_or_404(ModuleInstance, pk=event_id)
     
     # Получаем все регистрации для мероприятия
-    actions = Action.objects.filter(event=event).select_related(
+    actions = Action.objects.filter(event=event, contact__isnull=False).select_related(
         'contact',
         'contact__company',
         'contact__category',
         'contact__type_guest',
         'contact__producer'
     ).order_by('contact__last_name', 'contact__first_name')
-    
-    # Формируем данные для таблицы
-    data = []
-    for action in actions:
-        contact = action.contact
-        if not contact:
-            continue
-            
-        data.append({
-            'id': action.id,
-            'contact_id': contact.id,
-            'last_name': contact.last_name or '',
-            'first_name': contact.first_name or '',
-            'middle_name': contact.middle_name or '',
-            'nickname': contact.nickname or '',
-            'company': contact.company.name if contact.company else '',
-            'company_id': contact.company.id if contact.company else None,
-            'category': contact.category.name if contact.category else '',
-            'category_id': contact.category.id if contact.category else None,
-            'type_guest': contact.type_guest.name if contact.type_guest else '',
-            'type_guest_id': contact.type_guest.id if contact.type_guest else None,
-            'producer': f"{contact.producer.last_name} {contact.producer.first_name}" if contact.producer else '',
-            'action_type': action.action_type,
-            'action_type_display': action.get_action_type_display(),
-            'comment': action.comment or '',
+
+    if 'since' in request.GET:
+        try:
+            since = parse_cursor(request.GET['since'])
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        if is_expired(since):
+            return JsonResponse({'reset': True, 'cursor': cursor})
+        changed = list(changed_actions(actions, since)[:SYNC_MAX_ROWS + 1])
+        if len(changed) > SYNC_MAX_ROWS:
+            return JsonResponse({'reset': True, 'cursor': cursor})
+        return JsonResponse({
+            'data': [_serialize_guest_row(action) for action in changed],
+            'deleted': deleted_ids(Action, since, event_id=event.pk),
+            'cursor': cursor,
         })
     
-    return JsonResponse({'data': data})
+    # Строки сериализуются и отдаются клиенту потоком
+    return StreamingJsonResponse(
+        iterate_queryset(actions), _serialize_guest_row, key='data', extra={'cursor': cursor}
+    )
+
+
+def _serialize_guest_row(action):
+    """Строка таблицы гостей"""
+    contact = action.contact
+    return {
+        'id': action.id,
+        'contact_id': contact.id,
+        'last_name': contact.last_name or '',
+        'first_name': contact.first_name or '',
+        'middle_name': contact.middle_name or '',
+        'nickname': contact.nickname or '',
+        'company': contact.company.name if contact.company else '',
+        'company_id': contact.company.id if contact.company else None,
+        'category': contact.category.name if contact.category else '',
+        'category_id': contact.category.id if contact.category else None,
+        'type_guest': contact.type_guest.name if contact.type_guest else '',
+        'type_guest_id': contact.type_guest.id if contact.type_guest else None,
+        'producer': f"{contact.producer.last_name} {contact.producer.first_name}" if contact.producer else '',
+        'action_type': action.action_type,
+        'action_type_display': action.get_action_type_display(),
+        'comment': action.comment or '',
+    }
 
 
 @require_http_methods(["GET"])
@@ -86,13 +108,8 @@ def search_contacts_api(request, event_id):
         if not term:
             return JsonResponse({'results': []})
         
-        # Ищем по фамилии или имени
-        contacts = Contact.objects.filter(
-            Q(last_name__icontains=term) | 
-            Q(first_name__icontains=term) |
-            Q(middle_name__icontains=term) |
-            Q(nickname__icontains=term)
-        ).select_related('company', 'category', 'type_guest', 'producer')[:20]
+        # Ищем по ФИО и нику (event/contact_search.py), лучшие совпадения первыми
+        contacts = search_contacts(term).select_related('company', 'category', 'type_guest', 'producer')[:20]
         
         results = []
         for contact in contacts:
@@ -153,18 +170,7 @@ def autocomplete_api(request, event_id, field):
             results = [{'id': item.id, 'name': item.name} for item in items]
         elif field == 'producer':
             # Ищем только продюсеров
-            if term:
-                items = CustomUser.objects.filter(
-                    groups__name='Продюсер'
-                ).filter(
-                    Q(last_name__icontains=term) | Q(first_name__icontains=term)
-                ).distinct().order_by('last_name', 'first_name')[:20]
-            else:
-                items = CustomUser.objects.filter(
-                    groups__name='Продюсер'
-                ).distinct().order_by('last_name', 'first_name')[:20]
-            
-            results = [{'id': item.id, 'name': f"{item.last_name} {item.first_name}"} for item in items]
+            results = get_producer_directory().autocomplete(term, limit=20)
         else:
             return JsonResponse({'error': 'Invalid field'}, status=400)
         
@@ -239,30 +245,10 @@ def guest_save_api(request, event_id):
             contact.middle_name = data.get('middle_name', '').strip()
             contact.nickname = data.get('nickname', '').strip()
             
-            # Справочники - get_or_create
-            company_name = data.get('company', '').strip()
-            if company_name:
-                contact.company, _ = CompanyContact.objects.get_or_create(
-                    name=company_name
-                )
-            else:
-                contact.company = None
-            
-            category_name = data.get('category', '').strip()
-            if category_name:
-                contact.category, _ = CategoryContact.objects.get_or_create(
-                    name=category_name
-                )
-            else:
-                contact.category = None
-            
-            type_guest_name = data.get('type_guest', '').strip()
-            if type_guest_name:
-                contact.type_guest, _ = TypeGuestContact.objects.get_or_create(
-                    name=type_guest_name
-                )
-            else:
-                contact.type_guest = None
+            # Справочники - по названию через кэш (event/references.py)
+            contact.company = resolve_reference('company', data.get('company'))
+            contact.category = resolve_reference('category', data.get('category'))
+            contact.type_guest = resolve_reference('type_guest', data.get('type_guest'))
             
             # Продюсер - ищем по ФИО
             producer_name = data.get('producer', '').strip()
@@ -270,11 +256,7 @@ def guest_save_api(request, event_id):
                 # Пытаемся найти продюсера по ФИО
                 parts = producer_name.split()
                 if len(parts) >= 2:
-                    producer = CustomUser.objects.filter(
-                        last_name__iexact=parts[0],
-                        first_name__iexact=parts[1],
-                        groups__name='Продюсер'
-                    ).first()
+                    producer = get_producer_directory().resolve(producer_name)
                     if producer:
                         contact.producer = producer
             else:
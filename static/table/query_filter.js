@@ -1,4 +1,4 @@
-/* Простой парсер WHERE для клиентской фильтрации (ZenTable-подобный SELECT). */
+/* Простой парсер WHERE (ZenTable-подобный SELECT); тот же синтаксис разбирает сервер — table/query_filter.py. */
 window.AttendlyQueryFilter = (function () {
   function extractWhere(query) {
     const q = (query || '').trim();
@@ -11,7 +11,7 @@ window.AttendlyQueryFilter = (function () {
       return where.trim();
     }
 
-    if (/^(and|or|\w+\s*(=|!=|<>|like|not\s+like|>|<|>=|<=))/i.test(q)) {
+    if (/^\(*\s*(and|or|\w+\s+is\s|\w+\s*(=|!=|<>|like|not\s+like|>|<|>=|<=))/i.test(q)) {
       return q;
     }
     return '';
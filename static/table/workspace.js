@@ -42,6 +42,13 @@
   let openListOnEditField = null;
   let activeSidePanel = null;
   let activeFilterQuery = '';
+  let unfilteredTotal = null;
+  const PAGE_LIMIT = 1000;
+  // Дельта-синхронизация (?since=): сервер отдаёт только изменённые и удалённые строки
+  const SYNC_DATASETS = ['actions', 'contacts'];
+  const SYNC_INTERVAL_MS = 30000;
+  let syncCursor = null;
+  let syncRunning = false;
   const DEBUG = localStorage.getItem('attendly_table_debug') === '1';
 
   function dbg() {
@@ -899,37 +906,149 @@
     return saved._key;
   }
 
+  function listUrl(after) {
+    const params = new URLSearchParams({ limit: String(PAGE_LIMIT) });
+    if (after !== null && after !== undefined) params.set('after', String(after));
+    if (activeFilterQuery) params.set('where', normalizeFilterQuery(activeFilterQuery));
+    return apiUrl(cfg.dataset + '/') + '?' + params.toString();
+  }
+
+  async function fetchPages(onPage) {
+    let after = null;
+    let total = null;
+    let estimated = false;
+    let loaded = 0;
+    let cursor = null;
+    do {
+      const res = await fetch(listUrl(after), { credentials: 'same-origin' });
+      const payload = await res.json();
+      if (!res.ok) throw new Error(payload.error || 'Ошибка загрузки');
+      if (payload.total !== undefined) {
+        total = payload.total;
+        estimated = !!payload.total_estimated;
+        showServerTotal(total, estimated);
+      }
+      if (payload.cursor !== undefined) cursor = payload.cursor;
+      const rows = prepareRows(payload.data || []);
+      await onPage(rows, after === null);
+      loaded += rows.length;
+      after = payload.next;
+      if (after !== null && after !== undefined) {
+        setStatus('Загрузка… ' + loaded + (total !== null ? ' / ' + (estimated ? '~' : '') + total : ''));
+      }
+    } while (after !== null && after !== undefined);
+    // Все страницы загружены — точное число строк заменяет серверный total (возможно оценку)
+    return { total: loaded, loaded: loaded, cursor: cursor };
+  }
+
+  function showServerTotal(total, estimated) {
+    // Итог с первой страницы виден сразу, пока догружаются остальные; оценка помечается «~»
+    const text = (estimated ? '~' : '') + total;
+    if (activeFilterQuery) {
+      if (footerFiltered) footerFiltered.textContent = 'Найдено: ' + text + (unfilteredTotal !== null ? ' / ' + unfilteredTotal : '');
+    } else {
+      footerStats.textContent = 'Записей: ' + text;
+    }
+  }
+
+  function syncUrl() {
+    const params = new URLSearchParams({ since: syncCursor });
+    if (activeFilterQuery) params.set('where', normalizeFilterQuery(activeFilterQuery));
+    return apiUrl(cfg.dataset + '/') + '?' + params.toString();
+  }
+
+  async function syncChanges() {
+    if (!syncCursor || syncRunning || SYNC_DATASETS.indexOf(cfg.dataset) === -1) return;
+    syncRunning = true;
+    try {
+      const res = await fetch(syncUrl(), { credentials: 'same-origin' });
+      const payload = await res.json();
+      if (!res.ok) throw new Error(payload.error || 'Ошибка синхронизации');
+      if (payload.reset) {
+        // Изменений слишком много или курсор устарел: без локальных правок — полная загрузка
+        if (!pendingChangeCount()) {
+          syncRunning = false;
+          await loadData();
+        }
+        return;
+      }
+      const rowsByKey = new Map();
+      table.getRows().forEach(function (row) { rowsByKey.set(row.getData()._key, row); });
+      // Строки с несохранёнными правками не трогаем: их версию пользователь сохранит сам
+      const locked = function (key) { return dirtyRows.has(key) || pendingDeleteRows.has(key); };
+      const added = [];
+      for (const data of prepareRows(payload.data || [])) {
+        const row = rowsByKey.get(data._key);
+        if (!row) {
+          added.push(data);
+        } else if (!locked(data._key)) {
+          await row.update(data);
+          storeSnapshot(row);
+          refreshRowStyle(row);
+        }
+      }
+      (payload.deleted || []).forEach(function (id) {
+        const key = 'id:' + id;
+        const row = rowsByKey.get(key);
+        if (row && !locked(key)) {
+          rowSnapshots.delete(key);
+          row.delete();
+        }
+      });
+      if (added.length) {
+        const rows = await table.addData(added, false);
+        rows.forEach(function (row) {
+          storeSnapshot(row);
+          refreshRowStyle(row);
+        });
+      }
+      syncCursor = payload.cursor;
+      if (!activeFilterQuery) unfilteredTotal = table.getDataCount();
+      footerStats.textContent = 'Записей: ' + (unfilteredTotal ?? table.getDataCount());
+    } catch (e) {
+      dbg('sync failed', e);
+    } finally {
+      syncRunning = false;
+    }
+  }
+
   async function loadData() {
     if (pendingChangeCount() && !confirm('Есть несохранённые изменения. Синхронизировать и потерять их?')) {
-      return;
+      return false;
     }
     setStatus('Синхронизация…');
+    syncCursor = null;
     await preloadAutocomplete();
-    const res = await fetch(apiUrl(cfg.dataset + '/'), { credentials: 'same-origin' });
-    const payload = await res.json();
-    if (!res.ok) {
-      setStatus(payload.error || 'Ошибка загрузки', 'error');
-      return;
-    }
     dirtyRows.clear();
     pendingDeleteRows.clear();
     undoStack.length = 0;
     selectedRow = null;
     clearSelectedCell();
     openListOnEditField = null;
-    activeFilterQuery = '';
-    if (filterQuery) filterQuery.value = '';
-    const rows = prepareRows(payload.data || []);
-    await table.setData(rows);
-    table.clearFilter();
+    let result;
+    try {
+      result = await fetchPages(async function (rows, first) {
+        if (first) {
+          await table.setData(rows);
+        } else {
+          await table.addData(rows, false);
+        }
+      });
+    } catch (e) {
+      setStatus(e.message || 'Ошибка загрузки', 'error');
+      return false;
+    }
+    syncCursor = result.cursor;
     snapshotAllRows();
     captureColumnDefaults();
     table.getRows().forEach(refreshRowStyle);
-    updateFilterStats(table.getDataCount('active'));
-    footerStats.textContent = 'Записей: ' + (payload.total ?? rows.length);
+    if (!activeFilterQuery) unfilteredTotal = result.total;
+    updateFilterStats(result.total);
+    footerStats.textContent = 'Записей: ' + (unfilteredTotal ?? result.total);
     setStatus('Синхронизировано', 'ok');
     setTimeout(function () { setStatus(''); }, 1500);
     updateToolbar();
+    return true;
   }
 
   async function saveRow(row) {
@@ -1198,12 +1317,8 @@
     updateFilterStats(table ? table.getDataCount('active') : 0);
   }
 
-  function resolveFilterField(data, field) {
-    return data[field];
-  }
-
   function updateFilterStats(visibleCount) {
-    const total = table ? table.getDataCount() : 0;
+    const total = unfilteredTotal ?? (table ? table.getDataCount() : 0);
     const text = 'Найдено: ' + visibleCount;
     if (filterCount) filterCount.textContent = text;
     if (footerFiltered) {
@@ -1222,42 +1337,37 @@
     return q;
   }
 
-  function applyQueryFilter() {
+  async function applyQueryFilter() {
     const conditions = filterQuery ? filterQuery.value.trim() : '';
-    activeFilterQuery = conditions;
-    if (!conditions) {
-      table.clearFilter();
-      updateFilterStats(table.getDataCount());
-      updateToolbar();
-      setStatus('Фильтр сброшен');
-      setTimeout(function () { setStatus(''); }, 1200);
+    if (conditions && !window.AttendlyQueryFilter.extractWhere(conditions)) {
+      setStatus('Не удалось разобрать запрос. Используйте WHERE …', 'error');
       return;
     }
-    const compiled = window.AttendlyQueryFilter.compile(
-      normalizeFilterQuery(conditions),
-      resolveFilterField
-    );
-    if (!compiled) {
-      setStatus('Не удалось разобрать запрос. Используйте WHERE …', 'error');
+    const previous = activeFilterQuery;
+    activeFilterQuery = conditions;
+    if (!(await loadData())) {
+      activeFilterQuery = previous;
+      updateToolbar();
       return;
     }
-    table.setFilter(function (data) {
-      return compiled(data);
-    });
-    updateFilterStats(table.getDataCount('active'));
-    updateToolbar();
-    setStatus('Фильтр применён', 'ok');
+    setStatus(conditions ? 'Фильтр применён' : 'Фильтр сброшен', 'ok');
     setTimeout(function () { setStatus(''); }, 1500);
   }
 
-  function resetQueryFilter() {
-    activeFilterQuery = '';
+  async function resetQueryFilter() {
     if (filterQuery) filterQuery.value = '';
-    if (table) {
-      table.clearFilter();
-      updateFilterStats(table.getDataCount());
+    if (!activeFilterQuery) {
+      updateFilterStats(table ? table.getDataCount() : 0);
+      updateToolbar();
+      return;
+    }
+    const previous = activeFilterQuery;
+    activeFilterQuery = '';
+    if (!(await loadData())) {
+      activeFilterQuery = previous;
+      updateToolbar();
+      return;
     }
-    updateToolbar();
     setStatus('Фильтр сброшен');
     setTimeout(function () { setStatus(''); }, 1200);
   }
@@ -1371,6 +1481,10 @@
     });
 
     loadData();
+    setInterval(function () {
+      if (document.hidden || document.querySelector('#attendly-table .tabulator-editing')) return;
+      syncChanges();
+    }, SYNC_INTERVAL_MS);
   }
 
   btnFilter.addEventListener('click', function (e) {
@@ -1405,9 +1519,45 @@
   btnCancel.addEventListener('click', cancelAllChanges);
   btnSettings.addEventListener('click', resetTableLayout);
 
+  function sleep(ms) {
+    return new Promise(function (resolve) { setTimeout(resolve, ms); });
+  }
+
+  async function runExportJob() {
+    btnExport.disabled = true;
+    try {
+      const res = await fetch(cfg.gridConfig.exportJobUrl, {
+        method: 'POST',
+        credentials: 'same-origin',
+        headers: csrfHeaders(),
+        body: JSON.stringify({ format: 'xlsx' }),
+      });
+      let job = await res.json();
+      if (!res.ok) throw new Error(job.error || 'Ошибка выгрузки');
+      while (job.status === 'pending' || job.status === 'running') {
+        setStatus('Выгрузка: ' + job.status_display + (job.rows_total ? ' ' + job.progress + '%' : ''));
+        await sleep(2000);
+        const poll = await fetch(job.status_url, { credentials: 'same-origin' });
+        job = await poll.json();
+        if (!poll.ok) throw new Error(job.error || 'Ошибка выгрузки');
+      }
+      if (job.status !== 'done') throw new Error(job.error || 'Выгрузка не удалась');
+      setStatus('Выгрузка готова', 'ok');
+      window.location.href = job.download_url;
+    } catch (err) {
+      setStatus(err.message, 'error');
+    } finally {
+      btnExport.disabled = false;
+    }
+  }
+
   if (cfg.gridConfig.exportUrl) {
     btnExport.hidden = false;
     btnExport.addEventListener('click', function () {
+      if (cfg.gridConfig.exportJobUrl) {
+        runExportJob();
+        return;
+      }
       window.location.href = cfg.gridConfig.exportUrl;
     });
   }
@@ -1,13 +1,35 @@
 import json
 
-from django.http import JsonResponse, HttpResponse
+from django.conf import settings
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
 from django.views.decorators.http import require_http_methods
 
 from event.models import Action, Contact, ModuleInstance, CompanyContact, CategoryContact, TypeGuestContact
 from event.resources import ContactExport, ActionExport
+from event.export_jobs import create_export_job, serialize_export_job
+from event.export_stream import EXPORT_FORMATS, export_response
+from event.streaming import StreamingJsonResponse
+from event.sync import (
+    SYNC_MAX_ROWS,
+    changed_actions,
+    changed_contacts,
+    deleted_ids,
+    is_expired,
+    make_cursor,
+    parse_cursor,
+)
 
 from .decorators import table_staff_required
+from .projections import project_actions, project_contacts, project_models
+from .query_filter import (
+    ACTION_FILTER_FIELDS,
+    CONTACT_FILTER_FIELDS,
+    EVENT_FILTER_FIELDS,
+    REFERENCE_FILTER_FIELDS,
+    filter_queryset,
+)
+from .totals import dataset_total, resolve_mode
 from .services import (
     serialize_contact,
     save_contact,
@@ -28,6 +50,10 @@ REFERENCE_MODELS = {
     'type_guests': TypeGuestContact,
 }
 
+PAGE_LIMIT_DEFAULT = 500
+PAGE_LIMIT_MAX = 2000
+PAGINATION_PARAMS = ('after', 'limit', 'where')
+
 
 def _parse_json(request):
     try:
@@ -36,40 +62,123 @@ def _parse_json(request):
         return None
 
 
+def _paginated_response(request, dataset, qs, project, filter_fields):
+    """
+    Keyset-пагинация по id: ?after=<id последней строки>&limit=&where=<WHERE-фильтр>.
+    В ответе next — курсор следующей страницы (None, если страниц больше нет).
+    total и cursor (для ?since=, см. _delta_response) отдаются только на первой странице.
+    """
+    cursor = make_cursor()
+    try:
+        after = int(request.GET['after']) if request.GET.get('after') else None
+        limit = int(request.GET.get('limit') or PAGE_LIMIT_DEFAULT)
+    except ValueError:
+        return JsonResponse({'error': 'after и limit должны быть числами'}, status=400)
+    limit = max(1, min(limit, PAGE_LIMIT_MAX))
+
+    where = request.GET.get('where', '')
+    try:
+        qs = filter_queryset(qs, where, filter_fields)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    qs = qs.order_by('id')
+    page_qs = qs.filter(id__gt=after) if after is not None else qs
+    rows = list(project(page_qs[:limit + 1]))
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    payload = {
+        'data': rows,
+        'next': rows[-1]['id'] if has_more else None,
+    }
+    if after is None:
+        payload['total'], payload['total_estimated'] = dataset_total(
+            dataset, qs, where, resolve_mode(request)
+        )
+        payload['cursor'] = cursor
+    return JsonResponse(payload)
+
+
+def _streaming_list(request, dataset, qs, project, limit):
+    """Полный список (без пагинации) отдаётся потоком: {"data": [...], "total": N, "cursor": ...}."""
+    mode = resolve_mode(request)
+    return StreamingJsonResponse(
+        project(qs[:limit]),
+        key='data',
+        extra={'total': lambda: dataset_total(dataset, qs, mode=mode)[0], 'cursor': make_cursor()},
+    )
+
+
+def _delta_response(request, model, qs, changed, project, filter_fields):
+    """
+    ?since=<cursor>[&where=]: строки, изменённые после курсора, и id удалённых (event/sync.py).
+    Изменённые строки, которые больше не проходят where, тоже попадают в deleted —
+    из открытой таблицы они уходят. reset: true — курсор устарел или изменений слишком
+    много, таблицу нужно загрузить заново.
+    """
+    cursor = make_cursor()
+    try:
+        since = parse_cursor(request.GET['since'])
+        matching = filter_queryset(qs, request.GET.get('where', ''), filter_fields)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    if is_expired(since):
+        return JsonResponse({'reset': True, 'cursor': cursor})
+
+    rows = list(project(changed(matching, since).order_by('id')[:SYNC_MAX_ROWS + 1]))
+    if len(rows) > SYNC_MAX_ROWS:
+        return JsonResponse({'reset': True, 'cursor': cursor})
+    deleted = deleted_ids(model, since)
+    if request.GET.get('where'):
+        shown = {row['id'] for row in rows}
+        deleted = sorted(set(deleted) | {
+            pk for pk in changed(qs, since).values_list('id', flat=True) if pk not in shown
+        })
+    return JsonResponse({'data': rows, 'deleted': deleted, 'cursor': cursor})
+
+
 @table_staff_required
 @require_http_methods(['GET'])
 def dataset_list(request, dataset):
+    paginated = any(param in request.GET for param in PAGINATION_PARAMS)
+
     if dataset == 'actions' and request.user.has_perm('event.view_action'):
-        qs = Action.objects.select_related(
-            'contact',
-            'contact__company',
-            'contact__category',
-            'contact__type_guest',
-            'contact__producer',
-            'event',
-        ).order_by('-event__date_start', 'contact__last_name', 'contact__first_name')
-        data = [serialize_action(a) for a in qs[:10000]]
-        return JsonResponse({'data': data, 'total': qs.count()})
+        qs = Action.objects.all()
+        if 'since' in request.GET:
+            return _delta_response(request, Action, qs, changed_actions, project_actions, ACTION_FILTER_FIELDS)
+        if paginated:
+            return _paginated_response(request, dataset, qs, project_actions, ACTION_FILTER_FIELDS)
+        qs = qs.order_by('-event__date_start', 'contact__last_name', 'contact__first_name')
+        return _streaming_list(request, dataset, qs, project_actions, 10000)
 
     if dataset == 'contacts' and request.user.has_perm('event.view_contact'):
-        qs = Contact.objects.select_related(
-            'company', 'category', 'type_guest', 'producer'
-        ).order_by('last_name', 'first_name')
-        data = [serialize_contact(c) for c in qs[:5000]]
-        return JsonResponse({'data': data, 'total': qs.count()})
+        qs = Contact.objects.all()
+        if 'since' in request.GET:
+            return _delta_response(request, Contact, qs, changed_contacts, project_contacts, CONTACT_FILTER_FIELDS)
+        if paginated:
+            return _paginated_response(request, dataset, qs, project_contacts, CONTACT_FILTER_FIELDS)
+        qs = qs.order_by('last_name', 'first_name')
+        return _streaming_list(request, dataset, qs, project_contacts, 5000)
 
     if dataset == 'events' and request.user.has_perm('event.view_moduleinstance'):
-        qs = ModuleInstance.objects.order_by('-date_start', 'name')
-        data = [serialize_event(e) for e in qs[:2000]]
-        return JsonResponse({'data': data, 'total': qs.count()})
+        qs = ModuleInstance.objects.all()
+        project = project_models(serialize_event)
+        if paginated:
+            return _paginated_response(request, dataset, qs, project, EVENT_FILTER_FIELDS)
+        qs = qs.order_by('-date_start', 'name')
+        return _streaming_list(request, dataset, qs, project, 2000)
 
     if dataset in REFERENCE_MODELS and request.user.has_perm(
         f'event.view_{REFERENCE_MODELS[dataset]._meta.model_name}'
     ):
         model = REFERENCE_MODELS[dataset]
-        qs = model.objects.order_by('name')
-        data = [serialize_reference(i) for i in qs[:2000]]
-        return JsonResponse({'data': data, 'total': qs.count()})
+        qs = model.objects.all()
+        project = project_models(serialize_reference)
+        if paginated:
+            return _paginated_response(request, dataset, qs, project, REFERENCE_FILTER_FIELDS)
+        qs = qs.order_by('name')
+        return _streaming_list(request, dataset, qs, project, 2000)
 
     return JsonResponse({'error': 'Not found'}, status=404)
 
@@ -208,19 +317,21 @@ def autocomplete(request, field):
     return JsonResponse({'error': 'Invalid field'}, status=400)
 
 
+def _export_format(request):
+    file_format = request.GET.get('format', 'xlsx')
+    return file_format if file_format in EXPORT_FORMATS else None
+
+
 @table_staff_required
 @require_http_methods(['GET'])
 def export_contacts(request):
     if not request.user.has_perm('event.view_contact'):
         return JsonResponse({'error': 'Forbidden'}, status=403)
-    resource = ContactExport()
-    dataset = resource.export(Contact.objects.all())
-    response = HttpResponse(
-        dataset.xlsx,
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-    )
-    response['Content-Disposition'] = 'attachment; filename="contacts.xlsx"'
-    return response
+    file_format = _export_format(request)
+    if file_format is None:
+        return JsonResponse({'error': 'Неизвестный формат выгрузки'}, status=400)
+    qs = Contact.objects.select_related('company', 'category', 'type_guest', 'producer')
+    return export_response(ContactExport(), qs, 'contacts', file_format)
 
 
 @table_staff_required
@@ -228,16 +339,32 @@ def export_contacts(request):
 def export_actions(request):
     if not request.user.has_perm('event.view_action'):
         return JsonResponse({'error': 'Forbidden'}, status=403)
-    resource = ActionExport()
-    dataset = resource.export(
-        Action.objects.select_related(
-            'contact', 'contact__company', 'contact__category',
-            'contact__type_guest', 'contact__producer', 'event',
-        ).all()
-    )
-    response = HttpResponse(
-        dataset.xlsx,
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-    )
-    response['Content-Disposition'] = 'attachment; filename="actions.xlsx"'
-    return response
+    file_format = _export_format(request)
+    if file_format is None:
+        return JsonResponse({'error': 'Неизвестный формат выгрузки'}, status=400)
+    return export_response(ActionExport(), Action.objects.all(), 'actions', file_format)
+
+
+EXPORT_JOB_PERMISSIONS = {
+    'actions': 'event.view_action',
+    'contacts': 'event.view_contact',
+}
+
+
+@table_staff_required
+@require_http_methods(['POST'])
+def export_job_create(request, dataset):
+    """Ставит выгрузку в очередь фонового воркера; клиент опрашивает status_url."""
+    permission = EXPORT_JOB_PERMISSIONS.get(dataset)
+    if permission is None or not settings.EXPORT_JOBS_ENABLED:
+        return JsonResponse({'error': 'Not found'}, status=404)
+    if not request.user.has_perm(permission):
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    data = _parse_json(request) if request.body else {}
+    if data is None:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    try:
+        job = create_export_job(request.user, dataset, data.get('format') or 'xlsx')
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse(serialize_export_job(job), status=202)
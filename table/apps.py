@@ -5,3 +5,7 @@ class TableConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'table'
     verbose_name = 'Attendly Table'
+
+    def ready(self):
+        from .totals import connect_signals
+        connect_signals()
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from event.models import Action, Contact
+from table.projections import project_actions, project_contacts
+from table.services import serialize_action, serialize_contact
+
+
+class Command(BaseCommand):
+    help = "Сравнивает сериализацию строк /table/ через модели и через проекцию .values()"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=10000, help='Сколько строк читать')
+        parser.add_argument('--repeat', type=int, default=3, help='Количество прогонов')
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        repeat = options['repeat']
+
+        actions = Action.objects.order_by('id')[:limit]
+        contacts = Contact.objects.order_by('id')[:limit]
+
+        cases = [
+            ('actions: модели', lambda: [
+                serialize_action(a) for a in actions.select_related(
+                    'contact', 'contact__company', 'contact__category',
+                    'contact__type_guest', 'contact__producer', 'event',
+                )
+            ]),
+            ('actions: проекция', lambda: list(project_actions(actions))),
+            ('contacts: модели', lambda: [
+                serialize_contact(c) for c in contacts.select_related(
+                    'company', 'category', 'type_guest', 'producer',
+                )
+            ]),
+            ('contacts: проекция', lambda: list(project_contacts(contacts))),
+        ]
+
+        for title, run in cases:
+            best = None
+            rows = 0
+            queries = 0
+            for _ in range(repeat):
+                with CaptureQueriesContext(connection) as ctx:
+                    started = time.perf_counter()
+                    rows = len(run())
+                    elapsed = time.perf_counter() - started
+                queries = len(ctx.captured_queries)
+                best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write(
+                f'{title:<20} строк: {rows:>7}  запросов: {queries:>3}  лучшее время: {best * 1000:.1f} мс'
+            )
@@ -0,0 +1,88 @@
+"""
+Проекция строк /table/ через .values(): те же словари, что serialize_action/serialize_contact,
+но без создания экземпляров Contact, CompanyContact, CustomUser и т.д. — один SELECT с JOIN.
+"""
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Trim
+
+from event.streaming import iterate_queryset
+
+
+def _full_name(prefix):
+    return Trim(Concat(f'{prefix}last_name', Value(' '), f'{prefix}first_name'))
+
+
+ACTION_VALUES = {
+    'p_event': F('event__name'),
+    'p_last_name': F('contact__last_name'),
+    'p_first_name': F('contact__first_name'),
+    'p_middle_name': F('contact__middle_name'),
+    'p_nickname': F('contact__nickname'),
+    'p_company': F('contact__company__name'),
+    'p_category': F('contact__category__name'),
+    'p_type_guest': F('contact__type_guest__name'),
+    'p_producer': _full_name('contact__producer__'),
+}
+
+CONTACT_VALUES = {
+    'p_company': F('company__name'),
+    'p_category': F('category__name'),
+    'p_type_guest': F('type_guest__name'),
+    'p_producer': _full_name('producer__'),
+}
+
+
+def project_actions(queryset):
+    """QuerySet Action -> словари в формате serialize_action."""
+    rows = queryset.values(
+        'id', 'contact_id', 'action_type', 'comment', 'update_date', **ACTION_VALUES
+    )
+    for row in iterate_queryset(rows):
+        has_contact = row['contact_id'] is not None
+        yield {
+            'id': row['id'],
+            'contact_id': row['contact_id'],
+            'event': row['p_event'] or '',
+            'last_name': row['p_last_name'] or '',
+            'first_name': row['p_first_name'] or '',
+            'middle_name': row['p_middle_name'] or '',
+            'nickname': row['p_nickname'] or '',
+            'company': row['p_company'] or '',
+            'category': row['p_category'] or '',
+            'type_guest': row['p_type_guest'] or '',
+            'producer': (row['p_producer'] or '') if has_contact else '',
+            'action_type': row['action_type'] or 'announced',
+            'comment': row['comment'] or '',
+            'update_date': (
+                row['update_date'].strftime('%d.%m.%Y %H:%M')
+                if row['update_date'] else ''
+            ),
+        }
+
+
+def project_contacts(queryset):
+    """QuerySet Contact -> словари в формате serialize_contact."""
+    rows = queryset.values(
+        'id', 'last_name', 'first_name', 'middle_name', 'nickname', 'comment', **CONTACT_VALUES
+    )
+    for row in iterate_queryset(rows):
+        yield {
+            'id': row['id'],
+            'last_name': row['last_name'] or '',
+            'first_name': row['first_name'] or '',
+            'middle_name': row['middle_name'] or '',
+            'nickname': row['nickname'] or '',
+            'company': row['p_company'] or '',
+            'category': row['p_category'] or '',
+            'type_guest': row['p_type_guest'] or '',
+            'producer': row['p_producer'] or '',
+            'comment': row['comment'] or '',
+        }
+
+
+def project_models(serializer):
+    """Проекция для небольших справочников: обычная сериализация экземпляров."""
+    def project(queryset):
+        for obj in iterate_queryset(queryset):
+            yield serializer(obj)
+    return project
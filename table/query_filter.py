@@ -0,0 +1,268 @@
+"""
+Серверный разбор WHERE-фильтра /table/ (тот же синтаксис, что в static/table/query_filter.js).
+
+Условия транслируются в ORM Q-объекты, поэтому фильтрация выполняется в БД
+по индексированным колонкам, а не в браузере.
+"""
+import re
+from datetime import datetime
+
+from django.db.models import Q, Value
+from django.db.models.functions import Concat, Trim
+from django.utils import timezone
+
+from event.models import STATUS_MODEL
+
+STATUS_BY_LABEL = {label.lower(): key for key, label in STATUS_MODEL}
+
+_WHERE_RE = re.compile(r'\bwhere\b([\s\S]+)$', re.IGNORECASE)
+_TAIL_RE = re.compile(r'\s+\b(order\s+by|limit|offset)\b[\s\S]*$', re.IGNORECASE)
+_BARE_RE = re.compile(r'^\(*\s*(and|or|\w+\s+is\s|\w+\s*(=|!=|<>|like|not\s+like|>|<|>=|<=))', re.IGNORECASE)
+_NULL_RE = re.compile(r'^(\w+)\s+is\s+(not\s+)?null$', re.IGNORECASE)
+_LIKE_RE = re.compile(r'^(\w+)\s+(not\s+)?like\s+(.+)$', re.IGNORECASE)
+_CMP_RE = re.compile(r'^(\w+)\s*(=|!=|<>|>=|<=|>|<)\s*(.+)$', re.IGNORECASE)
+_OR_RE = re.compile(r'\s+OR\s+', re.IGNORECASE)
+_AND_RE = re.compile(r'\s+AND\s+', re.IGNORECASE)
+
+_CMP_LOOKUPS = {'>': 'gt', '<': 'lt', '>=': 'gte', '<=': 'lte'}
+_DATE_FORMATS = ('%d.%m.%Y %H:%M', '%d.%m.%Y', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+
+class FilterField:
+    """
+    Описание поля фильтра: путь в ORM и тип значения (text/number/date/status/bool).
+    expression — вычисляемое поле, добавляется в annotate() только если фильтр его использует.
+    """
+
+    def __init__(self, path, kind='text', expression=None):
+        self.path = path
+        self.kind = kind
+        self.expression = expression
+
+
+def _full_name(prefix):
+    return Trim(Concat(f'{prefix}last_name', Value(' '), f'{prefix}first_name'))
+
+
+ACTION_FILTER_FIELDS = {
+    'id': FilterField('id', 'number'),
+    'contact_id': FilterField('contact_id', 'number'),
+    'event': FilterField('event__name'),
+    'last_name': FilterField('contact__last_name'),
+    'first_name': FilterField('contact__first_name'),
+    'middle_name': FilterField('contact__middle_name'),
+    'nickname': FilterField('contact__nickname'),
+    'company': FilterField('contact__company__name'),
+    'category': FilterField('contact__category__name'),
+    'type_guest': FilterField('contact__type_guest__name'),
+    'producer': FilterField('_producer_name', expression=_full_name('contact__producer__')),
+    'action_type': FilterField('action_type', 'status'),
+    'comment': FilterField('comment'),
+    'update_date': FilterField('update_date', 'date'),
+}
+
+CONTACT_FILTER_FIELDS = {
+    'id': FilterField('id', 'number'),
+    'last_name': FilterField('last_name'),
+    'first_name': FilterField('first_name'),
+    'middle_name': FilterField('middle_name'),
+    'nickname': FilterField('nickname'),
+    'company': FilterField('company__name'),
+    'category': FilterField('category__name'),
+    'type_guest': FilterField('type_guest__name'),
+    'producer': FilterField('_producer_name', expression=_full_name('producer__')),
+    'comment': FilterField('comment'),
+}
+
+EVENT_FILTER_FIELDS = {
+    'id': FilterField('id', 'number'),
+    'name': FilterField('name'),
+    'address': FilterField('address'),
+    'date_start': FilterField('date_start', 'date'),
+    'date_end': FilterField('date_end', 'date'),
+    'is_visible': FilterField('is_visible', 'bool'),
+}
+
+REFERENCE_FILTER_FIELDS = {
+    'id': FilterField('id', 'number'),
+    'name': FilterField('name'),
+    'comment': FilterField('comment'),
+}
+
+
+def extract_where(query):
+    q = (query or '').strip()
+    if not q:
+        return ''
+    match = _WHERE_RE.search(q)
+    if match:
+        return _TAIL_RE.sub('', match.group(1).strip()).strip()
+    if _BARE_RE.match(q):
+        return q
+    return ''
+
+
+def _unquote(value):
+    v = (value or '').strip()
+    if len(v) >= 2 and v[0] == v[-1] and v[0] in ('"', "'"):
+        return v[1:-1]
+    return v
+
+
+def _split_top_level(text, sep_re):
+    parts = []
+    depth = 0
+    current = ''
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth = max(0, depth - 1)
+        if depth == 0:
+            match = sep_re.match(text, i)
+            if match:
+                if current.strip():
+                    parts.append(current.strip())
+                current = ''
+                i = match.end()
+                continue
+        current += ch
+        i += 1
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def _parse_condition(cond):
+    c = cond.strip()
+    if c.startswith('(') and c.endswith(')'):
+        c = c[1:-1].strip()
+
+    match = _NULL_RE.match(c)
+    if match:
+        return match.group(1), 'isnotnull' if match.group(2) else 'isnull', None
+
+    match = _LIKE_RE.match(c)
+    if match:
+        return match.group(1), 'notlike' if match.group(2) else 'like', _unquote(match.group(3))
+
+    match = _CMP_RE.match(c)
+    if match:
+        op = match.group(2)
+        if op == '<>':
+            op = '!='
+        return match.group(1), op, _unquote(match.group(3))
+
+    raise ValueError(f'Не удалось разобрать условие: {cond}')
+
+
+def _like_q(path, pattern):
+    body = pattern.strip('%')
+    if '_' in pattern or '%' in body:
+        regex = re.escape(pattern).replace('%', '.*').replace('_', '.')
+        return Q(**{f'{path}__iregex': f'^{regex}$'})
+    if pattern.startswith('%') and pattern.endswith('%') and len(pattern) > 1:
+        return Q(**{f'{path}__icontains': body})
+    if pattern.endswith('%'):
+        return Q(**{f'{path}__istartswith': body})
+    if pattern.startswith('%'):
+        return Q(**{f'{path}__iendswith': body})
+    return Q(**{f'{path}__iexact': pattern})
+
+
+def _convert_value(field, value):
+    if field.kind == 'number':
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'Ожидается число: {value}')
+    if field.kind == 'status':
+        return STATUS_BY_LABEL.get(value.lower(), value)
+    if field.kind == 'bool':
+        return value.strip().lower() in ('да', '1', 'true', 'yes')
+    if field.kind == 'date':
+        for fmt in _DATE_FORMATS:
+            try:
+                dt = datetime.strptime(value.strip(), fmt)
+            except ValueError:
+                continue
+            return timezone.make_aware(dt, timezone.get_current_timezone())
+        raise ValueError(f'Неверный формат даты: {value}')
+    return value
+
+
+def _condition_q(cond, fields, used):
+    name, op, raw = _parse_condition(cond)
+    field = fields.get(name)
+    if field is None:
+        raise ValueError(f'Неизвестное поле: {name}')
+    used.add(name)
+    path = field.path
+
+    if op in ('isnull', 'isnotnull'):
+        q = Q(**{f'{path}__isnull': True})
+        if field.kind == 'text':
+            q |= Q(**{path: ''})
+        return ~q if op == 'isnotnull' else q
+
+    if op in ('like', 'notlike'):
+        q = _like_q(path, raw)
+        return ~q if op == 'notlike' else q
+
+    value = _convert_value(field, raw)
+    if op in ('=', '!='):
+        lookup = f'{path}__iexact' if field.kind == 'text' else path
+        q = Q(**{lookup: value})
+        return ~q if op == '!=' else q
+    return Q(**{f'{path}__{_CMP_LOOKUPS[op]}': value})
+
+
+def _group_q(expr, fields, used):
+    or_parts = _split_top_level(expr, _OR_RE)
+    if len(or_parts) > 1:
+        q = Q()
+        for part in or_parts:
+            q |= _group_q(part, fields, used)
+        return q
+
+    q = Q()
+    for part in _split_top_level(expr, _AND_RE):
+        upper = part.upper()
+        if ' AND ' in upper or ' OR ' in upper or (part.startswith('(') and part.endswith(')')):
+            inner = part[1:-1] if part.startswith('(') and part.endswith(')') else part
+            q &= _group_q(inner, fields, used)
+        else:
+            q &= _condition_q(part, fields, used)
+    return q
+
+
+def compile_where(query, fields):
+    """
+    Переводит строку вида «WHERE last_name LIKE '%Иванов%' AND action_type = 'registered'»
+    в Q-объект. Возвращает (Q, использованные поля); пустой запрос — (None, set()),
+    ошибка синтаксиса — ValueError.
+    """
+    where = extract_where(query)
+    if not where:
+        if (query or '').strip():
+            raise ValueError('Не удалось разобрать запрос. Используйте WHERE …')
+        return None, set()
+    used = set()
+    return _group_q(where, fields, used), used
+
+
+def filter_queryset(queryset, query, fields):
+    """Применяет WHERE-фильтр к queryset, добавляя нужные вычисляемые поля."""
+    q, used = compile_where(query, fields)
+    if q is None:
+        return queryset
+    annotations = {
+        fields[name].path: fields[name].expression
+        for name in used
+        if fields[name].expression is not None
+    }
+    if annotations:
+        queryset = queryset.annotate(**annotations)
+    return queryset.filter(q)
@@ -1,18 +1,15 @@
 from django.db import transaction, IntegrityError
-from django.db.models import Q
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 
 from event.models import (
     Action,
     Contact,
-    CompanyContact,
-    CategoryContact,
-    TypeGuestContact,
     ModuleInstance,
-    CustomUser,
     STATUS_MODEL,
 )
+from event.producers import get_producer_directory
+from event.references import resolve_reference
 
 STATUS_LABELS = dict(STATUS_MODEL)
 STATUS_BY_LABEL = {label: key for key, label in STATUS_MODEL}
@@ -37,20 +34,7 @@ def serialize_contact(contact):
 
 
 def _resolve_producer(name):
-    name = (name or '').strip()
-    if not name:
-        return None
-    parts = name.split()
-    if len(parts) >= 2:
-        return CustomUser.objects.filter(
-            last_name__iexact=parts[0],
-            first_name__iexact=parts[1],
-            groups__name='Продюсер',
-        ).first()
-    return CustomUser.objects.filter(
-        last_name__iexact=parts[0],
-        groups__name='Продюсер',
-    ).first()
+    return get_producer_directory().resolve(name)
 
 
 def save_contact(data, contact_id=None):
@@ -71,23 +55,9 @@ def save_contact(data, contact_id=None):
         contact.nickname = (data.get('nickname') or '').strip() or None
         contact.comment = (data.get('comment') or '').strip() or None
 
-        company_name = (data.get('company') or '').strip()
-        contact.company = (
-            CompanyContact.objects.get_or_create(name=company_name)[0]
-            if company_name else None
-        )
-
-        category_name = (data.get('category') or '').strip()
-        contact.category = (
-            CategoryContact.objects.get_or_create(name=category_name)[0]
-            if category_name else None
-        )
-
-        type_guest_name = (data.get('type_guest') or '').strip()
-        contact.type_guest = (
-            TypeGuestContact.objects.get_or_create(name=type_guest_name)[0]
-            if type_guest_name else None
-        )
+        contact.company = resolve_reference('company', data.get('company'))
+        contact.category = resolve_reference('category', data.get('category'))
+        contact.type_guest = resolve_reference('type_guest', data.get('type_guest'))
 
         contact.producer = _resolve_producer(data.get('producer'))
 
@@ -241,23 +211,9 @@ def _apply_contact_fields(contact, data):
     contact.middle_name = (data.get('middle_name') or '').strip() or None
     contact.nickname = (data.get('nickname') or '').strip() or None
 
-    company_name = (data.get('company') or '').strip()
-    contact.company = (
-        CompanyContact.objects.get_or_create(name=company_name)[0]
-        if company_name else None
-    )
-
-    category_name = (data.get('category') or '').strip()
-    contact.category = (
-        CategoryContact.objects.get_or_create(name=category_name)[0]
-        if category_name else None
-    )
-
-    type_guest_name = (data.get('type_guest') or '').strip()
-    contact.type_guest = (
-        TypeGuestContact.objects.get_or_create(name=type_guest_name)[0]
-        if type_guest_name else None
-    )
+    contact.company = resolve_reference('company', data.get('company'))
+    contact.category = resolve_reference('category', data.get('category'))
+    contact.type_guest = resolve_reference('type_guest', data.get('type_guest'))
 
     contact.producer = _resolve_producer(data.get('producer'))
 
@@ -337,13 +293,4 @@ def autocomplete_events(term=''):
 
 
 def autocomplete_producers(term=''):
-    qs = CustomUser.objects.filter(groups__name='Продюсер').distinct()
-    if term:
-        qs = qs.filter(Q(last_name__icontains=term) | Q(first_name__icontains=term))
-        limit = 50
-    else:
-        limit = 500
-    return [
-        {'id': u.id, 'name': f'{u.last_name} {u.first_name}'.strip()}
-        for u in qs.order_by('last_name', 'first_name')[:limit]
-    ]
+    return get_producer_directory().autocomplete(term, limit=50 if term else 500)
@@ -0,0 +1,189 @@
+import tempfile
+from datetime import timedelta
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from event.models import Action, CompanyContact, Contact, CustomUser, ModuleInstance
+from event.sync import SYNC_RETENTION_DAYS, make_cursor
+from table.query_filter import (
+    ACTION_FILTER_FIELDS,
+    CONTACT_FILTER_FIELDS,
+    compile_where,
+    extract_where,
+    filter_queryset,
+)
+from table.totals import dataset_total
+
+
+class QueryFilterTests(TestCase):
+    """WHERE-фильтр /table/ разбирается в Q-объекты и фильтрует в БД."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = CompanyContact.objects.create(name='Ромашка')
+        cls.producer = CustomUser.objects.create_user(
+            phone='+70000000010', password='x', last_name='Петров', first_name='Пётр',
+        )
+        cls.ivanov = Contact.objects.create(
+            last_name='Иванов', first_name='Иван', nickname='ivan', company=cls.company, producer=cls.producer,
+        )
+        cls.ivanova = Contact.objects.create(last_name='Иванова', first_name='Мария')
+        cls.sidorov = Contact.objects.create(last_name='Сидоров', first_name='Семён', nickname='')
+        cls.event = ModuleInstance.objects.create(name='Форум')
+        cls.registered = Action.objects.create(contact=cls.ivanov, event=cls.event, action_type='registered')
+        cls.visited = Action.objects.create(contact=cls.sidorov, event=cls.event, action_type='visited')
+
+    def _contacts(self, query):
+        return set(filter_queryset(Contact.objects.all(), query, CONTACT_FILTER_FIELDS).values_list('pk', flat=True))
+
+    def _actions(self, query):
+        return set(filter_queryset(Action.objects.all(), query, ACTION_FILTER_FIELDS).values_list('pk', flat=True))
+
+    def test_extract_where(self):
+        self.assertEqual(extract_where("SELECT * WHERE id = 1 ORDER BY id LIMIT 5"), 'id = 1')
+        self.assertEqual(extract_where("last_name = 'x'"), "last_name = 'x'")
+        self.assertEqual(extract_where('просто текст'), '')
+        self.assertEqual(compile_where('', CONTACT_FILTER_FIELDS), (None, set()))
+
+    def test_like_patterns(self):
+        self.assertEqual(self._contacts("WHERE last_name LIKE 'Иванов%'"), {self.ivanov.pk, self.ivanova.pk})
+        self.assertEqual(self._contacts("WHERE last_name LIKE '%ова'"), {self.ivanova.pk})
+        self.assertEqual(self._contacts("WHERE last_name LIKE '%доро%'"), {self.sidorov.pk})
+        self.assertEqual(self._contacts("WHERE last_name LIKE 'Иванов_'"), {self.ivanova.pk})
+        self.assertEqual(self._contacts("WHERE last_name NOT LIKE 'Иванов%'"), {self.sidorov.pk})
+
+    def test_equality_is_case_insensitive_for_text(self):
+        self.assertEqual(self._contacts("WHERE nickname = 'IVAN'"), {self.ivanov.pk})
+        self.assertEqual(self._contacts("WHERE first_name != 'Иван'"), {self.ivanova.pk, self.sidorov.pk})
+
+    def test_null_treats_empty_text_as_null(self):
+        self.assertEqual(self._contacts('WHERE nickname IS NULL'), {self.ivanova.pk, self.sidorov.pk})
+        self.assertEqual(self._contacts('WHERE nickname IS NOT NULL'), {self.ivanov.pk})
+
+    def test_and_or_with_parentheses(self):
+        query = "WHERE (last_name LIKE 'Иванов%' AND first_name = 'Мария') OR last_name = 'Сидоров'"
+        self.assertEqual(self._contacts(query), {self.ivanova.pk, self.sidorov.pk})
+
+    def test_number_and_related_fields(self):
+        self.assertEqual(self._contacts(f'WHERE id >= {self.ivanova.pk}'), {self.ivanova.pk, self.sidorov.pk})
+        self.assertEqual(self._contacts("WHERE company = 'Ромашка'"), {self.ivanov.pk})
+
+    def test_status_label_and_computed_producer(self):
+        self.assertEqual(self._actions("WHERE action_type = 'visited'"), {self.visited.pk})
+        self.assertEqual(self._actions("WHERE action_type = 'Зачекинен'"), {self.visited.pk})
+        self.assertEqual(self._actions("WHERE producer LIKE 'Петров%'"), {self.registered.pk})
+
+    def test_errors(self):
+        for query in ('WHERE unknown = 1', 'WHERE id = abc', 'WHERE update_date > 31/12', 'просто текст'):
+            with self.subTest(query=query), self.assertRaises(ValueError):
+                compile_where(query, ACTION_FILTER_FIELDS)
+
+
+class DatasetTotalTests(TestCase):
+    """Итоги кэшируются только в общем кэше; изменение данных сбрасывает закэшированный итог."""
+
+    def setUp(self):
+        Contact.objects.create(last_name='Иванов', first_name='Иван')
+
+    def test_process_local_cache_counts_every_time(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(dataset_total('contacts', Contact.objects.all()), (1, False))
+        with self.assertNumQueries(1):
+            dataset_total('contacts', Contact.objects.all())
+
+    def test_shared_cache(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location,
+        }}):
+            caches['default'].clear()
+            with self.assertNumQueries(1):
+                self.assertEqual(dataset_total('contacts', Contact.objects.all()), (1, False))
+            with self.assertNumQueries(0):
+                dataset_total('contacts', Contact.objects.all())
+            Contact.objects.create(last_name='Петров', first_name='Пётр')
+            self.assertEqual(dataset_total('contacts', Contact.objects.all()), (2, False))
+
+
+class DeltaSyncTests(TestCase):
+    """?since= возвращает только изменённые после курсора строки и id удалённых."""
+
+    def setUp(self):
+        self.client.force_login(CustomUser.objects.create_superuser(phone='+70000000001', password='x'))
+        self.event = ModuleInstance.objects.create(name='Форум')
+        self.contacts = [
+            Contact.objects.create(last_name=last_name, first_name='Иван')
+            for last_name in ('Иванов', 'Петров', 'Сидоров')
+        ]
+        self.actions = [
+            Action.objects.create(contact=contact, event=self.event, action_type='registered')
+            for contact in self.contacts
+        ]
+        # Всё создано час назад, курсор — полчаса назад
+        hour_ago = timezone.now() - timedelta(hours=1)
+        Contact.objects.update(updated_at=hour_ago)
+        Action.objects.update(update_date=hour_ago)
+        self.cursor = make_cursor(timezone.now() - timedelta(minutes=30))
+
+    def _delta(self, dataset, **params):
+        response = self.client.get(f'/table/api/{dataset}/', {'since': self.cursor, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_unchanged_table_returns_nothing(self):
+        data = self._delta('actions')
+        self.assertEqual((data['data'], data['deleted']), ([], []))
+        self.assertTrue(data['cursor'])
+
+    def test_changed_and_deleted_rows(self):
+        first, second, third = self.actions
+        first.action_type = 'visited'
+        first.save()
+        # Смена ФИО человека видна в строке его регистрации
+        self.contacts[1].first_name = 'Пётр'
+        self.contacts[1].save()
+        third_pk = third.pk
+        third.delete()
+
+        data = self._delta('actions')
+        self.assertEqual([row['id'] for row in data['data']], [first.pk, second.pk])
+        self.assertEqual(data['data'][1]['first_name'], 'Пётр')
+        self.assertEqual(data['deleted'], [third_pk])
+
+        data = self._delta('contacts')
+        self.assertEqual([row['id'] for row in data['data']], [self.contacts[1].pk])
+        self.assertEqual(data['deleted'], [])
+
+    def test_rows_leaving_the_filter_are_deleted(self):
+        first = self.actions[0]
+        first.action_type = 'cancelled'
+        first.save()
+        data = self._delta('actions', where="WHERE action_type = 'registered'")
+        self.assertEqual(data['data'], [])
+        self.assertEqual(data['deleted'], [first.pk])
+
+    def test_guest_table_gets_only_its_event_deletions(self):
+        other = ModuleInstance.objects.create(name='Выставка')
+        elsewhere = Action.objects.create(contact=self.contacts[0], event=other, action_type='registered')
+        elsewhere_pk = elsewhere.pk
+        elsewhere.delete()
+        own_pk = self.actions[2].pk
+        self.actions[2].delete()
+
+        response = self.client.get(reverse('admin:event_guests_data', args=[self.event.pk]), {'since': self.cursor})
+        self.assertEqual(response.json()['deleted'], [own_pk])
+        response = self.client.get(reverse('admin:event_guests_data', args=[other.pk]), {'since': self.cursor})
+        self.assertEqual(response.json()['deleted'], [elsewhere_pk])
+
+    def test_cursor_from_full_load(self):
+        response = self.client.get('/table/api/actions/', {'limit': 10})
+        self.cursor = response.json()['cursor']
+        self.assertEqual(self._delta('actions')['data'], [])
+
+    def test_expired_and_invalid_cursor(self):
+        self.cursor = make_cursor(timezone.now() - timedelta(days=SYNC_RETENTION_DAYS + 1))
+        self.assertTrue(self._delta('actions')['reset'])
+        response = self.client.get('/table/api/actions/', {'since': 'abc'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,140 @@
+"""
+Итоговое количество строк для dataset_list без COUNT(*) на каждый запрос.
+
+exact    — точный count(), закэшированный по (датасет, WHERE). Ключ содержит версии
+           всех моделей, от которых зависит результат; версия увеличивается сигналами
+           post_save/post_delete, так что после изменения данных счётчик пересчитывается.
+           Кэшируется только в общем кэше (event/caching.py): с кэшем процесса версию,
+           увеличенную одним воркером, остальные не увидят — count() выполняется каждый раз.
+estimate — для запроса без фильтра берётся оценка планировщика PostgreSQL
+           (pg_class.reltuples); на других БД и при фильтре — exact.
+
+Режим по умолчанию задаётся TABLE_TOTALS_MODE, клиент может передать ?total=exact|estimate.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models.signals import post_delete, post_save
+
+from event.caching import shared_cache_configured
+from event.models import (
+    Action,
+    CategoryContact,
+    CompanyContact,
+    Contact,
+    CustomUser,
+    ModuleInstance,
+    TypeGuestContact,
+)
+from event.signals import models_bulk_changed
+
+TOTALS_MODES = ('exact', 'estimate')
+TOTALS_CACHE_TIMEOUT = 300
+_VERSION_KEY = 'table:totals:version:{}'
+_COUNT_KEY = 'table:totals:{}:{}:{}'
+
+_REFERENCES = (CompanyContact, CategoryContact, TypeGuestContact, CustomUser)
+
+# От каких моделей зависит отфильтрованный count() датасета (WHERE может идти по JOIN)
+DATASET_DEPENDENCIES = {
+    'actions': (Action, Contact, ModuleInstance) + _REFERENCES,
+    'contacts': (Contact,) + _REFERENCES,
+    'events': (ModuleInstance,),
+    'companies': (CompanyContact,),
+    'categories': (CategoryContact,),
+    'type_guests': (TypeGuestContact,),
+}
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def bump_totals_version(*models):
+    """
+    Сбрасывает закэшированные итоги, зависящие от моделей.
+    Вызывается сигналами post_save/post_delete и event.signals.models_bulk_changed,
+    который отправляют массовые операции (bulk_create, update).
+    """
+    for model in models:
+        key = _VERSION_KEY.format(_label(model))
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def _versions(models):
+    keys = [_VERSION_KEY.format(_label(model)) for model in models]
+    values = cache.get_many(keys)
+    return '.'.join(str(values.get(key, 0)) for key in keys)
+
+
+def _estimate(model):
+    """Оценка числа строк из статистики PostgreSQL; None, если недоступна."""
+    connection = connections[model.objects.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    # -1 — таблица ещё ни разу не анализировалась
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def resolve_mode(request):
+    mode = request.GET.get('total') or getattr(settings, 'TABLE_TOTALS_MODE', 'exact')
+    return mode if mode in TOTALS_MODES else 'exact'
+
+
+def dataset_total(dataset, qs, where='', mode='exact'):
+    """
+    Возвращает (total, estimated). qs — уже отфильтрованный queryset датасета,
+    where — текст фильтра (часть ключа кэша).
+    """
+    where = (where or '').strip()
+    if mode == 'estimate' and not where:
+        estimate = _estimate(qs.model)
+        if estimate is not None:
+            return estimate, True
+
+    if not shared_cache_configured():
+        return qs.count(), False
+
+    models = DATASET_DEPENDENCIES.get(dataset, (qs.model,))
+    if not where:
+        models = (qs.model,)
+    digest = hashlib.md5(where.encode('utf-8')).hexdigest()
+    key = _COUNT_KEY.format(dataset, digest, _versions(models))
+    total = cache.get(key)
+    if total is None:
+        total = qs.count()
+        cache.set(key, total, TOTALS_CACHE_TIMEOUT)
+    return total, False
+
+
+def _on_change(sender, **kwargs):
+    bump_totals_version(sender)
+
+
+def _on_bulk_change(sender, **kwargs):
+    if sender in _TRACKED_MODELS:
+        bump_totals_version(sender)
+
+
+_TRACKED_MODELS = {model for models in DATASET_DEPENDENCIES.values() for model in models}
+
+
+def connect_signals():
+    models_bulk_changed.connect(_on_bulk_change, dispatch_uid='table_totals_bulk')
+    for model in _TRACKED_MODELS:
+        uid = f'table_totals_{_label(model)}'
+        post_save.connect(_on_change, sender=model, dispatch_uid=uid + '_save')
+        post_delete.connect(_on_change, sender=model, dispatch_uid=uid + '_delete')
@@ -7,6 +7,7 @@ app_name = 'table'
 urlpatterns = [
     path('api/actions/export/', api.export_actions, name='api_actions_export'),
     path('api/contacts/export/', api.export_contacts, name='api_contacts_export'),
+    path('api/<slug:dataset>/export/jobs/', api.export_job_create, name='api_export_job_create'),
     path('api/autocomplete/<slug:field>/', api.autocomplete, name='api_autocomplete'),
     path('api/<slug:dataset>/<int:pk>/', api.dataset_detail, name='api_detail'),
     path('api/<slug:dataset>/save/', api.dataset_save, name='api_save'),
@@ -53,6 +53,13 @@ def _filter_hint(example_where, columns):
     }
 
 
+def _export_job_url(dataset):
+    # Фоновая выгрузка включается, только если запущен run_export_worker
+    if not getattr(settings, 'EXPORT_JOBS_ENABLED', False):
+        return None
+    return reverse('table:api_export_job_create', args=[dataset])
+
+
 def _grid_configs():
     status_values = {key: label for key, label in STATUS_MODEL}
     actions_columns = [
@@ -90,11 +97,13 @@ def _grid_configs():
             'columns': actions_columns,
             **_filter_hint("last_name LIKE '%Иванов%' AND action_type = 'registered'", actions_columns),
             'exportUrl': '/table/api/actions/export/',
+            'exportJobUrl': _export_job_url('actions'),
         },
         'contacts': {
             'columns': contacts_columns,
             **_filter_hint("last_name LIKE '%Иванов%' AND company LIKE '%Яндекс%'", contacts_columns),
             'exportUrl': '/table/api/contacts/export/',
+            'exportJobUrl': _export_job_url('contacts'),
         },
         'events': {
             'columns': [